@@ -13,41 +13,8 @@ from bson.objectid import ObjectId
 
 import libs.networkAnalysis as na
 import libs.pandasLib as pl
-from libs.mongoLib import getContentDocsPerPlatform, getAllDocs, getMinMaxDay
-
-
-def getGraphRequirments(collectionEnt, collectionLoc, collectionCont, platforms, timeLimits=None):
-    # Convert to list due to multiple use
-    contentList = list(getContentDocsPerPlatform(collectionCont, platforms))
-    entitiesList = list(getAllDocs(collectionEnt))
-    locationsList = list(getAllDocs(collectionLoc))
-
-    minDay, maxDay = getMinMaxDay(collectionCont)
-    temporalPeriod = [minDay + timedelta(days=x) for x in range((maxDay - minDay).days + 1)]
-
-    if timeLimits is not None:
-        logging.info(f'Limiting time from {timeLimits[0]} to {timeLimits[1]}')
-        temporalPeriod = [d for d in temporalPeriod if d.year >= timeLimits[0] and d.year <= timeLimits[1]]
-
-        droppedTimestamps, contentToDrop = 0, []
-        for it, c in enumerate(contentList):
-            timestampsToKeep = [t for t in c['timestamp'] if t.year >= timeLimits[0] and t.year <= timeLimits[1]]
-            droppedTimestamps = len(c['timestamp']) - len(timestampsToKeep)
-            if len(timestampsToKeep) == 0:
-                contentToDrop.append(it)
-            else:
-                c['timestamp'] = timestampsToKeep
-
-        contentList = [c for it, c in enumerate(contentList) if it not in contentToDrop]
-        logging.info(f'Dropped {droppedTimestamps} content timestamps (outside of temporal range) - '
-                     f'resulting in deleting {len(contentToDrop)} pieces of content entirely.')
-
-    return {
-        'contentList': contentList,
-        'entitiesList': entitiesList,
-        'locationsList': locationsList,
-        'temporalPeriod': temporalPeriod,
-    }
+from libs.compactGraph import saveGraph, loadGraph, graphPath
+from libs.dataContext import getDataContext
 
 
 def createGraphNodes(G, nodesPerClass):
@@ -170,20 +137,17 @@ if __name__ == '__main__':
         if create is True:
             logging.info(f'Creating graph from nothing')
 
-            data = getGraphRequirments(collectionEnt, collectionLoc, collectionCont, platforms, timeLimits=(minYear, maxYear))
+            # Frames shared with the other scripts - only read from the DB when it changed
+            data = getDataContext(db, join(baseDir, 'dataContext'), platforms, timeLimits=(minYear, maxYear)).getData()
             nodesPerClass = {
                 'time': data['temporalPeriod'],
-                'content': [x['_id'] for x in data['contentList']],
-                'tag': [x['_id'] for x in data['entitiesList']],
-                'spatial': [x['_id'] for x in data['locationsList']],
+                'content': data['contentDf'].index.tolist(),
+                'tag': data['entityDf'].index.tolist(),
+                'spatial': data['locationDf'].index.tolist(),
             }
             logging.info(f'Data acquired, creating graph (temporal period: {data["temporalPeriod"][0]} -> {data["temporalPeriod"][-1]})')
 
-            # Transform lists to dataframe for faster operations
-            data['contentDf'] = pd.DataFrame(data['contentList']).set_index('_id')
-            # data['contentDf'].timestamp = data['contentDf'].timestamp.dt.date
             data['contentDf'].timestamp = data['contentDf'].timestamp.apply(lambda x: [d.date() for d in x])
-            data['locationDf'] = pd.DataFrame(data['locationsList']).set_index('_id')
 
             # Creat the graph
             G = nx.Graph()
@@ -207,14 +171,14 @@ if __name__ == '__main__':
             if loadFromOS is True:
                 logging.info(f'Loading graph from OS')
                 # Load graph from OS
-                G = nx.read_gpickle(join(baseDir, f'graph.gpickle'))
+                G = loadGraph(graphPath(baseDir)).toNetworkx()
 
         if saveToMongo is True:
             pass    # TODO
 
         if saveToOS is True:
             logging.info(f'Saved to OS')
-            nx.write_gpickle(G, join(baseDir, f'graph.gpickle'))
+            saveGraph(G, graphPath(baseDir))
 
         if saveAsGraphML is True:
             # Make it viable for Neo4j import
@@ -20,27 +20,24 @@ import libs.networkAnalysis as na
 from libs.mongoLib import updateContentDocs
 import libs.visualization as vz
 from libs.osLib import loadYaml
+from libs.compactGraph import loadGraph, graphPath, NetworkxView, getNodeAttributes
 
-if __name__ == '__main__':
-
-    root = logging.getLogger()
-    root.setLevel(logging.DEBUG)
-
-    # Load config
-    configDir = '../../configs/'
-    config = loadYaml(join(configDir, 'main.yaml'))
-
-    try:
-        G = nx.read_gpickle(join(config['dataDir'], f'graph.gpickle'))
 
+def plotActivity(G, plotDir):
+    '''
+    Plots the activity per day - per platform, per content type and per platform/content type combination
+    :param G: NetworkxView of the day graph
+    :param plotDir: directory where the plots are saved
+    '''
+    with plt.rc_context():   # sns.set changes the global style - restore it for whatever is plotted next
         # Identify temporal period in graph
         timeNodes = [x for x, dt in G.nodes(data=True) if dt['nodeClass'] == 'time']
         timeNodes = sorted(timeNodes)
         print(timeNodes[0], ' ---> ', timeNodes[-1])
 
         # Identify unique attribute types
-        uniquePlatforms = list(set(nx.get_node_attributes(G, "platform").values()))
-        uniqueContentType = list(set(nx.get_node_attributes(G, "contentType").values()))
+        uniquePlatforms = list(set(getNodeAttributes(G, "platform").values()))
+        uniqueContentType = list(set(getNodeAttributes(G, "contentType").values()))
 
         # Calculate platform/content type frequency per day
         frequencyDf = pd.Series(timeNodes).to_frame(name='Day')
@@ -90,7 +87,7 @@ if __name__ == '__main__':
         # Make plot
         g = sns.FacetGrid(plotDf, col='Platform', col_wrap=3, height=6, margin_titles=True, xlim=(timeNodes[0], timeNodes[-1]))
         g.map(sns.scatterplot, "Day", "Count", alpha=.6)      # order=['Facebook', 'Google Search', 'YouTube', 'Reddit', 'Twitter']
-        plt.savefig(join(config['plotDir'], f'platformDistOverTime.png'), dpi=200)
+        plt.savefig(join(plotDir, f'platformDistOverTime.png'), dpi=200)
         plt.close()
 
         # Prepare data for content type plot
@@ -111,7 +108,7 @@ if __name__ == '__main__':
         # Make plot
         g = sns.FacetGrid(plotDf, col='Content Type', height=HEIGHT, aspect=ASPECT, margin_titles=True, xlim=(timeNodes[0], timeNodes[-1]), col_wrap=3)
         g.map(sns.scatterplot, "Day", "Count", alpha=.6)
-        plt.savefig(join(config['plotDir'], f'ContentDistOverTime.png'), dpi=200)
+        plt.savefig(join(plotDir, f'ContentDistOverTime.png'), dpi=200)
         plt.close()
 
         # Make plot for platform/content type
@@ -123,15 +120,29 @@ if __name__ == '__main__':
         g = sns.FacetGrid(combinedFrequencyDf, col='Content Type', hue='Platform', height=HEIGHT, aspect=ASPECT, xlim=(timeNodes[0], timeNodes[-1]), col_wrap=3)
         g.map(sns.scatterplot, "Day", "Count", alpha=.6)
         g.add_legend()
-        plt.savefig(join(config['plotDir'], f'ContentTypePerPlatform.png'), dpi=200)
+        plt.savefig(join(plotDir, f'ContentTypePerPlatform.png'), dpi=200)
         plt.close()
 
         g = sns.FacetGrid(combinedFrequencyDf, col='Platform', hue='Content Type', height=HEIGHT, aspect=ASPECT, xlim=(timeNodes[0], timeNodes[-1]), col_wrap=3)
         g.map(sns.scatterplot, "Day", "Count", alpha=.6)
         g.add_legend()
-        plt.savefig(join(config['plotDir'], f'PlatformPerContentType.png'), dpi=200)
+        plt.savefig(join(plotDir, f'PlatformPerContentType.png'), dpi=200)
         plt.close()
 
 
+if __name__ == '__main__':
+
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG)
+
+    # Load config
+    configDir = '../../configs/'
+    config = loadYaml(join(configDir, 'main.yaml'))
+
+    try:
+        G = NetworkxView(loadGraph(graphPath(config['dataDir'])))
+
+        plotActivity(G, config['plotDir'])
+
     except Exception as ex:
         print(traceback.format_exc())
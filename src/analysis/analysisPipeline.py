@@ -4,9 +4,14 @@ sys.path.append(os.path.join(os.getcwd(), '..'))  # Add src/ dir to import path
 import traceback
 import logging
 from os.path import join
-import subprocess
 
 from libs.osLib import loadYaml
+from libs.compactGraph import loadGraph, graphPath, NetworkxView
+from libs.pipelineLib import Pipeline, Step
+from libs.artifactCache import ArtifactCache, fileHash
+from activityPlots import plotActivity
+from classDistributionPlots import plotClassDistribution
+from centralityPlots import computeCentrality, plotCentrality, plotDegreeDist, periodFileName
 
 if __name__ == '__main__':
     # Set up logger
@@ -17,10 +22,49 @@ if __name__ == '__main__':
     configDir = '../../configs/'
     config = loadYaml(join(configDir, 'main.yaml'))
 
-    for script in config['analysisPipeline']:
-        try:
-            logging.info(f'>>>>>>>>>>>>>>>>>> CURRENTLY RUNNING {script} <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
-            subprocess.run(f'py {join(os.getcwd(), script)}')
+    # Rerun every step, even the ones whose inputs did not change
+    force = False
+    maxWorkers = 4
 
-        except Exception as ex:
-            print(traceback.format_exc())
+    PERIOD = 'month'    # Graph used for the centrality
+    measurements = ['degree', 'betweennessParallel']
+
+    plotDir, centralityDir = config['plotDir'], config['centralityDir']
+    dayGraph, periodGraph = graphPath(config['dataDir']), graphPath(config['dataDir'], PERIOD)
+
+    def centralityStep(G):
+        # Reused when the step is forced to run but the graph didn't change
+        df = ArtifactCache(join(centralityDir, 'cache')).get('centrality',
+                                                             lambda: computeCentrality(G, measurements, centralityDir),
+                                                             params={'period': PERIOD, 'measurements': measurements},
+                                                             inputs=[fileHash(periodGraph)])
+        df.to_csv(join(centralityDir, periodFileName('centralityDf.csv', PERIOD)))
+        return df
+
+    def centralityPlotsStep(G, centralityDf):
+        plotDegreeDist(G, centralityDir, PERIOD)
+        plotCentrality(centralityDf, measurements, centralityDir, PERIOD)
+
+    # Graphs are loaded once and shared in memory - pyplot is not thread safe, so its steps never run together
+    pipeline = Pipeline([
+        Step('loadGraph', lambda: NetworkxView(loadGraph(dayGraph)), outputs=['G'], sources=[dayGraph]),
+        Step('loadPeriodGraph', lambda: loadGraph(periodGraph).toNetworkx(), outputs=['periodG'], sources=[periodGraph]),
+        Step('activityPlots', lambda G: plotActivity(G, plotDir), inputs=['G'], sources=['activityPlots.py'],
+             targets=[join(plotDir, f) for f in ['platformDistOverTime.png', 'ContentDistOverTime.png',
+                                                 'ContentTypePerPlatform.png', 'PlatformPerContentType.png']],
+             resources=['pyplot']),
+        Step('classDistributionPlots', lambda G: plotClassDistribution(G, plotDir, autoOpen=False), inputs=['G'],
+             sources=['classDistributionPlots.py'], targets=[join(plotDir, 'treemap-nodes.html')]),
+        Step('centrality', centralityStep, inputs=['periodG'], outputs=['centralityDf'], sources=['centralityPlots.py'],
+             targets=[join(centralityDir, periodFileName('centralityDf.csv', PERIOD))]),
+        Step('centralityPlots', centralityPlotsStep, inputs=['periodG', 'centralityDf'], sources=['centralityPlots.py'],
+             targets=[join(centralityDir, periodFileName('centralityBoxPlot.png', PERIOD))], resources=['pyplot']),
+    ], statePath=join(config['dataDir'], 'pipelineState', 'analysisPipeline.json'), maxWorkers=maxWorkers)
+
+    try:
+        # Steps are named after the scripts they replace
+        steps = [os.path.splitext(step)[0] for step in config['analysisPipeline']]
+        pipeline.select(steps).run(force=force)
+
+    except Exception as ex:
+        print(traceback.format_exc())
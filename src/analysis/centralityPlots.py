@@ -3,7 +3,7 @@ import sys
 sys.path.append(getcwd() + '/..')   # Add src/ dir to import path
 import traceback
 import logging
-from os.path import join
+from os.path import join, splitext
 from datetime import date, timedelta, datetime
 
 import networkx as nx
@@ -15,6 +15,94 @@ import matplotlib.pyplot as plt
 import libs.networkAnalysis as na
 import libs.visualization as vz
 from libs.osLib import loadYaml
+from libs.compactGraph import loadGraph, graphPath
+from libs.artifactCache import ArtifactCache, fileHash
+
+
+def periodFileName(fileName, period):
+    stem, extension = splitext(fileName)
+    return fileName if period == 'day' else f'{stem}-{period}{extension}'
+
+
+def computeCentrality(G, measurements, centralityDir):
+    '''
+    :param G: nx.Graph
+    :param measurements: list of centrality measures, see na.calculateCentrality
+    :param centralityDir: directory where the partial results are saved
+    :return: pd.DataFrame with the node class, platform and each centrality measure per node
+    '''
+    # Identify node classes
+    df = pd.DataFrame.from_dict({n: G.nodes[n]['nodeClass'] for n in G.nodes()}, orient='index', columns=['nodeClass'])
+
+    # Identify platforms for content nodes
+    auxDf = pd.DataFrame.from_dict({n: G.nodes[n]['platform'] if 'platform' in G.nodes[n].keys() else None
+                                 for n in G.nodes()}, orient='index', columns=['platform'])
+    df = pd.merge(df, auxDf, left_index=True, right_index=True)
+
+    # Calculate centrality values
+    return na.calculateCentrality(G, df, measurements, saveAsWeGo=True, saveDir=centralityDir)
+
+
+def plotDegreeDist(G, centralityDir, period='day'):
+    # Power law plot
+    degrees = [degree for id, degree in G.degree()]
+    vz.degreeDistWithPowerLaw(degrees, join(centralityDir, f'degreeDist-{period}'))
+
+
+def plotCentrality(df, measurements, centralityDir, period='day'):
+    '''
+    Box plots of each centrality measure per node class
+    :param df: pd.DataFrame from computeCentrality
+    '''
+    nodeClasses = df.nodeClass.unique().tolist()
+
+    # Centrality distributions per class
+    # Inspired by: https://stackoverflow.com/questions/42004381/box-plot-of-a-many-pandas-dataframes
+    plotDf = None
+    for m in measurements:
+        auxDf = df[['nodeClass', 'platform', m]].rename(columns={m: 'centrality'})
+        auxDf['measure'] = m
+        plotDf = auxDf if plotDf is None else pd.concat([plotDf, auxDf], ignore_index=False)
+
+    # Change names for prettier plot
+    measurementsMapping = {
+        'degree': 'Degree Centrality',
+        'betweennessParallel': 'Betweeness Centrality'
+    }
+    classMapping = {
+        'time': 'Time',
+        'content': 'Content',
+        'tag': 'Tag',
+        'location': 'Location',
+        'spatial': 'Location'
+    }
+    plotDf['measure'] = plotDf['measure'].apply(lambda x: measurementsMapping[x])
+    plotDf['nodeClass'] = plotDf['nodeClass'].apply(lambda x: classMapping[x])
+    plotDf.rename({
+        'measure': 'Centrality Measure',
+        'centrality': 'Value',
+        'nodeClass': 'Node Class',
+    }, inplace=True, axis=1)
+
+    # Make plot
+    with plt.rc_context():   # sns.set changes the global style - restore it for whatever is plotted next
+        sns.set(font_scale=2)
+        fig, ax = plt.subplots(figsize=(15, 15))
+        g = sns.boxplot(ax=ax, data=plotDf, x='Node Class', y='Value', hue='Centrality Measure', palette="Set2",
+                        showfliers=True, showmeans=True)
+        g.set_yscale('log')
+
+        # Save it
+        plt.savefig(join(centralityDir, periodFileName('centralityBoxPlot.png', period)), dpi=100)
+        plt.close()
+
+    # Another with matplotlib
+    logAxis = False
+    for m in measurements:
+        data = [df[df.nodeClass == c][m].tolist() for c in nodeClasses]
+        vz.drawBoxPlots(data, nodeClasses, logAxis, join(centralityDir, periodFileName(f'plt-{m}.png', period)),
+                        showfliers=False, meanline=True)
+
 
 if __name__ == '__main__':
 
@@ -25,48 +113,27 @@ if __name__ == '__main__':
     configDir = '../../configs/'
     config = loadYaml(join(configDir, 'main.yaml'))
 
-    calculateCentrality, loadFromOS = False, True
     saveCentralityToOS, saveCentralityToDB = False, False
 
     PERIOD = 'month'
     measurements = ['degree', 'betweennessParallel']    # 'betweennessParallel' 'closeness', 'katz'
 
     try:
-        if calculateCentrality is True:
-            # Load graph from OS
-            fileName = f'graph.gpickle' if PERIOD == 'day' else f'graph-{PERIOD}.gpickle'
-            G = nx.read_gpickle(join(config['dataDir'], ))
-            print(PERIOD)
-            # Power law plot
-            degrees = [degree for id, degree in G.degree()]
-            vz.degreeDistWithPowerLaw(degrees, join(config['centralityDir'], f'degreeDist-{PERIOD}'))
-
-            # Identify node classes
-            df = pd.DataFrame.from_dict({n: G.nodes[n]['nodeClass'] for n in G.nodes()}, orient='index', columns=['nodeClass'])
-            nodeClasses = df.nodeClass.unique().tolist()
-
-            # Identify platforms for content nodes
-            auxDf = pd.DataFrame.from_dict({n: G.nodes[n]['platform'] if 'platform' in G.nodes[n].keys() else None
-                                         for n in G.nodes()}, orient='index', columns=['platform'])
-            platforms = auxDf.platform.unique().tolist()
-            platforms.remove(None)
-            df = pd.merge(df, auxDf, left_index=True, right_index=True)
-
-            # Calculate centrality values
-            df = na.calculateCentrality(G, df, measurements, saveAsWeGo=True, saveDir=config['centralityDir'])
-        else:
-            if loadFromOS is True:
-                fileName = f'centralityDf.csv' if PERIOD == 'day' else f'centralityDf-{PERIOD}.csv'
-                df = pd.read_csv(join(config['centralityDir'], fileName))
-                nodeClasses = df.nodeClass.unique().tolist()
-            else:
-                raise Exception('Initial conditions conflicting - where should i get the graph from?')
+        # Load graph from OS
+        G = loadGraph(graphPath(config['dataDir'], PERIOD)).toNetworkx()
+        print(PERIOD)
+        plotDegreeDist(G, config['centralityDir'], PERIOD)
+
+        # Centrality is only calculated again when the graph or the measurements change
+        cache = ArtifactCache(join(config['centralityDir'], 'cache'))
+        df = cache.get('centrality', lambda: computeCentrality(G, measurements, config['centralityDir']),
+                       params={'period': PERIOD, 'measurements': measurements},
+                       inputs=[fileHash(graphPath(config['dataDir'], PERIOD))])
 
         # Save data if needed
         if saveCentralityToOS:
             logging.info('Saving dataframe to OS')
-            fileName = f'centralityDf.csv' if PERIOD == 'day' else f'centralityDf-{PERIOD}.csv'
-            df.to_csv(join(config['centralityDir'], fileName))
+            df.to_csv(join(config['centralityDir'], periodFileName('centralityDf.csv', PERIOD)))
 
         if saveCentralityToDB:
             # TODO - this was not tested
@@ -80,53 +147,7 @@ if __name__ == '__main__':
                 updateContentDocs(collectionCont, f'centrality-{m}', centralityPerNode)
 
         # Plot data
-
-        # Centrality distributions per class
-        # Inspired by: https://stackoverflow.com/questions/42004381/box-plot-of-a-many-pandas-dataframes
-        plotDf = None
-        for m in measurements:
-            auxDf = df[['nodeClass', 'platform', m]].rename(columns={m: 'centrality'})
-            auxDf['measure'] = m
-            plotDf = auxDf if plotDf is None else pd.concat([plotDf, auxDf], ignore_index=False)
-
-        # Change names for prettier plot
-        measurementsMapping = {
-            'degree': 'Degree Centrality',
-            'betweennessParallel': 'Betweeness Centrality'
-        }
-        classMapping = {
-            'time': 'Time',
-            'content': 'Content',
-            'tag': 'Tag',
-            'location': 'Location',
-            'spatial': 'Location'
-        }
-        plotDf['measure'] = plotDf['measure'].apply(lambda x: measurementsMapping[x])
-        plotDf['nodeClass'] = plotDf['nodeClass'].apply(lambda x: classMapping[x])
-        plotDf.rename({
-            'measure': 'Centrality Measure',
-            'centrality': 'Value',
-            'nodeClass': 'Node Class',
-        }, inplace=True, axis=1)
-
-        # Make plot
-        sns.set(font_scale=2)
-        fig, ax = plt.subplots(figsize=(15, 15))
-        g = sns.boxplot(ax=ax, data=plotDf, x='Node Class', y='Value', hue='Centrality Measure', palette="Set2",
-                        showfliers=True, showmeans=True)
-        g.set_yscale('log')
-
-        # Save it
-        fileName = f'centralityBoxPlot.png' if PERIOD == 'day' else f'centralityBoxPlot-{PERIOD}.png'
-        plt.savefig(join(config['centralityDir'], fileName), dpi=100)
-        plt.close()
-
-        # Another with matplotlib
-        logAxis = False
-        for m in measurements:
-            data = [df[df.nodeClass == c][m].tolist() for c in nodeClasses]
-            fileName = f'plt-{m}.png' if PERIOD == 'day' else f'plt-{m}-{PERIOD}.png'
-            vz.drawBoxPlots(data, nodeClasses, logAxis, join(config['centralityDir'], fileName), showfliers=False, meanline=True)
+        plotCentrality(df, measurements, config['centralityDir'], PERIOD)
 
     except Exception as ex:
         print(traceback.format_exc())
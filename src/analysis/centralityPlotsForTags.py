@@ -16,6 +16,7 @@ from pymongo import MongoClient
 import libs.networkAnalysis as na
 import libs.visualization as vz
 from libs.osLib import loadYaml
+from libs.compactGraph import loadGraph, graphPath
 from libs.mongoLib import updateContentDocs, getFromId, getContentDocsPerPlatform
 
 if __name__ == '__main__':
@@ -36,8 +37,7 @@ if __name__ == '__main__':
     try:
         if calculateCentrality is True:
             # Load graph from OS
-            fileName = f'graph.gpickle' if PERIOD == 'day' else f'graph-{PERIOD}.gpickle'
-            G = nx.read_gpickle(join(config['dataDir'], ))
+            G = loadGraph(graphPath(config['dataDir'], PERIOD)).toNetworkx()
 
             # Power law plot
             degrees = [degree for id, degree in G.degree()]
@@ -22,6 +22,75 @@ import libs.networkAnalysis as na
 from libs.mongoLib import updateContentDocs
 import libs.visualization as vz
 from libs.osLib import loadYaml
+from libs.compactGraph import loadGraph, graphPath, NetworkxView
+
+
+def plotClassDistribution(G, plotDir, autoOpen=True):
+    '''
+    Treemap with the number of nodes per class and subclass
+    :param G: NetworkxView of the graph
+    :param plotDir: directory where the plot is saved
+    :param autoOpen: open the plot in the browser
+    '''
+    outputDf = pd.DataFrame(columns=['Class', 'Subclass', 'Count'])
+
+    # Content
+    contentSubClasses = [G.nodes[n]['contentType'] for n in G.nodes() if G.nodes[n]['nodeClass'] == 'content']
+    subClassCount = Counter(contentSubClasses)
+    auxDf = pd.DataFrame.from_dict(subClassCount, orient='index', columns=['Count'])
+    auxDf.index.rename('Subclass', inplace=True)
+    auxDf.reset_index(inplace=True)
+    auxDf['Class'] = 'Content'
+    outputDf = outputDf.append(auxDf)
+
+    # Location
+    locationSubClasses = [G.nodes[n]['locationType'] for n in G.nodes() if G.nodes[n]['nodeClass'] == 'spatial']
+    subClassCount = Counter(locationSubClasses)
+    auxDf = pd.DataFrame.from_dict(subClassCount, orient='index', columns=['Count'])
+    auxDf.index.rename('Subclass', inplace=True)
+    auxDf.reset_index(inplace=True)
+    auxDf['Class'] = 'Locations'
+    outputDf = outputDf.append(auxDf)
+
+    # Time
+    timeNodes = len([1 for n in G.nodes() if G.nodes[n]['nodeClass'] == 'time'])
+    outputDf = outputDf.append({
+        'Class': 'Time',
+        'Subclass': 'Time',
+        'Count': timeNodes,
+    }, ignore_index=True)
+
+    # Tags
+    tagNodes = len([1 for n in G.nodes() if G.nodes[n]['nodeClass'] == 'tag'])
+    outputDf = outputDf.append({
+        'Class': 'Tag',
+        'Subclass': 'Extracted Entities',
+        'Count': tagNodes,
+    }, ignore_index=True)
+
+    # Make plot
+    countTotal = outputDf['Count'].sum()
+    outputDf['percentage'] = outputDf.apply(lambda row: 100 * row['Count'] / countTotal, axis=1)
+
+    fig = px.treemap(outputDf,
+                     path=['Class', 'Subclass'],
+                     values='Count',
+                     hover_data=['percentage'],
+                     custom_data=['percentage'],
+                     color_continuous_scale ='Mint')
+
+    fig.data[0].textinfo = 'label+text+value+percent root+percent parent'
+    fig.layout.hovermode = False
+
+    fig.update_layout(
+        font=dict(
+            size=21,
+        )
+    )
+
+    # fig.layout.hovermode = False
+    plot(fig, filename=join(plotDir, f'treemap-nodes.html'), auto_open=autoOpen)
+
 
 if __name__ == '__main__':
 
@@ -34,65 +103,8 @@ if __name__ == '__main__':
     
     try:
 
-        G = nx.read_gpickle(join(config['dataDir'], f'graph.gpickle'))
-        outputDf = pd.DataFrame(columns=['Class', 'Subclass', 'Count'])
-
-        # Content
-        contentSubClasses = [G.nodes[n]['contentType'] for n in G.nodes() if G.nodes[n]['nodeClass'] == 'content']
-        subClassCount = Counter(contentSubClasses)
-        auxDf = pd.DataFrame.from_dict(subClassCount, orient='index', columns=['Count'])
-        auxDf.index.rename('Subclass', inplace=True)
-        auxDf.reset_index(inplace=True)
-        auxDf['Class'] = 'Content'
-        outputDf = outputDf.append(auxDf)
-
-        # Location
-        locationSubClasses = [G.nodes[n]['locationType'] for n in G.nodes() if G.nodes[n]['nodeClass'] == 'spatial']
-        subClassCount = Counter(locationSubClasses)
-        auxDf = pd.DataFrame.from_dict(subClassCount, orient='index', columns=['Count'])
-        auxDf.index.rename('Subclass', inplace=True)
-        auxDf.reset_index(inplace=True)
-        auxDf['Class'] = 'Locations'
-        outputDf = outputDf.append(auxDf)
-
-        # Time
-        timeNodes = len([1 for n in G.nodes() if G.nodes[n]['nodeClass'] == 'time'])
-        outputDf = outputDf.append({
-            'Class': 'Time',
-            'Subclass': 'Time',
-            'Count': timeNodes,
-        }, ignore_index=True)
-
-        # Tags
-        tagNodes = len([1 for n in G.nodes() if G.nodes[n]['nodeClass'] == 'tag'])
-        outputDf = outputDf.append({
-            'Class': 'Tag',
-            'Subclass': 'Extracted Entities',
-            'Count': tagNodes,
-        }, ignore_index=True)
-
-        # Make plot
-        countTotal = outputDf['Count'].sum()
-        outputDf['percentage'] = outputDf.apply(lambda row: 100 * row['Count'] / countTotal, axis=1)
-
-        fig = px.treemap(outputDf,
-                         path=['Class', 'Subclass'],
-                         values='Count',
-                         hover_data=['percentage'],
-                         custom_data=['percentage'],
-                         color_continuous_scale ='Mint')
-
-        fig.data[0].textinfo = 'label+text+value+percent root+percent parent'
-        fig.layout.hovermode = False
-
-        fig.update_layout(
-            font=dict(
-                size=21,
-            )
-        )
-
-        # fig.layout.hovermode = False
-        plot(fig, filename=join(config['plotDir'], f'treemap-nodes.html'))
+        G = NetworkxView(loadGraph(graphPath(config['dataDir'])))
+        plotClassDistribution(G, config['plotDir'])
 
         """
         nodeHierarchy = {
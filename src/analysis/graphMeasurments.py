@@ -13,6 +13,7 @@ import pandas as pd
 import numpy as np
 
 from libs.osLib import loadYaml
+from libs.compactGraph import loadGraph, graphPath
 from libs.networkAnalysis import *
 from libs.mongoLib import updateContentDocs, getFromId, getContentDocsPerPlatform
 
@@ -36,7 +37,7 @@ if __name__ == '__main__':
     stats = {}
 
     # Load graph from OS
-    G = nx.read_gpickle(join(config['dataDir'], f'graph{period_label}.gpickle'))
+    G = loadGraph(graphPath(config['dataDir'], period)).toNetworkx()
 
     # Get nodes with highest degrees
     from pymongo import MongoClient
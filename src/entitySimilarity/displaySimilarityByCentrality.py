@@ -19,6 +19,7 @@ from libs.mongoLib import updateContentDocs, getFromId, getContentDocsPerPlatfor
 
 import libs.visualization as vz
 import libs.osLib as ol
+from pysclump import top_k_rows
 
 
 if __name__ == '__main__':
@@ -65,8 +66,8 @@ if __name__ == '__main__':
         # Load centrality DF
         centralDf = pd.read_csv(join(centralityDir, centralityPath), index_col=0)
 
-        # Load similarity matrices (+ convert from sparse to numpy)
-        matrices = {c: [ol.loadSparce(p).toarray() for p in pathList]
+        # Load similarity matrices (kept sparse - only the selected nodes are converted to numpy)
+        matrices = {c: [ol.loadSparce(p).tocsr() for p in pathList]
                     for c, pathList in classMatricePaths.items()}
         idToIndexMapping = {c: ol.loadPickle(join(adjcDir, f'PathSim-idToIndexMapping-{c}.pickle'))
                             for c in ['T', 'G', 'L']}
@@ -91,7 +92,7 @@ if __name__ == '__main__':
                         properId = ObjectId(id) if ObjectId.is_valid(id) else datetime.datetime.strptime(id, "%Y-%m-%d").date()
                         index = idToIndexMapping[class_][properId]
 
-                        topNeighbors = simM[index].argsort()[-numNeighbors:][::-1]
+                        topNeighbors, _ = top_k_rows(simM[[index]], numNeighbors)[0]
 
                         topNeighbors = [indexToIdMapping[class_][n] for n in topNeighbors]
                         selectedNeighbors += topNeighbors
@@ -112,7 +113,7 @@ if __name__ == '__main__':
         # Get only the relevant parts for each similarity Matrices
         for class_, nodes in selectedNodes.items():
             for it in range(len(matrices[class_])):
-                matrices[class_][it] = matrices[class_][it][np.ix_(nodes, nodes)]
+                matrices[class_][it] = matrices[class_][it][nodes][:, nodes].toarray()
 
         # Plot in 2D
         for class_, nodes in selectedNodes.items():
@@ -1,4 +1,4 @@
-from os import getcwd
+from os import getcwd, cpu_count
 import sys
 sys.path.append(getcwd() + '/..')   # Add src/ dir to import path
 import traceback
@@ -13,7 +13,9 @@ from scipy import sparse
 
 from pysclump import PathSim
 from libs.networkAnalysis import adjacencyBetweenTypes
+from libs.compactGraph import loadGraph, graphPath, getNodeAttributes
 import libs.osLib as ol
+from libs.artifactCache import ArtifactCache, fileHash
 
 if __name__ == '__main__':
 
@@ -21,7 +23,10 @@ if __name__ == '__main__':
     root.setLevel(logging.DEBUG)
 
     baseDir, outputDir = '../../data', '../../data/adjacencyMatrices'
-    loadIDtoTempIndexs, loadAdjacencies = True, True
+    # Adjacency/similarity matrices are reused while the graph doesn't change - least recently used ones go past this size
+    maxCacheBytes = 20 * 2 ** 30
+    # Similarity matrices are computed by row blocks over a process pool (1 to disable)
+    numWorkers = cpu_count()
 
     classMapping = {
         'time': 'T',
@@ -37,11 +42,15 @@ if __name__ == '__main__':
     metapaths = [[classMapping[t] for t in metapath] for metapath in metapaths]
 
     try:
-        # Load graph from OS
-        G = nx.read_gpickle(join(baseDir, f'graph.gpickle'))
+        # Load graph from OS - every artifact depends on its content
+        cache = ArtifactCache(outputDir, maxBytes=maxCacheBytes)
+        # Products along sub-paths, shared between metapaths - read and written often, so they are left uncompressed
+        productCache = ArtifactCache(outputDir, maxBytes=maxCacheBytes, compressed=False)
+        graphHash = fileHash(graphPath(baseDir))
+        G = loadGraph(graphPath(baseDir))
 
         # Get node list per class type
-        classPerID = nx.get_node_attributes(G, "nodeClass")
+        classPerID = getNodeAttributes(G, "nodeClass")
         nodesPerClass = {}
         for id, class_ in classPerID.items():
             classDim = classMapping[class_]
@@ -53,40 +62,37 @@ if __name__ == '__main__':
             targetClass = metapath[0]
 
             # Get ID to Index type for specific class
-            if loadIDtoTempIndexs is True:
-                IdToIndex = ol.loadPickle(join(outputDir, f'PathSim-IdToIndexMapping-{targetClass}.pickle'))
-            else:
-                IdToIndex = {id: idx for idx, id in enumerate(nodesPerClass[targetClass])}
-                ol.savePickle(IdToIndex, join(outputDir, f'PathSim-IdToIndexMapping-{targetClass}.pickle'))
-
-            # Identify adjacency matrices necessary for specific meta-path
-            classCombinations = [(metapath[i], metapath[i + 1]) for i in range(len(metapath) - 1)]
-
-            # Get adjacency matrices
-            if loadAdjacencies is True:
-                adjacencies = {f'{classA+classB}': ol.loadSparce(join(outputDir, f'adjacency-{classA+classB}.npz'))
+            IdToIndex = cache.get('PathSim-IdToIndexMapping',
+                                  lambda: {id: idx for idx, id in enumerate(nodesPerClass[targetClass])},
+                                  params={'class': targetClass}, inputs=[graphHash])
+            ol.savePickle(IdToIndex, join(outputDir, f'PathSim-IdToIndexMapping-{targetClass}.pickle'))
+
+            def computeSimilarity():
+                # Identify adjacency matrices necessary for specific meta-path
+                classCombinations = [(metapath[i], metapath[i + 1]) for i in range(len(metapath) - 1)]
+
+                # Get adjacency matrices
+                logging.info(f'Graph has {G.numberOfNodes()} nodes')
+                adjacencies = {f'{classA+classB}': cache.get('adjacency',
+                                                             lambda: adjacencyBetweenTypes(G, nodesPerClass, classA, classB),
+                                                             params={'classes': classA + classB}, inputs=[graphHash])
                                for classA, classB in classCombinations}
-            else:
-                # Get necessary adjacency matrices
-                logging.info(f'Graph has {len(G.nodes)} nodes')
-                adjacencies = {f'{classA+classB}': adjacencyBetweenTypes(G, nodesPerClass, classA, classB)
-                               for classA, classB in classCombinations}
-                logging.info(f'Adjacency matrices calculated')
+                logging.info(f'Adjacency matrices ready')
 
-                # Save Adjacency Matrices
-                for comb, M in adjacencies.items():
-                    ol.saveSparce(M, join(outputDir, f'{comb}.npz'))
+                # Create PathSim instance - products along sub-paths shared between metapaths are persisted and reused
+                logging.info(f'Initiating PathSimInstance')
+                ps = PathSim(nodesPerClass, adjacencies, path_cache=productCache)
 
-            # Create PathSim instance.
-            logging.info(f'Initiating PathSimInstance')
-            ps = PathSim(nodesPerClass, adjacencies)
+                # Get the similarity matrix M for the metapath.
+                logging.info(f'Computing similarity Matrix')
+                return ps.compute_similarity_matrix(metapath=''.join(metapath), num_workers=numWorkers)
 
-            # Get the similarity matrix M for the metapath.
-            logging.info(f'Computing similarity Matrix')
-            similarityM = ps.compute_similarity_matrix(metapath=''.join(metapath))
+            similarityM = cache.get('PathSim-similarity', computeSimilarity, params={'metapath': ''.join(metapath)},
+                                    inputs=[graphHash])
             logging.info(f'All done')
-            ol.saveSparce(similarityM, join(outputDir, f'PathSim-similarity-{"".join(metapath)}.npz'))
 
+            # Published under a fixed name for the scripts using it (SClump, plots)
+            ol.saveSparce(similarityM, join(outputDir, f'PathSim-similarity-{"".join(metapath)}.npz'))
 
     except Exception as ex:
         print(traceback.format_exc())
\ No newline at end of file
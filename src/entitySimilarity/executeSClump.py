@@ -13,6 +13,7 @@ import numpy as np
 
 from pysclump import SClump
 import libs.osLib as ol
+from libs.artifactCache import ArtifactCache, fileHash
 
 if __name__ == '__main__':
 
@@ -20,7 +21,8 @@ if __name__ == '__main__':
     root.setLevel(logging.DEBUG)
 
     baseDir, outputDir = '../../data', '../../data/adjacencyMatrices'
-    loadNodeMappings, loadAdjacencies = True, False
+    # SClump results are reused while the similarity matrices and arguments don't change
+    maxCacheBytes = 20 * 2 ** 30
 
     previousMethod = 'PathSim'
 
@@ -60,11 +62,10 @@ if __name__ == '__main__':
         assert(len([it for it in range(1, len(metapathsToInclude)) if metapathsToInclude[it][0] != metapathsToInclude[it-1][0]]) == 0)   # Assert all metpatahs are valid between themselves
         targetClass = metapathsToInclude[0][0]
 
-        # Load similarity matrices (+ convert from sparse to numpy)
-        similarityMatrices = {
-            ''.join(metapath): ol.loadSparce(join(outputDir, f'{previousMethod}-similarity-{"".join(metapath)}.npz')).toarray()
-            for metapath in metapathsToInclude
-        }
+        # Similarity matrices the results depend on
+        similarityPaths = {''.join(metapath): join(outputDir, f'{previousMethod}-similarity-{"".join(metapath)}.npz')
+                           for metapath in metapathsToInclude}
+        cache = ArtifactCache(outputDir, maxBytes=maxCacheBytes)
 
         # Init logger
         import wandb
@@ -72,14 +73,21 @@ if __name__ == '__main__':
         wandb.config.update(args)
         outputDir = wandb.run.dir
 
-        # Create SClump instance
-        sclump = SClump(similarityMatrices, num_clusters=args.numClusters)
+        def runSClump():
+            # Load similarity matrices (+ convert from sparse to numpy)
+            similarityMatrices = {metapath: ol.loadSparce(path).toarray() for metapath, path in similarityPaths.items()}
 
-        # Run the algorithm
-        print('Running Algo')
-        labels, learnedSimMatrix, metapathWeights, finalLoss = sclump.run(verbose=False, cluster_using=args.clusterUsing,
-                                  alpha=args.alpha, beta=args.beta, gamma=args.gamma,
-                                  num_iterations=args.numIterations)
+            # Create SClump instance
+            sclump = SClump(similarityMatrices, num_clusters=args.numClusters)
+
+            # Run the algorithm
+            print('Running Algo')
+            return sclump.run(verbose=False, cluster_using=args.clusterUsing, alpha=args.alpha, beta=args.beta,
+                              gamma=args.gamma, num_iterations=args.numIterations)
+
+        labels, learnedSimMatrix, metapathWeights, finalLoss = cache.get(
+            'SClump', runSClump, params={'args': vars(args), 'metapaths': sorted(similarityPaths.keys())},
+            inputs=[fileHash(path) for path in similarityPaths.values()])
 
         # Save results
         print('Saving results')
@@ -12,6 +12,7 @@ import numpy as np
 
 from libs.osLib import savePickle
 import libs.osLib as ol
+from libs.compactGraph import loadGraph, graphPath
 
 if __name__ == '__main__':
 
@@ -23,7 +24,7 @@ if __name__ == '__main__':
 
     try:
         # Load graph from OS
-        G = nx.read_gpickle(join(baseDir, f'graph.gpickle'))
+        G = loadGraph(graphPath(baseDir)).toNetworkx()
 
         if allCombinations is True:
             simDict = nx.simrank_similarity(G, max_iterations=10)      # Calculate one by one? Once per node should take quite a while but should facilitate memory wise.
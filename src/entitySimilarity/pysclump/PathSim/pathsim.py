@@ -1,73 +1,184 @@
-from itertools import product
+import os
+import hashlib
+import tempfile
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from scipy import sparse
 import numpy as np
 
 class PathSim:
-    def __init__(self, type_lists, incidence_matrices):
+    # path_cache: where the products along (sub-)metapaths are persisted, None to keep them in memory only. Any object
+    # with fetch(name, inputs=...), returning None on a miss, and put(name, matrix, inputs=...) - e.g. an ArtifactCache,
+    # which keeps them under its size limit.
+    def __init__(self, type_lists, incidence_matrices, path_cache=None):
         self.node_types = type_lists
         self.node_type_indices = {node: index for type_list in type_lists.values() for index, node in enumerate(type_list)}
+        self.given_incidence_types = list(incidence_matrices.keys())
         self.incidence_matrices = incidence_matrices
         self.fill_incidence_matrices()
         self.similarity_matrices = {}
+        self.half_metapath_matrices = {}
+        self.similarity_keys = {}
+        self.path_matrices = {}
+        self.incidence_hashes = {}
+        self.path_cache = path_cache
     
     # Transpose for the reversed incidence type.
     def fill_incidence_matrices(self):
-        for incidence_type in self.incidence_matrices.keys():
+        for incidence_type in list(self.incidence_matrices.keys()):
             self.incidence_matrices[incidence_type[::-1]] = self.incidence_matrices[incidence_type].T
 
-    # Find similarities between node1 and node2.
+    # Find similarities between node1 and node2 - a binary search in node1's row of the similarity matrix.
     def pathsim(self, node1, node2, metapath):
-        if metapath not in self.similarity_matrices:
-            self.compute_similarity_matrix(metapath)
-        
+        similarity_matrix = self.get_similarity_matrix(metapath)
+
         try:
-            # return self.similarity_matrices[metapath][self.node_type_indices[node1]][self.node_type_indices[node2]]
-            m = self.similarity_matrices[metapath]
-            nonZeroEntries = {(i, j): m[i, j] for i, j in zip(*m.nonzero())}
-            k = (self.node_type_indices[node1], self.node_type_indices[node2])
-            return nonZeroEntries[k] if k in nonZeroEntries.keys() else 0
+            index1, index2 = self.node_type_indices[node1], self.node_type_indices[node2]
+            start, end = similarity_matrix.indptr[index1], similarity_matrix.indptr[index1 + 1]
+            position = start + np.searchsorted(similarity_matrix.indices[start:end], index2)
+            if position < end and similarity_matrix.indices[position] == index2:
+                return similarity_matrix.data[position]
+            return 0
 
-        except ValueError:
+        except (ValueError, IndexError):
             raise ValueError('Invalid node types for given metapath.')
-        
-    # Computes the similarity matrix by iterating over all pairs of nodes.
-    def compute_similarity_matrix(self, metapath):
 
-        # Compute metapath matrix.
-        metapath_matrix = self.compute_metapath_matrix(metapath)
-        nonZeroEntries = {(i, j): metapath_matrix[i, j] for i, j in zip(*metapath_matrix.nonzero())}
+    # Similarities of many (node1, node2) pairs as a numpy array, searched in the sorted keys
+    # row * num_nodes + col of the nonzeros - built once per metapath.
+    def pathsim_many(self, pairs, metapath):
+        similarity_matrix = self.get_similarity_matrix(metapath)
+        if metapath not in self.similarity_keys:
+            num_nodes = similarity_matrix.shape[1]
+            rows = np.repeat(np.arange(similarity_matrix.shape[0], dtype=np.int64), np.diff(similarity_matrix.indptr))
+            self.similarity_keys[metapath] = rows * num_nodes + similarity_matrix.indices
+
+        keys = self.similarity_keys[metapath]
+        pairs = list(pairs)
+        if len(pairs) == 0 or len(keys) == 0:
+            return np.zeros(len(pairs))
+
+        indices = np.array([(self.node_type_indices[node1], self.node_type_indices[node2]) for node1, node2 in pairs],
+                           dtype=np.int64)
+        if (indices >= similarity_matrix.shape[0]).any():
+            raise ValueError('Invalid node types for given metapath.')
+
+        pair_keys = indices[:, 0] * similarity_matrix.shape[1] + indices[:, 1]
+        positions = np.minimum(np.searchsorted(keys, pair_keys), len(keys) - 1)
+        return np.where(keys[positions] == pair_keys, similarity_matrix.data[positions], 0).astype(np.float64)
+
+    # Similarity matrix of the metapath in canonical CSR (sorted indices, no duplicates), computed on first use.
+    def get_similarity_matrix(self, metapath):
+        if metapath not in self.similarity_matrices:
+            self.compute_similarity_matrix(metapath)
+
+        similarity_matrix = self.similarity_matrices[metapath]
+        if not isinstance(similarity_matrix, sparse.csr_matrix) or not similarity_matrix.has_canonical_format:
+            similarity_matrix = sparse.csr_matrix(similarity_matrix)
+            similarity_matrix.sum_duplicates()
+            self.similarity_matrices[metapath] = similarity_matrix
+            self.similarity_keys.pop(metapath, None)
+        return similarity_matrix
+
+    # The k nodes most similar to node, as a list of (node, similarity), highest first.
+    def top_k(self, node, metapath, k=10, include_self=False):
+        return self.top_k_many([node], metapath, k, include_self)[node]
+
+    # Top k for many nodes, computing one block of rows of the similarity matrix at a time, so only
+    # block_size rows are held besides the k results of each node.
+    def top_k_many(self, nodes, metapath, k=10, include_self=False, block_size=1024):
+        type_list = self.node_types[metapath[0]]
+        indices = np.array([self.node_type_indices[node] for node in nodes], dtype=np.int64)
+
+        results = {}
+        for start in range(0, len(indices), block_size):
+            block = indices[start:start + block_size]
+            similarities = self.compute_similarity_rows(metapath, block)
+            top = top_k_rows(similarities, k, exclude=None if include_self else block)
+            for node, (cols, values) in zip(nodes[start:start + block_size], top):
+                results[node] = [(type_list[col], value) for col, value in zip(cols.tolist(), values.tolist())]
 
-        # Fill in similarity matrix entries now.
+        return results
+
+    # Rows of the similarity matrix as a CSR matrix - taken from the full matrix if it was already computed,
+    # otherwise from (C[rows] C^T) normalized by the diagonal, where C is the half metapath matrix.
+    def compute_similarity_rows(self, metapath, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        if metapath in self.similarity_matrices:
+            return self.similarity_matrices[metapath][rows]
+
+        half_matrix, half_matrix_t, diagonal = self.compute_half_metapath_matrix(metapath)
+        block = sparse.coo_matrix(half_matrix[rows].dot(half_matrix_t))
+
+        block_rows, cols, num_paths_12 = block.row, block.col, block.data
+        denominators = diagonal[rows[block_rows]] + diagonal[cols]
+        keep = (num_paths_12 != 0) & (denominators > 0)
+        data = 2 * num_paths_12[keep] / denominators[keep]
+
+        return sparse.csr_matrix((data, (block_rows[keep], cols[keep])), shape=(len(rows), half_matrix.shape[0]))
+
+    # Computes the similarity matrix, 2 * M_ij / (M_ii + M_jj), only on the nonzeros of the commuting matrix M.
+    # For non-negative incidences M_ij > 0 implies M_ii, M_jj > 0, so every other pair has similarity 0.
+    # With num_workers > 1 (None for one per core) the work is split in row blocks over a process pool.
+    def compute_similarity_matrix(self, metapath, num_workers=1):
+        if num_workers is None or num_workers > 1:
+            return self.compute_similarity_matrix_parallel(metapath, num_workers)
+
+        # Compute metapath matrix.
+        metapath_matrix = sparse.coo_matrix(self.compute_metapath_matrix(metapath))
         num_nodes = len(self.node_types[metapath[0]])
-        # similarity_matrix = np.eye(num_nodes, num_nodes)      # TODO - probe to error
-        data, rows, cols = [], [], []
-
-        for (index1, index2) in product(range(num_nodes), range(num_nodes)):
-            if index1 != index2:
-                # num_paths_12 = metapath_matrix[index1][index2]             # TODO - probe to error
-                # num_paths_11 = metapath_matrix[index1][index1]             # TODO - probe to error
-                # num_paths_22 = metapath_matrix[index2][index2]             # TODO - probe to error
-
-                num_paths_12 = nonZeroEntries[(index1, index2)] if (index1, index2) in nonZeroEntries.keys() else 0
-                num_paths_11 = nonZeroEntries[(index1, index1)] if (index1, index2) in nonZeroEntries.keys() else 0
-                num_paths_22 = nonZeroEntries[(index2, index2)] if (index1, index2) in nonZeroEntries.keys() else 0
-
-                if (num_paths_11 + num_paths_22) > 0:
-                    # similarity_matrix[index1][index2] = (2 * num_paths_12)/(num_paths_11 + num_paths_22)        # TODO - probe to error
-                    data.append((2 * num_paths_12)/(num_paths_11 + num_paths_22))
-                    rows.append(index1)
-                    cols.append(index2)
-                else:
-                    # similarity_matrix[index1][index2] = 0
-                    pass
-            else:
-                data.append(1)
-                rows.append(index1)
-                cols.append(index2)
-
-        similarity_matrix = sparse.csr_matrix((np.array(data), (np.array(rows), np.array(cols))))
+        diagonal = metapath_matrix.diagonal().astype(np.float64)
+
+        # Off diagonal nonzeros, normalized by the paths of each node to itself.
+        rows, cols, num_paths_12 = metapath_matrix.row, metapath_matrix.col, metapath_matrix.data
+        denominators = diagonal[rows] + diagonal[cols]
+        keep = (rows != cols) & (num_paths_12 != 0) & (denominators > 0)
+        rows, cols = rows[keep], cols[keep]
+        data = 2 * num_paths_12[keep] / denominators[keep]
+
+        # Every node is fully similar to itself.
+        diagonal_indices = np.arange(num_nodes)
+        data = np.concatenate([data, np.ones(num_nodes)])
+        rows = np.concatenate([rows, diagonal_indices])
+        cols = np.concatenate([cols, diagonal_indices])
+
+        similarity_matrix = sparse.csr_matrix((data, (rows, cols)), shape=(num_nodes, num_nodes))
+        self.similarity_matrices[metapath] = similarity_matrix
+        self.similarity_keys.pop(metapath, None)
+        return similarity_matrix
+
+    # Similarity matrix computed as row blocks C[block] C^T, where C is the half metapath matrix, in worker processes
+    # that memory-map one copy of C, C^T and the diagonal. Blocks are sized to take about the same number of
+    # multiply-adds and there are a few per worker, so a slow block doesn't leave the others idle.
+    def compute_similarity_matrix_parallel(self, metapath, num_workers=None, blocks_per_worker=4):
+        num_workers = os.cpu_count() if num_workers is None else num_workers
+        half_matrix, half_matrix_t, diagonal = self.compute_half_metapath_matrix(metapath)
+        num_nodes = half_matrix.shape[0]
+
+        # Multiply-adds of each row of C C^T.
+        pattern = sparse.csr_matrix((np.ones(len(half_matrix.data)), half_matrix.indices, half_matrix.indptr),
+                                    shape=half_matrix.shape)
+        row_costs = pattern.dot(np.diff(half_matrix_t.indptr).astype(np.float64)) + 1
+        cumulative_costs = np.cumsum(row_costs)
+        num_blocks = max(1, min(num_nodes, num_workers * blocks_per_worker))
+        bounds = np.searchsorted(cumulative_costs, cumulative_costs[-1] * np.arange(1, num_blocks) / num_blocks)
+        bounds = np.unique(np.concatenate([[0], bounds, [num_nodes]]))
+
+        with tempfile.TemporaryDirectory() as shared_dir:
+            arrays = {
+                'indptr': half_matrix.indptr, 'indices': half_matrix.indices, 'data': half_matrix.data,
+                't_indptr': half_matrix_t.indptr, 't_indices': half_matrix_t.indices, 't_data': half_matrix_t.data,
+                'diagonal': diagonal,
+            }
+            for name, array in arrays.items():
+                np.save(os.path.join(shared_dir, name + '.npy'), array)
+
+            with ProcessPoolExecutor(max_workers=num_workers, initializer=load_shared_matrices,
+                                     initargs=(shared_dir, half_matrix.shape)) as pool:
+                blocks = list(pool.map(similarity_block, bounds[:-1].tolist(), bounds[1:].tolist()))
+
+        similarity_matrix = sparse.vstack(blocks, format='csr')
         self.similarity_matrices[metapath] = similarity_matrix
+        self.similarity_keys.pop(metapath, None)
         return similarity_matrix
 
     # Computes the number of paths via this metapath.
@@ -76,21 +187,131 @@ class PathSim:
         # We only support symmetric metapaths, for now.
         if not PathSim.symmetric(metapath):
             raise ValueError('Only symmetric metapaths supported.')
-            
-        curr_matrix = sparse.eye(len(self.node_types[metapath[0]]))
-        metapath_length = len(metapath)
 
-        for node_type, next_node_type in zip(metapath[:metapath_length//2], metapath[1:metapath_length//2 + 1]):
-            
-            incidence_type = node_type + next_node_type
+        return self.compute_path_matrix(metapath)
+
+    # Half of a symmetric metapath as a CSR matrix C, so that its commuting matrix is C C^T. Cached with its
+    # transpose and the diagonal of C C^T (sum of squares of each row of C).
+    def compute_half_metapath_matrix(self, metapath):
+
+        # We only support symmetric metapaths, for now.
+        if not PathSim.symmetric(metapath):
+            raise ValueError('Only symmetric metapaths supported.')
+
+        half_metapath = metapath[:len(metapath)//2 + 1]
+        if half_metapath not in self.half_metapath_matrices:
+            half_matrix = self.compute_path_matrix(half_metapath)
+            diagonal = np.asarray(half_matrix.multiply(half_matrix).sum(axis=1), dtype=np.float64).ravel()
+            self.half_metapath_matrices[half_metapath] = (half_matrix, half_matrix.T.tocsr(), diagonal)
+
+        return self.half_metapath_matrices[half_metapath]
+
+    # Product of the incidence matrices along path (e.g. TCL = TC . CL) as a CSR matrix. Every sub-path product is
+    # memoized (in memory and in path_cache), so metapaths sharing a prefix or a half reuse it - a reversed path is
+    # just the transpose. The multiplication order is chosen by dynamic programming over the sub-paths, with the cost of
+    # each product estimated from the nonzeros per column/row of its operands; products already known cost nothing.
+    def compute_path_matrix(self, path):
+        for node_type, next_node_type in zip(path[:-1], path[1:]):
+            if node_type + next_node_type not in self.incidence_matrices.keys():
+                raise ValueError('Invalid incidence %s.' % (node_type + next_node_type))
+
+        if len(path) == 1:
+            return sparse.eye(len(self.node_types[path]), format='csr')
+
+        known = self.get_path_matrix(path)
+        if known is not None:
+            return known
+
+        # Estimated nonzeros per row and per column of every sub-path product - exact when it's known, otherwise an
+        # upper bound propagated through the incidence patterns.
+        length = len(path)
+        row_counts, col_counts, known = {}, {}, {}
+        for span in range(1, length):
+            for start in range(length - span):
+                end = start + span
+                matrix = self.get_path_matrix(path[start:end + 1])
+                if matrix is not None:
+                    known[start, end] = matrix
+                    row_counts[start, end] = np.diff(matrix.indptr).astype(np.float64)
+                    col_counts[start, end] = np.bincount(matrix.indices, minlength=matrix.shape[1]).astype(np.float64)
+                else:
+                    num_rows, num_cols = len(self.node_types[path[start]]), len(self.node_types[path[end]])
+                    first, last = self.incidence_pattern(path[start:start + 2]), self.incidence_pattern(path[end - 1:end + 1])
+                    row_counts[start, end] = np.minimum(first.dot(row_counts[start + 1, end]), num_cols)
+                    col_counts[start, end] = np.minimum(last.T.dot(col_counts[start, end - 1]), num_rows)
+
+        # Cheapest way of computing each sub-path product, in estimated multiply-adds.
+        costs, splits = {}, {}
+        for span in range(1, length):
+            for start in range(length - span):
+                end = start + span
+                if (start, end) in known:
+                    costs[start, end] = 0
+                    continue
+                costs[start, end] = np.inf
+                for split in range(start + 1, end):
+                    cost = costs[start, split] + costs[split, end] + col_counts[start, split].dot(row_counts[split, end])
+                    if cost < costs[start, end]:
+                        costs[start, end], splits[start, end] = cost, split
+
+        def multiply(start, end):
+            if (start, end) in known:
+                return known[start, end]
+            split = splits[start, end]
+            matrix = sparse.csr_matrix(multiply(start, split).dot(multiply(split, end)))
+            known[start, end] = matrix
+            self.put_path_matrix(path[start:end + 1], matrix)
+            return matrix
+
+        return multiply(0, length - 1)
 
-            if incidence_type not in self.incidence_matrices.keys():
-                raise ValueError('Invalid incidence %s.' % incidence_type)
+    # Known product along path - from memory, from path_cache, or the transpose of the reversed path.
+    def get_path_matrix(self, path):
+        if len(path) == 2:
+            return self.incidence_csr(path)
 
-            # curr_matrix = np.matmul(curr_matrix, self.incidence_matrices[incidence_type])
-            curr_matrix = curr_matrix.dot(self.incidence_matrices[incidence_type])
+        for candidate, transpose in [(path, False), (path[::-1], True)]:
+            matrix = self.path_matrices.get(candidate)
+            if matrix is None and self.path_cache is not None:
+                matrix = self.path_cache.fetch('metapathProduct-%s' % candidate, inputs=[self.path_key(candidate)])
+                if matrix is not None:
+                    matrix = sparse.csr_matrix(matrix)
+                    self.path_matrices[candidate] = matrix
+            if matrix is not None:
+                return matrix.T.tocsr() if transpose else matrix
 
-        return curr_matrix.dot(curr_matrix.T)
+        return None
+
+    def put_path_matrix(self, path, matrix):
+        self.path_matrices[path] = matrix
+        if self.path_cache is not None:
+            self.path_cache.put('metapathProduct-%s' % path, matrix, inputs=[self.path_key(path)])
+
+    # Identifies the incidence matrices along path, so persisted products are never reused once they change.
+    def path_key(self, path):
+        key = hashlib.sha1(path.encode('utf-8'))
+        for node_type, next_node_type in zip(path[:-1], path[1:]):
+            incidence_type = node_type + next_node_type
+            given_type = incidence_type if incidence_type in self.given_incidence_types else incidence_type[::-1]
+            if given_type not in self.incidence_hashes:
+                matrix = sparse.csr_matrix(self.incidence_matrices[given_type])
+                matrix.sum_duplicates()
+                incidence_hash = hashlib.sha1(str(matrix.shape).encode('utf-8'))
+                for array in [matrix.indptr, matrix.indices, matrix.data]:
+                    incidence_hash.update(np.ascontiguousarray(array).tobytes())
+                self.incidence_hashes[given_type] = incidence_hash.hexdigest()
+            key.update(('%s:%s' % (given_type, self.incidence_hashes[given_type])).encode('utf-8'))
+        return key.hexdigest()[:16]
+
+    def incidence_csr(self, incidence_type):
+        if incidence_type not in self.path_matrices:
+            self.path_matrices[incidence_type] = sparse.csr_matrix(self.incidence_matrices[incidence_type])
+        return self.path_matrices[incidence_type]
+
+    # Nonzero pattern of an incidence matrix, used to estimate the nonzeros of products.
+    def incidence_pattern(self, incidence_type):
+        matrix = self.incidence_csr(incidence_type)
+        return sparse.csr_matrix((np.ones(len(matrix.data)), matrix.indices, matrix.indptr), shape=matrix.shape)
 
     # Check if metapath is symmetric. 
     @staticmethod
@@ -112,4 +333,60 @@ class PathSim:
         
 
 
+# Top k columns of each row of a CSR matrix by value, as a list of (columns, values) per row, highest first and
+# lowest column first among equal values.
+# Zeros are left out, so rows with fewer than k nonzeros get fewer results. exclude holds one column to leave
+# out per row (e.g. the node itself).
+def top_k_rows(matrix, k, exclude=None):
+    matrix = sparse.csr_matrix(matrix)
+    results = []
+
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        cols, values = matrix.indices[start:end], matrix.data[start:end]
+
+        keep = values != 0
+        if exclude is not None:
+            keep &= cols != exclude[row]
+        cols, values = cols[keep], values[keep]
+
+        # Partial selection first, only the candidates get sorted. Everything tied with the k-th value is kept, so ties
+        # are broken by column (lowest first) exactly as a full sort would.
+        if len(values) > k:
+            kth_value = -np.partition(-values, k - 1)[k - 1]
+            selected = values >= kth_value
+            cols, values = cols[selected], values[selected]
+        order = np.lexsort((cols, -values))[:k]
+        results.append((cols[order], values[order]))
+
+    return results
+
+
+# Half metapath matrix, its transpose and diagonal of each worker process of compute_similarity_matrix_parallel.
+shared_matrices = {}
+
+
+def load_shared_matrices(shared_dir, shape):
+    load = lambda name: np.load(os.path.join(shared_dir, name + '.npy'), mmap_mode='r')
+    half_matrix = sparse.csr_matrix((load('data'), load('indices'), load('indptr')), shape=shape)
+    half_matrix_t = sparse.csr_matrix((load('t_data'), load('t_indices'), load('t_indptr')), shape=shape[::-1])
+    shared_matrices['half_metapath'] = (half_matrix, half_matrix_t, load('diagonal'))
+
+
+# Rows start to end of the similarity matrix, with the unit diagonal, as a CSR matrix.
+def similarity_block(start, end):
+    half_matrix, half_matrix_t, diagonal = shared_matrices['half_metapath']
+    block = sparse.coo_matrix(half_matrix[start:end].dot(half_matrix_t))
+
+    rows, cols, num_paths_12 = block.row, block.col, block.data
+    denominators = diagonal[rows + start] + diagonal[cols]
+    keep = (rows + start != cols) & (num_paths_12 != 0) & (denominators > 0)
+    data = 2 * num_paths_12[keep] / denominators[keep]
+
+    # Every node is fully similar to itself.
+    block_rows = np.arange(end - start)
+    data = np.concatenate([data, np.ones(end - start)])
+    rows = np.concatenate([rows[keep], block_rows])
+    cols = np.concatenate([cols[keep], block_rows + start])
 
+    return sparse.csr_matrix((data, (rows, cols)), shape=(end - start, half_matrix_t.shape[1]))
@@ -15,7 +15,7 @@ from mdutils.mdutils import MdUtils
 import libs.networkAnalysis as na
 import libs.pandasLib as pl
 from libs.mongoLib import getContentDocsPerPlatform, getAllDocs, getMinMaxDay
-from initialProcessing.createGraph import getGraphRequirments
+from libs.dataContext import getDataContext
 
 from libs.osLib import loadYaml
 
@@ -53,24 +53,13 @@ if __name__ == '__main__':
 
         logging.info(f'Loading data from DB')
 
-        data = getGraphRequirments(collectionEnt, collectionLoc, collectionCont, platforms,
-                                   timeLimits=(minYear, maxYear))
-        nodesPerClass = {
-            'time': data['temporalPeriod'],
-            'content': [x['_id'] for x in data['contentList']],
-            'tag': [x['_id'] for x in data['entitiesList']],
-            'spatial': [x['_id'] for x in data['locationsList']],
-        }
-        logging.info(
-            f'Data acquired, creating graph (temporal period: {data["temporalPeriod"][0]} -> {data["temporalPeriod"][-1]})')
-
-        # Transform lists to dataframe for faster operations
-        data['contentDf'] = pd.DataFrame(data['contentList']).set_index('_id')
+        # Frames shared with the other scripts - only read from the DB when it changed
+        data = getDataContext(db, join(config['dataDir'], 'dataContext'), platforms, timeLimits=(minYear, maxYear)).getData()
+        logging.info(f'Data acquired (temporal period: {data["temporalPeriod"][0]} -> {data["temporalPeriod"][-1]})')
+
         data['contentDf'].timestamp = data['contentDf'].timestamp.apply(lambda x: [d.date() for d in x])
         # data['contentDf'] = data['contentDf'][['platform', 'type', 'timestamp', 'body', 'tags', 'locations']]
 
-        data['locationDf'] = pd.DataFrame(data['locationsList']).set_index('_id')
-        data['entityDf'] = pd.DataFrame(data['entitiesList']).set_index('_id')
         dateLabels = {d: d.strftime(f'%B %dRR, %Y').replace('RR', getDayFinisher(d.day)) for d in
                       data['temporalPeriod']}
 
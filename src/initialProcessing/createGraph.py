@@ -6,6 +6,7 @@ import logging
 from os.path import join
 from datetime import date, timedelta, datetime
 
+import numpy as np
 import networkx as nx
 import pandas as pd
 from pymongo import MongoClient
@@ -13,157 +14,153 @@ from bson.objectid import ObjectId
 
 import libs.networkAnalysis as na
 import libs.pandasLib as pl
-from libs.mongoLib import getContentDocsPerPlatform, getAllDocs, getMinMaxDay
-
-
-def apply_mapping(days, mapping):
-    output = []
-    for d in days:
-        try:
-            assert(d in mapping.keys())
-            output.append(mapping[d])
-        except Exception as ex:
-            print(ex)
-            r=11
-    return output
+from libs.compactGraph import CompactGraph, setNodeAttributes, saveGraph, loadGraph, graphPath, appendToGraph, readGraphMeta, \
+    objectArray
+from libs.customExceptions import NothingToDo, NotAppendOnly
+from libs.mongoLib import getContentDocsPerPlatform, getContentDocsPerPlatformInRange, getLastUpdate
+from libs.dataContext import getDataContext
 
 
-def find_weeks(start,end):
-    l, mapping = [], {}
-    for i in range((end-start).days + 1):
-        curr_day = start+timedelta(days=i)
-        d = curr_day.isocalendar()[:2] # e.g. (2011, 52)
-        yearweek = '{}-{:02}'.format(*d) # e.g. "201152"
-        l.append(yearweek)
-        mapping[curr_day] = yearweek
-    new_time_labels = sorted(set(l))
-    return new_time_labels, mapping
-
-
-def find_2_weeks(start, end):
-    l, aux_mapping = [], {}
-    for i in range((end-start).days + 1):
-        curr_day = start+timedelta(days=i)
-        d = curr_day.isocalendar()[:2] # e.g. (2011, 52)
-        yearweek = '{}-{:02}'.format(*d) # e.g. "201152"
-        l.append(yearweek)
-        if yearweek in aux_mapping.keys():
-            aux_mapping[yearweek].append(curr_day)
-        else:
-            aux_mapping[yearweek] = [curr_day]
-    l = sorted(set(l))
-
-    new_time_labels = []
-    for it, label in enumerate(l):
-        # Keep only half the labels
-        if it % 0:
-            new_time_labels.append(label)
-        else:
-            aux_mapping[label] = l[it-1]
-
-    mapping = {d: week for week, days in aux_mapping.items() for d in days}
-    return new_time_labels, mapping
-
-
-def find_months(start,end):
-    l, mapping = [], {}
-    for i in range((end-start).days + 1):
-        curr_day = start+timedelta(days=i)
-        yearmonth = curr_day.strftime("%Y-%m")
-        l.append(yearmonth)
-        mapping[curr_day] = yearmonth
-    new_time_labels = sorted(set(l))
-    return new_time_labels, mapping
-
-
-def standardizeDays(days, timeLabels):
-    output = []
-    for x in days:
-        try:
-            t = x.date()
-            assert(t in timeLabels)
-            output.append(t)
-        except Exception as ex:
-            print(ex)
-            r=1
-    return output
+def isoWeeks(days):
+    '''
+    ISO calendar year and week of each day, with integer arithmetic
+    :param days: np.array datetime64[D]
+    :return: (np.array years, np.array weeks)
+    '''
+    dayNumbers = days.astype(np.int64)
+    thursdays = dayNumbers - (dayNumbers + 3) % 7 + 3  # A week belongs to the year of its thursday - 1970-01-01 was a thursday
+    years = thursdays.astype('datetime64[D]').astype('datetime64[Y]')
+    weeks = (thursdays - years.astype('datetime64[D]').astype(np.int64)) // 7 + 1
+    return years.astype(np.int64) + 1970, weeks
 
 
-def get_new_time_labels(time_labels, period):
-    minDay, maxDay = min(time_labels), max(time_labels)
-    if period == 'week':
-        new_time_labels, mapping = find_weeks(minDay, maxDay)
-        # new_time_labels = [(minDay + x*timedelta(weeks=1)).strftime("%U-%Y") for x in range((maxDay - minDay).days//7)]
-        # new_time_labels = [(minDay + x*timedelta(weeks=2)).strftime("%U-%Y") for x in range((maxDay - minDay).days//14 +1)]
-    elif period == '2weeks':
-        new_time_labels, mapping = find_2_weeks(minDay, maxDay)
+def bucketDays(days, period):
+    '''
+    :param days: np.array datetime64[D] of consecutive days
+    :param period: 'week', '2weeks' or 'month'
+    :return: (np.array label of each day, sorted list of the labels)
+    '''
+    if period in ['week', '2weeks']:
+        if period == '2weeks':
+            # Keep only half the weeks, the others are merged into the previous one
+            mondays = days.astype(np.int64) - (days.astype(np.int64) + 3) % 7
+            days = (mondays - (mondays - mondays[0]) // 7 % 2 * 7).astype('datetime64[D]')
+        years, weeks = isoWeeks(days)
+        buckets, inverse = np.unique(years * 100 + weeks, return_inverse=True)
+        labels = ['{}-{:02}'.format(b // 100, b % 100) for b in buckets.tolist()]  # e.g. "2011-52"
     elif period == 'month':
-        new_time_labels, mapping = find_months(minDay, maxDay)
+        buckets, inverse = np.unique(days.astype('datetime64[M]').astype(np.int64), return_inverse=True)
+        labels = ['{}-{:02}'.format(b // 12 + 1970, b % 12 + 1) for b in buckets.tolist()]  # e.g. "2011-12"
     else:
         print(period)
         raise Exception('Unknown period')
-    # new_time_labels become nodes, mapping is for creating edges based on the content df
-    return new_time_labels, mapping
+    return np.array(labels, dtype=object)[inverse], labels
 
 
 def convert_time_indexes(df, time_labels, period='day'):
-    df.timestamp = df.timestamp.apply(lambda x: standardizeDays(x, time_labels))
-    r = 1
-    # df.timestamp = df.timestamp.dt.date
+    '''
+    Replaces the timestamps of each content by the labels of their time nodes, timestamps out of time_labels are dropped.
+    :param df: pd.DataFrame with a timestamp column holding lists of datetimes
+    :param time_labels: list of days in the temporal period
+    :param period: 'day', 'week', '2weeks' or 'month'
+    :return: (df, new_time_labels - become the time nodes)
+    '''
+    timestamps = df.timestamp.reset_index(drop=True).explode().dropna()
+    days = pd.to_datetime(timestamps).values.astype('datetime64[D]')
+    periodDays = np.unique(np.array(time_labels, dtype='datetime64[D]'))
+
+    positions = np.searchsorted(periodDays, days).clip(max=len(periodDays) - 1)
+    inPeriod = periodDays[positions] == days
+    if not inPeriod.all():
+        logging.warning(f'Dropped {(~inPeriod).sum()} timestamps out of the temporal period')
+    rows, days = timestamps.index.to_numpy()[inPeriod], days[inPeriod]
+
+    # Labels are computed once per day of the period and looked up by day offset
+    allDays = np.arange(periodDays[0], periodDays[-1] + 1)
     if period == 'day':
         new_time_labels = time_labels
+        dayLabels = allDays.astype(object)     # datetime.date
     else:
+        # Every day between the first and last one gets a label, even if it has no content
+        dayLabels, new_time_labels = bucketDays(allDays, period)
+    labels = dayLabels[(days - allDays[0]).astype(np.int64)]
+
+    # Back to one list per content - explode keeps the rows in order
+    ends = np.cumsum(np.bincount(rows, minlength=len(df)))
+    starts = np.concatenate([[0], ends[:-1]])
+    df.timestamp = list(map(labels.tolist().__getitem__, map(slice, starts.tolist(), ends.tolist())))
+    return df, new_time_labels
 
-        # df.timestamp = df.timestamp.apply(lambda x: [d.date().strftime("%U-%Y") for d in x])
-        # df.timestamp = df.timestamp.apply(lambda x: f(x, new_time_labels))
 
-        new_time_labels, mapping = get_new_time_labels(time_labels, period)
-        df.timestamp = df.timestamp.apply(lambda x: apply_mapping(x, mapping))
-        p=2
-    return df, new_time_labels
+def createGraphNodes(G, nodesPerClass):
+    for clss, listOfNodes in nodesPerClass.items():
+        G.add_nodes_from(listOfNodes, nodeClass=clss)
+    return G
 
 
-def getGraphRequirments(collectionEnt, collectionLoc, collectionCont, platforms, timeLimits=None, period='day'):
-    # Convert to list due to multiple use
-    contentList = list(getContentDocsPerPlatform(collectionCont, platforms))
-    entitiesList = list(getAllDocs(collectionEnt))
-    locationsList = list(getAllDocs(collectionLoc))
+def validateEdges(edges, nodes, edgeType, numSamples=5):
+    '''
+    Makes sure every tail is already a node in the graph - logs how many aren't (and a few examples) before failing.
+    :param edges: list of (head, tail)
+    :param nodes: iterable of the nodes the tails should belong to
+    :param edgeType: name used in the report
+    '''
+    nodes = set(nodes)
+    unknownTails = [e[1] for e in edges if e[1] not in nodes]
 
-    minDay, maxDay = getMinMaxDay(collectionCont)
-    temporalPeriod = [minDay + timedelta(days=x) for x in range((maxDay - minDay).days + 1)]
+    if len(unknownTails) > 0:
+        samples = list(dict.fromkeys(unknownTails))[:numSamples]
+        logging.error(f'> {len(unknownTails)} {edgeType} edges ({len(set(unknownTails))} distinct endpoints) '
+                      f'point to unknown nodes - e.g. {samples}')
+    assert(len(unknownTails) == 0)
 
-    if timeLimits is not None:
-        logging.info(f'Limiting time from {timeLimits[0]} to {timeLimits[1]}')
-        temporalPeriod = [d for d in temporalPeriod if d.year >= timeLimits[0] and d.year <= timeLimits[1]]
-
-        droppedTimestamps, contentToDrop = 0, []
-        for it, c in enumerate(contentList):
-            timestampsToKeep = [t for t in c['timestamp'] if t.year >= timeLimits[0] and t.year <= timeLimits[1]]
-            droppedTimestamps = len(c['timestamp']) - len(timestampsToKeep)
-            if len(timestampsToKeep) == 0:
-                contentToDrop.append(it)
-            else:
-                c['timestamp'] = timestampsToKeep
-
-        contentList = [c for it, c in enumerate(contentList) if it not in contentToDrop]
-        logging.info(f'Dropped {droppedTimestamps} content timestamps (outside of temporal range) - '
-                     f'resulting in deleting {len(contentToDrop)} pieces of content entirely.')
+
+def getGraphEdges(contentDf, nodesPerClass, validate=True):
+    '''
+    :param contentDf:
+    :param nodesPerClass:
+    :param validate: check that every edge endpoint is a known node (can be skipped on trusted data)
+    :return: Dictionary, edge class: (list of edges, edge type(s))
+    '''
+    # (Day)-(Day)
+    timeEdges = [(nodesPerClass['time'][i], nodesPerClass['time'][i+1]) for i in range(len(nodesPerClass['time'])-1)]
+    logging.info(f'> Time Edges {len(timeEdges)}')
+    
+    # (Day)-(Content) edges
+    actionDf = pl.unrollListAttr(contentDf.reset_index(), 'timestamp', ['_id'])
+    actionDf = actionDf.set_index('_id')['value']
+    actionEdges = list(actionDf.items())
+    if validate is True:
+        validateEdges(actionEdges, nodesPerClass['time'], 'Action')
+    logging.info(f'> Action Edges {len(actionEdges)}')
+
+    # (Content)-(Location) edges
+    locationsDf = pl.unrollListOfDictsAttr(contentDf.reset_index(), 'locations', ['_id'])
+    locationsDf.set_index('_id', inplace=True)
+    sourceEdgeTypes = locationsDf['relationshipType'].tolist()
+    locationEdges = list(locationsDf['label'].items())
+    if validate is True:
+        validateEdges(locationEdges, nodesPerClass['spatial'], 'Source')
+    logging.info(f'> Source Edges {len(locationEdges)}')
+
+    # (Content)-(Tags) edges
+    tagDf = pl.unrollListOfDictsAttr(contentDf.reset_index(), 'tags', ['_id'])
+    tagDf.set_index('_id', inplace=True)
+    tagEdgeTypes = tagDf['relationshipType'].tolist()
+    tagEdges = list(tagDf['label'].items())
+    if validate is True:
+        validateEdges(tagEdges, nodesPerClass['tag'], 'Tag')
+    logging.info(f'> Tag Edges {len(tagEdges)}')
 
     return {
-        'contentList': contentList,
-        'entitiesList': entitiesList,
-        'locationsList': locationsList,
-        'temporalPeriod': temporalPeriod,
+        'temporal': (timeEdges, 'temporal'),
+        'action': (actionEdges, 'action'),
+        'source': (locationEdges, sourceEdgeTypes),
+        'tag': (tagEdges, tagEdgeTypes),
     }
 
 
-def createGraphNodes(G, nodesPerClass):
-    for clss, listOfNodes in nodesPerClass.items():
-        G.add_nodes_from(listOfNodes, nodeClass=clss)
-    return G
-
-
-def createGraphEdges(G, contentDf, nodesPerClass):
+def createGraphEdges(G, contentDf, nodesPerClass, validate=True):
     '''
     Adds the following types of connections to the graph: 
         (Day)-[temporal]-(Day)
@@ -174,43 +171,15 @@ def createGraphEdges(G, contentDf, nodesPerClass):
     :param temporalPeriod: 
     :param contentDf: 
     :param nodesPerClass: 
+    :param validate: check that every edge endpoint is a known node (can be skipped on trusted data)
     :return:
     '''
     try:
-        # (Day)-(Day)
-        timeEdges = [(nodesPerClass['time'][i], nodesPerClass['time'][i+1]) for i in range(len(nodesPerClass['time'])-1)]
-        logging.info(f'> Time Edges {len(timeEdges)}')
-        
-        # (Day)-(Content) edges
-        actionDf = pl.unrollListAttr(contentDf.reset_index(), 'timestamp', ['_id'])
-        actionDf = actionDf.set_index('_id')['value']
-        actionEdges = list(actionDf.items())
-        # Make sure every tail is already a node in the graph
-        print([e[1] for e in actionEdges if e[1] not in nodesPerClass['time']])
-        assert(len([e[1] for e in actionEdges if e[1] not in nodesPerClass['time']]) == 0)
-        logging.info(f'> Action Edges {len(actionEdges)}')
-
-        # (Content)-(Location) edges
-        locationsDf = pl.unrollListOfDictsAttr(contentDf.reset_index(), 'locations', ['_id'])
-        locationsDf.set_index('_id', inplace=True)
-        sourceEdgeTypes = locationsDf['relationshipType'].tolist()
-        locationEdges = list(locationsDf['label'].items())
-        assert(len([e[1] for e in locationEdges if e[1] not in nodesPerClass['spatial']]) == 0)
-        logging.info(f'> Source Edges {len(locationEdges)}')
-
-        # (Content)-(Tags) edges
-        tagDf = pl.unrollListOfDictsAttr(contentDf.reset_index(), 'tags', ['_id'])
-        tagDf.set_index('_id', inplace=True)
-        tagEdgeTypes = tagDf['relationshipType'].tolist()
-        tagEdges = list(tagDf['label'].items())
-        assert(len([e[1] for e in tagEdges if e[1] not in nodesPerClass['tag']]) == 0)
-        logging.info(f'> Tag Edges {len(tagEdges)}')
+        edgesPerClass = getGraphEdges(contentDf, nodesPerClass, validate=validate)
 
         # Add them all to the graph
-        G.add_edges_from(timeEdges, edgeClass='temporal')
-        G.add_edges_from(actionEdges, edgeClass='action')
-        G.add_edges_from(locationEdges, edgeClass=sourceEdgeTypes)
-        G.add_edges_from(tagEdges, edgeClass=tagEdgeTypes)
+        for edges, edgeClass in edgesPerClass.values():
+            G.add_edges_from(edges, edgeClass=edgeClass)
 
     except Exception as ex:
         print(traceback.format_exc())
@@ -218,7 +187,73 @@ def createGraphEdges(G, contentDf, nodesPerClass):
     return G
 
 
-def addNodeAttributes(G, data, platform=False, contentType=False, locationType=False, dbpediaType=False):
+def coarsenTimeEdges(edgesPerClass, days, periods):
+    '''
+    Derives the temporal layer of coarser resolutions from the day-level one, so content/tag/location edges are shared:
+    the action edges of each content are merged per period, keeping how many there were as weight - (content, label, weight).
+    :param edgesPerClass: as returned by getGraphEdges, with day time nodes
+    :param days: list of day (datetime.date) time nodes
+    :param periods: list of 'week', '2weeks' or 'month'
+    :return: Dictionary, period: (time nodes, Dictionary with the temporal and action entries of edgesPerClass)
+    '''
+    allDays = np.arange(min(days), max(days) + timedelta(days=1), dtype='datetime64[D]')
+
+    # Actions as integer codes, shared by every period
+    actionEdges = edgesPerClass['action'][0]
+    contentCodes, contentIds = pd.factorize(objectArray([e[0] for e in actionEdges]))
+    dayCodes, actionDays = pd.factorize(objectArray([e[1] for e in actionEdges]))
+    actionDays = (np.array(actionDays.tolist(), dtype='datetime64[D]') - allDays[0]).astype(np.int64)
+
+    output = {}
+    for period in periods:
+        dayLabels, timeNodes = bucketDays(allDays, period)
+        periodPerDay = pd.Index(timeNodes).get_indexer(dayLabels)
+
+        # Count the actions of each (content, period) pair
+        periodCodes = periodPerDay[actionDays][dayCodes]
+        pairs, counts = np.unique(contentCodes.astype(np.int64) * len(timeNodes) + periodCodes, return_counts=True)
+        periodEdges = list(zip(contentIds[pairs // len(timeNodes)].tolist(),
+                               np.array(timeNodes, dtype=object)[pairs % len(timeNodes)].tolist(), counts.tolist()))
+        logging.info(f'> {period} Action Edges {len(periodEdges)}')
+
+        timeEdges = [(timeNodes[i], timeNodes[i + 1]) for i in range(len(timeNodes) - 1)]
+        output[period] = (timeNodes, {'temporal': (timeEdges, 'temporal'), 'action': (periodEdges, 'action')})
+    return output
+
+
+def buildGraph(nodesPerClass, edgesPerClass, graphFormat='networkx'):
+    '''
+    :param edgesPerClass: as returned by getGraphEdges
+    :param graphFormat: 'networkx' or 'compact'
+    :return: the largest connected component of the graph
+    '''
+    if graphFormat == 'compact':
+        G = CompactGraph.fromEdges(nodesPerClass, {c: edges for c, (edges, _) in edgesPerClass.items()})
+        logging.info(f'Graph with {G.numberOfNodes()} nodes and {G.numberOfEdges()} edges')
+
+        # Ensure we have a single component
+        return G.largestComponent()
+
+    G = nx.Graph()
+    G = createGraphNodes(G, nodesPerClass)
+    for edges, edgeClass in edgesPerClass.values():
+        if len(edges) > 0 and len(edges[0]) > 2:
+            G.add_weighted_edges_from(edges, edgeClass=edgeClass)
+        else:
+            G.add_edges_from(edges, edgeClass=edgeClass)
+    logging.info(f'Graph with {G.number_of_nodes()} nodes and {G.number_of_edges()} edges')
+
+    # Ensure we have a single component
+    # Since we are limiting time, we may include some nodes (tags/locations) that are connected to content nodes
+    # which don't end up in the graph. This solves this - todo
+    return na.getOnlyConnectedGraph(G)
+
+
+def getNodeAttributesFromData(data, platform=False, contentType=False, locationType=False, dbpediaType=False):
+    '''
+    :return: Dictionary, attribute name: Dictionary, node ID: value
+    '''
+    attributes = {}
     if platform is True:
         # Regarding content nodes
         assert('contentDf' in data.keys())
@@ -232,126 +267,263 @@ def addNodeAttributes(G, data, platform=False, contentType=False, locationType=F
         assert(len([x for x in platformPerIdCont.keys() if x in platformPerIdLoc.keys()]) == 0)
 
         platformPerIdCont.update(platformPerIdLoc)
-        nx.set_node_attributes(G, platformPerIdCont, 'platform')
+        attributes['platform'] = platformPerIdCont
 
     if contentType is True:
         assert('contentDf' in data.keys())
-        contentType = data['contentDf']['type'].to_dict()
-        nx.set_node_attributes(G, contentType, 'contentType')
+        attributes['contentType'] = data['contentDf']['type'].to_dict()
 
     if locationType is True:
         assert('locationDf' in data.keys())
-        locationType = data['locationDf']['type'].to_dict()
-        nx.set_node_attributes(G, locationType, 'locationType')
+        attributes['locationType'] = data['locationDf']['type'].to_dict()
 
     if dbpediaType is True:
-        dbpediaType = {e['_id']: e['id']for e in data['entitiesList']}
-        nx.set_node_attributes(G, dbpediaType, 'dbPediaType')
+        assert('entityDf' in data.keys())
+        attributes['dbPediaType'] = data['entityDf']['id'].to_dict()
+
+    return attributes
 
-    r=1
 
+def addNodeAttributes(G, data, platform=False, contentType=False, locationType=False, dbpediaType=False):
+    attributes = getNodeAttributesFromData(data, platform=platform, contentType=contentType, locationType=locationType,
+                                           dbpediaType=dbpediaType)
+    for name, values in attributes.items():
+        setNodeAttributes(G, values, name)
     return G
 
 
-if __name__ == '__main__':
+def createGraphs(data, periods, lastUpdate=None, graphFormat='networkx', validate=True, **attributeFlags):
+    '''
+    Creates the graph of every period from nothing - coarser periods are derived from the day-level edges.
+    :param data: Dictionary with contentDf, locationDf, entityDf and temporalPeriod - see getDataContext
+    :param periods: list of periods ('day', 'week', 'month')
+    :param lastUpdate: latest updatedAt of the content collection when data was read - see updateGraph
+    :param attributeFlags: platform, contentType, locationType, dbpediaType - see addNodeAttributes
+    :return: (Dictionary, period: graph, high-water mark of the data in the graphs)
+    '''
+    nodesPerClass = {
+        'time': data['temporalPeriod'],
+        'content': data['contentDf'].index.tolist(),
+        'tag': data['entityDf'].index.tolist(),
+        'spatial': data['locationDf'].index.tolist(),
+    }
+    logging.info(f'Data acquired, creating graph (temporal period: {data["temporalPeriod"][0]} -> {data["temporalPeriod"][-1]})')
+    # Later updates only read content inserted after this one
+    highWaterMark = {'content': str(max(nodesPerClass['content'])), 'firstDay': str(data['temporalPeriod'][0]),
+                     'lastDay': str(data['temporalPeriod'][-1]), 'lastUpdate': str(lastUpdate) if lastUpdate is not None else None}
+
+    data['contentDf'], nodesPerClass['time'] = convert_time_indexes(data['contentDf'], nodesPerClass['time'], period='day')
+
+    # Create the graphs - every period shares the content/tag/location edges
+    graphs = {}
+    edgesPerClass = getGraphEdges(data['contentDf'], nodesPerClass, validate=validate)
+    temporalLayers = coarsenTimeEdges(edgesPerClass, nodesPerClass['time'], [p for p in periods if p != 'day'])
+    for period in periods:
+        if period == 'day':
+            graphs[period] = buildGraph(nodesPerClass, edgesPerClass, graphFormat=graphFormat)
+        else:
+            timeNodes, timeEdgesPerClass = temporalLayers[period]
+            graphs[period] = buildGraph(dict(nodesPerClass, time=timeNodes), dict(edgesPerClass, **timeEdgesPerClass),
+                                        graphFormat=graphFormat)
+
+        graphs[period] = addNodeAttributes(graphs[period], data, **attributeFlags)
+
+    return graphs, highWaterMark
 
-    root = logging.getLogger()
-    root.setLevel(logging.DEBUG)
 
+def updateGraph(path, collectionEnt, collectionLoc, collectionCont, platforms, timeLimits=None, period='day',
+                validate=True, **attributeFlags):
+    '''
+    Incremental version of creating the graph from nothing: only content inserted after the saved graph's high-water mark
+    (the last content _id it includes, plus its first and last day) is read, and the days, tags, locations and edges it
+    brings are appended to the saved graph as a new segment.
+    Only valid for append-only ingestion - content, tags and locations already in the graph are never read again, so
+    they must not change. Re-running processTags (which inserts every tag again and points all the content at the new
+    ones) or re-ingesting an export (new _ids for the same content) breaks this: create the graph from nothing instead.
+    Changes to content already in the graph are detected through its updatedAt (see bulkUpdate) and raise NotAppendOnly.
+    A re-ingested export on its own only inserts documents, so it can't be told apart from new content.
+    :param path: graph directory, as written by createGraph
+    :param attributeFlags: platform, contentType, locationType, dbpediaType - see addNodeAttributes
+    :return: number of nodes and edges appended
+    '''
+    highWaterMark = readGraphMeta(path).get('highWaterMark') or {}
+    if any(k not in highWaterMark for k in ['content', 'firstDay', 'lastDay', 'lastUpdate']):
+        raise NothingToDo(f'{path} has no high-water mark - create the graph from nothing first')
+    lastContentId = ObjectId(highWaterMark['content'])
+
+    # Content in the graph updated after it was read (e.g. tags set again by processTags) would go stale
+    lastUpdate = highWaterMark['lastUpdate']
+    changed = getLastUpdate(collectionCont, {'_id': {'$lte': lastContentId}})
+    if changed is not None and (lastUpdate is None or changed > datetime.fromisoformat(lastUpdate)):
+        raise NotAppendOnly(f'Content already in {path} was updated at {changed}, after it was read ({lastUpdate}) - '
+                            f'create the graph from nothing instead')
+    newLastUpdate = getLastUpdate(collectionCont)
+
+    if timeLimits is not None:
+        contentList = list(getContentDocsPerPlatformInRange(collectionCont, platforms, datetime(timeLimits[0], 1, 1),
+                                                            datetime(timeLimits[1] + 1, 1, 1), afterId=lastContentId))
+    else:
+        contentList = list(getContentDocsPerPlatform(collectionCont, platforms, afterId=lastContentId))
+    logging.info(f'{len(contentList)} pieces of content inserted after {lastContentId}')
+    if len(contentList) == 0:
+        return 0, 0
+    contentDf = pd.DataFrame(contentList).set_index('_id')
+
+    # Every day between the saved period and the new content's days, labeled the same way as the existing time nodes
+    days = sorted({t.date() for timestamps in contentDf.timestamp for t in timestamps})
+    minDay = min(days[0], date.fromisoformat(highWaterMark['firstDay']))
+    maxDay = max(days[-1], date.fromisoformat(highWaterMark['lastDay']))
+    temporalPeriod = [minDay + timedelta(days=x) for x in range((maxDay - minDay).days + 1)]
+    contentDf, timeLabels = convert_time_indexes(contentDf, temporalPeriod, period=period)
+
+    G = loadGraph(path)
+    existingTimeNodes = set(G.nodeIdsOf(G.nodesOfClass('time')).tolist())
+    timeNodes = sorted(existingTimeNodes.union(timeLabels))
+    newTimeNodes = [t for t in timeLabels if t not in existingTimeNodes]
+
+    # (Day)-(Day) edges only for the new days, linking them to their neighbours
+    position = {t: i for i, t in enumerate(timeNodes)}
+    timeEdges = sorted({(timeNodes[i], timeNodes[i + 1]) for t in newTimeNodes for i in [position[t] - 1, position[t]]
+                        if 0 <= i < len(timeNodes) - 1})
+    if any(min(existingTimeNodes) < t < max(existingTimeNodes) for t in newTimeNodes):
+        logging.warning('New time nodes in the middle of the existing period - their old neighbours stay linked')
+
+    edgesPerClass = getGraphEdges(contentDf, {'time': []}, validate=False)
+    edgesPerClass['temporal'] = (timeEdges, 'temporal')
+
+    # Tags and locations of the new content - the ones already in the graph are ignored when appending
+    tagIds = list({e[1] for e in edgesPerClass['tag'][0]})
+    locationIds = list({e[1] for e in edgesPerClass['source'][0]})
+    entitiesList = list(collectionEnt.find({'_id': {'$in': tagIds}}))
+    locationsList = list(collectionLoc.find({'_id': {'$in': locationIds}}))
+
+    if validate is True:
+        validateEdges(edgesPerClass['action'][0], timeNodes, 'Action')
+        validateEdges(edgesPerClass['source'][0], [x['_id'] for x in locationsList], 'Source')
+        validateEdges(edgesPerClass['tag'][0], [x['_id'] for x in entitiesList], 'Tag')
+
+    data = {
+        'contentDf': contentDf,
+        'locationDf': pd.DataFrame(locationsList, columns=['_id', 'platform', 'type']).set_index('_id'),
+        'entityDf': pd.DataFrame(entitiesList, columns=['_id', 'id']).set_index('_id'),
+    }
+    newNodesPerClass = {
+        'time': newTimeNodes,
+        'content': contentDf.index.tolist(),
+        'tag': tagIds,
+        'spatial': locationIds,
+    }
+    numNodes, numEdges = appendToGraph(path, newNodesPerClass, {c: edges for c, (edges, _) in edgesPerClass.items()},
+                                       getNodeAttributesFromData(data, **attributeFlags),
+                                       highWaterMark={'content': str(contentDf.index.max()), 'firstDay': str(minDay),
+                                                      'lastDay': str(maxDay),
+                                                      'lastUpdate': str(newLastUpdate) if newLastUpdate is not None else None})
+    logging.info(f'Appended {numNodes} nodes and {numEdges} edges to {path}')
+    return numNodes, numEdges
+
+
+def main():
+    '''
+    Creates (or updates) the graph of every period and saves it.
+    '''
     baseDir = '../../data/'
     platforms = ['Facebook', 'YouTube', 'Google Search', 'Reddit', 'Twitter']     # ,
     minYear, maxYear = 2009, 2021
-    PERIOD = 'day'
+    # Created together - coarser periods are derived from the day-level edges (action edges weighted by count)
+    PERIODS = ['day', 'week', 'month']
     # Facebook events force us to require this
 
-    # Acquiring params
-    create, loadFromOS, loadFromMongo = True, False, False
+    # Acquiring params - update appends the content inserted since the saved graph was created/updated, which requires
+    # append-only ingestion (see updateGraph) - after re-running processTags or re-ingesting an export, create instead
+    create, update, loadFromOS, loadFromMongo = True, False, False, False
     # Storing Params
     saveToMongo, saveToOS, saveAsGraphML = False, True, False
     # Data to include
     includePlatform, includeContentType, includeLocationType, includeTagType = True, True, True, True
+    # Check that every edge points to an existing node
+    checkEdges = True
+    # 'networkx' or 'compact' - integer node IDs with one CSR adjacency per edge class (see libs/compactGraph.py)
+    graphFormat = 'networkx'
+
+    graphs, highWaterMark = {}, None
 
     # Make sure we're only acquiring data from one source
-    assert(sum(1 for item in [create, loadFromMongo, loadFromOS] if item) == 1)
+    assert(sum(1 for item in [create, update, loadFromMongo, loadFromOS] if item) == 1)
+
+    # Set up DB
+    client = MongoClient()
+    db = client['digitalMe']
+    collectionCont = db['content']
+    collectionEnt = db['entities']
+    collectionLoc = db['locations']
+
+    if create is True:
+        logging.info(f'Creating graph from nothing - periods: {PERIODS}')
+
+        # Taken before reading the data - documents updated afterwards count as changed in later updates
+        lastUpdate = getLastUpdate(collectionCont)
+        # Frames shared with the other scripts - only read from the DB when it changed
+        data = getDataContext(db, join(baseDir, 'dataContext'), platforms, timeLimits=(minYear, maxYear)).getData()
+        graphs, highWaterMark = createGraphs(data, PERIODS, lastUpdate, graphFormat=graphFormat, validate=checkEdges,
+                                             platform=includePlatform, contentType=includeContentType,
+                                             locationType=includeLocationType, dbpediaType=includeTagType)
+
+    elif update is True:
+        for period in PERIODS:
+            logging.info(f'Updating saved graph - period: {period}')
+            updateGraph(graphPath(baseDir, period), collectionEnt, collectionLoc, collectionCont, platforms,
+                        timeLimits=(minYear, maxYear), period=period, validate=checkEdges, platform=includePlatform,
+                        contentType=includeContentType, locationType=includeLocationType, dbpediaType=includeTagType)
+            graphs[period] = loadGraph(graphPath(baseDir, period))
 
-    try:
-        # Set up DB
-        client = MongoClient()
-        db = client['digitalMe']
-        collectionCont = db['content']
-        collectionEnt = db['entities']
-        collectionLoc = db['locations']
-
-        if create is True:
-            logging.info(f'Creating graph from nothing - period: {PERIOD}')
-
-            data = getGraphRequirments(collectionEnt, collectionLoc, collectionCont, platforms, timeLimits=(minYear, maxYear), period=PERIOD)
-            nodesPerClass = {
-                'time': data['temporalPeriod'],
-                'content': [x['_id'] for x in data['contentList']],
-                'tag': [x['_id'] for x in data['entitiesList']],
-                'spatial': [x['_id'] for x in data['locationsList']],
-            }
-            logging.info(f'Data acquired, creating graph (temporal period: {data["temporalPeriod"][0]} -> {data["temporalPeriod"][-1]})')
-
-            # Transform lists to dataframe for faster operations
-            data['contentDf'] = pd.DataFrame(data['contentList']).set_index('_id')
-
-            data['contentDf'], nodesPerClass['time'] = convert_time_indexes(data['contentDf'], nodesPerClass['time'], period=PERIOD)
-
-            data['locationDf'] = pd.DataFrame(data['locationsList']).set_index('_id')
-
-            # Creat the graph
-            G = nx.Graph()
-            G = createGraphNodes(G, nodesPerClass)
-            logging.info(f'Graph with {G.number_of_nodes()} nodes')
-            G = createGraphEdges(G, data['contentDf'], nodesPerClass)
-            logging.info(f'Graph with {G.number_of_edges()} edges')
-
-            # Ensure we have a single component
-            # Since we are limiting time, we may include some nodes (tags/locations) that are connected to content nodes
-            # which don't end up in the graph. This solves this - todo
-            G = na.getOnlyConnectedGraph(G)
-
-            G = addNodeAttributes(G, data, platform=includePlatform, contentType=includeContentType, locationType=includeLocationType, dbpediaType=includeTagType)
+    else:
+        if loadFromMongo is True:
+            # Load graph from collection
+            pass    # TODO
 
-        else:
-            if loadFromMongo is True:
-                # Load graph from collection
-                pass    # TODO
+        if loadFromOS is True:
+            logging.info(f'Loading graph from OS')
+            # Load graph from OS
+            graphs = {period: loadGraph(graphPath(baseDir, period)) for period in PERIODS}
+
+    if saveToMongo is True:
+        pass    # TODO
+
+    # Updates are already appended to the saved graph
+    if saveToOS is True and update is False:
+        for period, G in graphs.items():
+            saveGraph(G, graphPath(baseDir, period), highWaterMark=highWaterMark)
+        logging.info(f'Saved to OS')
+
+    if saveAsGraphML is True:
+        # Make it viable for Neo4j import
+        G = graphs[PERIODS[0]]
+        graphML = G.toNetworkx() if isinstance(G, CompactGraph) else G.copy()
+
+        # Add node labels (classes)
+        classes = nx.get_node_attributes(graphML, 'nodeClass')
+        classes = {k: f':{v.upper()}' for k, v in classes.items()}
+        nx.set_node_attributes(graphML, classes, 'labels')
+        # print(graphML.nodes[list(classes.keys())[0]])
+        # for n, dt in graphML.nodes(data=True):
+        #    del dt['nodeClass']
+        
+        # Add edge labels (classes)
+        classes = nx.get_edge_attributes(graphML, 'edgeClass')
+        nx.set_edge_attributes(graphML, classes, 'label')
+        # for n, dt in graphML.edges(data=True):
+        #    del dt['edgeClass']
 
-            if loadFromOS is True:
-                logging.info(f'Loading graph from OS')
-                # Load graph from OS
-                G = nx.read_gpickle(join(baseDir, f'graph.gpickle'))
+        nx.write_graphml(graphML,  join(baseDir, f'graph.graphml'))
+        logging.info(f'Saved as graphML')
 
-        if saveToMongo is True:
-            pass    # TODO
 
-        if saveToOS is True:
-            logging.info(f'Saved to OS')
-            nx.write_gpickle(G, join(baseDir, f'graph-{PERIOD}.gpickle'))
-
-        if saveAsGraphML is True:
-            # Make it viable for Neo4j import
-            graphML = G.copy()
-
-            # Add node labels (classes)
-            classes = nx.get_node_attributes(graphML, 'nodeClass')
-            classes = {k: f':{v.upper()}' for k, v in classes.items()}
-            nx.set_node_attributes(graphML, classes, 'labels')
-            # print(graphML.nodes[list(classes.keys())[0]])
-            # for n, dt in graphML.nodes(data=True):
-            #    del dt['nodeClass']
-            
-            # Add edge labels (classes)
-            classes = nx.get_edge_attributes(graphML, 'edgeClass')
-            nx.set_edge_attributes(graphML, classes, 'label')
-            # for n, dt in graphML.edges(data=True):
-            #    del dt['edgeClass']
-
-            nx.write_graphml(graphML,  join(baseDir, f'graph.graphml'))
-            logging.info(f'Saved as graphML')
+if __name__ == '__main__':
 
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG)
+
+    try:
+        main()
     except Exception as ex:
         print(traceback.format_exc())
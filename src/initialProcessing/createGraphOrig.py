@@ -13,6 +13,7 @@ from bson.objectid import ObjectId
 
 import libs.networkAnalysis as na
 import libs.pandasLib as pl
+from libs.compactGraph import saveGraph, loadGraph, graphPath
 from libs.mongoLib import getContentDocsPerPlatform, getAllDocs, getMinMaxDay
 
 
@@ -207,14 +208,14 @@ if __name__ == '__main__':
             if loadFromOS is True:
                 logging.info(f'Loading graph from OS')
                 # Load graph from OS
-                G = nx.read_gpickle(join(baseDir, f'graph.gpickle'))
+                G = loadGraph(graphPath(baseDir)).toNetworkx()
 
         if saveToMongo is True:
             pass    # TODO
 
         if saveToOS is True:
             logging.info(f'Saved to OS')
-            nx.write_gpickle(G, join(baseDir, f'graph.gpickle'))
+            saveGraph(G, graphPath(baseDir))
 
         if saveAsGraphML is True:
             # Make it viable for Neo4j import
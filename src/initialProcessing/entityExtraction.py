@@ -8,82 +8,73 @@ import random
 from os.path import join
 
 import pandas as pd
+import numpy as np
 from pymongo import MongoClient
-from rosette.api import API, DocumentParameters, RosetteException
-import bisect
 
-from libs.mongoLib import getPayloadsDfFromDB, updateContentDocsWithRawEntities
+from libs.mongoLib import iterPayloadsDfFromDB, updateContentDocsWithRawEntities
 from libs.osLib import loadYaml
+from libs.entityExtractionLib import ExtractionEngine, RosetteBackend, RegexBackend, EntityCache
+from libs.customExceptions import ExtractionQuotaExceeded
 
 
 def generateDocuments(df, maxCharsPerDoc):
-
-    df['doc'] = None
-    df['index-range'] = None
-
-    docs, docIndx = [''], 0
-
-    for index, row in df.iterrows():
-        if pd.isnull(row['payload']):
-            continue
-        payload = row['payload'] + '. '  # Separate the different payloads by a dot and a space.
-        size = len(payload)
-
-        if len(docs[docIndx])+size > maxCharsPerDoc:
-            docs.append('')
-            docIndx += 1
-
-        df.at[index, 'doc'] = docIndx
-        df.at[index, 'index-range'] = [len(docs[docIndx]), len(docs[docIndx])+size]
-        docs[docIndx] += payload
-
+    '''
+    Packs the payloads, in order, into documents of at most maxCharsPerDoc characters (a larger payload gets a
+    document of its own). Each payload's document and position in it are kept in 'doc', 'index-start' and 'index-end'.
+    :param df: pd.DataFrame with a payload column
+    :return: (list of documents, df)
+    '''
+    df['doc'], df['index-start'], df['index-end'] = np.nan, np.nan, np.nan
+
+    valid = df['payload'].notna().to_numpy()
+    if not valid.any():
+        return [], df
+
+    payloads = (df.loc[valid, 'payload'] + '. ')  # Separate the different payloads by a dot and a space.
+    sizes = payloads.str.len().to_numpy()
+    ends = np.cumsum(sizes)
+    payloads = payloads.to_numpy()
+
+    # Each document takes every following payload that still fits - one search per document
+    boundaries, start, docStart = [], 0, 0
+    while start < len(payloads):
+        end = max(int(np.searchsorted(ends, docStart + maxCharsPerDoc, side='right')), start + 1)
+        boundaries.append(end)
+        start, docStart = end, ends[end - 1]
+
+    boundaries = np.array(boundaries, dtype=int)
+    docIndx = np.repeat(np.arange(len(boundaries)), np.diff(boundaries, prepend=0))
+    docOffsets = np.concatenate([[0], ends[boundaries[:-1] - 1]])[docIndx]
+
+    df.loc[valid, 'doc'] = docIndx
+    df.loc[valid, 'index-start'] = ends - sizes - docOffsets
+    df.loc[valid, 'index-end'] = ends - docOffsets
+
+    docs = [''.join(chunk) for chunk in np.split(payloads, boundaries[:-1])]
     return docs, df
 
 
-def extractEntities(rosetteClient, doc):
-    try:
-        params = DocumentParameters()
-        params['content'] = doc
-        params['genre'] = 'social-media'  # Text genre
-
-        results = rosetteClient.entities(params)
-        entities = results['entities']
-
-        if type(entities) is pd.Series:
-            entities = entities.iloc[0]
-        assert(type(entities) is list)
-
-    except RosetteException as ex:
-        if ex.status == 'overPlanLimit':
-            logging.error('REACHED TODAY\'S MAXIMUM (or account has reach limit)')
-            exit()
-        logging.error('> [Error] Problem in rosette')
-        logging.error(traceback.format_exc())
-    except Exception as ex:
-        logging.error(traceback.format_exc())
-
-    return entities
-
-
 def attachEntitiesToPayload(entities, df):
-
-    separationIndexes = [row['index-range'][1] for _, row in df.iterrows()]
-    df.loc[:, 'entities'] = pd.Series([[] for _ in range(df.shape[0])])
-
-    # Add entities to dataframe
-    for entity in entities:
-        entityData = entity.copy()
-        del entityData['count']
-        del entityData['mentionOffsets']
-
-        for mention in entity['mentionOffsets']:
-            # Identify payload associated with this mention
-            offset = mention['endOffset']
-            payloadIndex = bisect.bisect_left(separationIndexes, offset)
-            payloadIndex = payloadIndex-1 if payloadIndex == df.shape[0] else payloadIndex   # Handle bisect_left functionality for our case use.
-
-            # Attribute value
-            df.at[payloadIndex, 'entities'] = df.loc[payloadIndex]['entities'] + [entityData]   # Append
+    '''
+    :param entities: entities extracted from a document (Rosette format)
+    :param df: payloads of that document, as returned by generateDocuments
+    :return: df with an entities column - one entry per mention of each entity in the payload
+    '''
+    entityData = [{k: v for k, v in entity.items() if k not in ['count', 'mentionOffsets']} for entity in entities]
+    mentionEntity = np.array([it for it, entity in enumerate(entities) for _ in entity['mentionOffsets']], dtype=int)
+    mentionEnd = np.array([m['endOffset'] for entity in entities for m in entity['mentionOffsets']], dtype=int)
+
+    # Identify payload associated with each mention
+    separationIndexes = df['index-end'].to_numpy()
+    payloadIndex = np.searchsorted(separationIndexes, mentionEnd, side='left')
+    payloadIndex = np.minimum(payloadIndex, df.shape[0] - 1)   # Mentions past the last separator belong to the last payload
+
+    # Group mentions per payload, keeping their original order
+    order = np.argsort(payloadIndex, kind='stable')
+    counts = np.bincount(payloadIndex, minlength=df.shape[0])
+    groups = np.split(mentionEntity[order], np.cumsum(counts)[:-1])
+
+    df['entities'] = [[entityData[i] for i in group] for group in groups]
     return df
 
 
@@ -98,13 +89,21 @@ def randID(entities, idSize):
     return entities
 
 
-if __name__ == '__main__':
-
+def main():
+    '''
+    Extracts the entities of every payload not extracted yet and stores them in the content docs. Raises if the API quota ran out or
+    any document failed, after storing the ones that were extracted.
+    '''
     maxChars = 45000
     idSize = 6
 
-    root = logging.getLogger()
-    root.setLevel(logging.DEBUG)
+    # Extraction backend - 'regex' is a local stand-in for running/benchmarking the pipeline offline
+    backend = 'rosette'
+    numWorkers, callsPerSecond, maxRetries = 8, 10, 3
+    # Reuse results for payloads already extracted with the same backend settings
+    useCache = True
+    # Leave content that already has its entities untouched - rewriting it bumps its updatedAt (see bulkUpdate)
+    skipExtracted = True
 
     # Load config
     configDir = '../../configs/'
@@ -115,27 +114,68 @@ if __name__ == '__main__':
     client = MongoClient()
     db = client['digitalMe']
     collection = db['content']
+    collectionCache = db['entityCache']
+
+    # Extraction client - concurrent calls, limited to the API quota
+    extractor = RosetteBackend(config['rosetteKey']) if backend == 'rosette' else RegexBackend()
+    engine = ExtractionEngine(extractor, maxWorkers=numWorkers, callsPerSecond=callsPerSecond, maxRetries=maxRetries)
+    cache = EntityCache(collectionCache, extractor) if useCache is True else None
+
+    failed = 0
+    try:
+        # Payloads come one platform/content type at a time - extraction starts as soon as the first one is loaded
+        logging.info(f'Loading payloads from DB')
+        for df in iterPayloadsDfFromDB(collection, entityExtractionKeys, skipExtracted=skipExtracted):
+            if cache is not None:
+                # Only cache misses are packed into documents
+                cachedDf, df = cache.split(df)
+                updateContentDocsWithRawEntities(collection, cachedDf)
+                logging.info(f'{cachedDf.shape[0]} payloads found in cache, {df.shape[0]} left to extract')
+                if df.shape[0] == 0:
+                    continue
+
+            docs, df = generateDocuments(df, maxChars)
+
+            logging.info(f'Created {len(docs)} documents')
+            if len(docs) == 0:
+                continue
+            docDfs = df.groupby('doc')
+            # Results come back in document order
+            for it, extractedEntities in enumerate(engine.extractMany(docs)):
 
-    logging.info(f'Loading payloads from DB')
-    df = getPayloadsDfFromDB(collection, entityExtractionKeys)
-    docs, df = generateDocuments(df, maxChars)
+                if extractedEntities is None:
+                    # Failed payloads are left without entities, so the next run extracts them again
+                    logging.warning(f'Skipping iteration {it} - extraction failed')
+                    failed += 1
+                    continue
 
-    # Rosette client
-    rosetteClient = API(user_key=config['rosetteKey'])
+                docDf = docDfs.get_group(it).reset_index(drop=True)
 
-    logging.info(f'Created {len(docs)} documents')
-    for it, doc in enumerate(docs):
+                # Provide ID for the ones who aren't linked
+                extractedEntities = randID(extractedEntities, idSize)
 
-        docDf = df.loc[df['doc'] == it].reset_index(drop=True)
+                docDf = attachEntitiesToPayload(extractedEntities, docDf)
 
-        # Extract entities
-        extractedEntities = extractEntities(rosetteClient, doc)
+                updateContentDocsWithRawEntities(collection, docDf)
+                if cache is not None:
+                    cache.save(docDf)
 
-        # Provide ID for the ones who aren't linked
-        extractedEntities = randID(extractedEntities, idSize)
+                logging.info(f'Done with iteration {it} - {len(extractedEntities)} entities extracted')
 
-        docDf = attachEntitiesToPayload(extractedEntities, docDf)
+    except ExtractionQuotaExceeded:
+        logging.error('REACHED TODAY\'S MAXIMUM (or account has reach limit)')
+        raise
 
-        updateContentDocsWithRawEntities(collection, docDf)
+    if failed > 0:
+        raise Exception(f'Extraction failed for {failed} documents - run again to retry them')
 
-        logging.info(f'Done with iteration {it} - {len(extractedEntities)} entities extracted')
+
+if __name__ == '__main__':
+
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG)
+
+    try:
+        main()
+    except Exception as ex:
+        print(traceback.format_exc())
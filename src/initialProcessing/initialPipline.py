@@ -3,10 +3,12 @@ import sys
 sys.path.append(os.path.join(os.getcwd(), '..'))  # Add src/ dir to import path
 import traceback
 import logging
+import importlib
 from os.path import join
-import subprocess
 
 from libs.osLib import loadYaml
+from libs.compactGraph import graphPath
+from libs.pipelineLib import Pipeline, Step
 
 if __name__ == '__main__':
     # Set up logger
@@ -17,10 +19,30 @@ if __name__ == '__main__':
     configDir = '../../configs/'
     config = loadYaml(join(configDir, 'main.yaml'))
 
-    for script in config['initialPipeline']:
-        try:
-            logging.info(f'>>>>>>>>>>>>>>>>>> CURRENTLY RUNNING {script} <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
-            subprocess.run(f'py {join(os.getcwd(), script)}')
+    # Rerun every step, even the ones whose inputs did not change
+    force = False
 
-        except Exception as ex:
-            print(traceback.format_exc())
+    try:
+        # Raw exports of each platform - processContent reruns when any of them changes
+        platformConfigs = [join(configDir, configFile) for configFile in config['platforms'].values()]
+        dataFiles = []
+        for configFile in platformConfigs:
+            files = loadYaml(configFile)['file']
+            dataFiles += [join(config['dataDir'], f) for f in (files if type(files) is list else [files])]
+
+        sources = {'processContent': platformConfigs + dataFiles}
+        targets = {'createGraph': [graphPath(config['dataDir'])]}
+
+        # Each script's main runs in this process, one after the other - they share data through the DB, not in memory
+        steps, previous = [], []
+        for script in config['initialPipeline']:
+            name = os.path.splitext(script)[0]
+            module = importlib.import_module(name)
+            steps.append(Step(name, module.main, after=previous, sources=[module.__file__] + sources.get(name, []),
+                              targets=targets.get(name, [])))
+            previous = [name]
+
+        Pipeline(steps, statePath=join(config['dataDir'], 'pipelineState', 'initialPipeline.json')).run(force=force)
+
+    except Exception as ex:
+        print(traceback.format_exc())
@@ -11,11 +11,32 @@ class baseInterpreter():
         self.originalData = None
         self.data = None
         self.locationData = None
+        self.locationIndex = {}
+        self.streamedMinMaxTime = None
         self.debug = debug
 
     def load(self, path, name):
         pass
 
+    def loadStream(self, path, name):
+        '''
+        Streaming alternative to load - yields one record at a time instead of holding the whole file in memory.
+        :return: generator of records, in whatever shape preProcessRecord expects
+        '''
+        raise Exception('Not Implemented')
+
+    def preProcessRecord(self, record):
+        '''
+        :return: the pre-processed record, or None if it should be dropped
+        '''
+        return record
+
+    def transformRecord(self, record, termsToIgnore):
+        '''
+        :return: a content datapoint, or None if the record doesn't produce one
+        '''
+        raise Exception('Not Implemented')
+
     def preProcess(self):
         # assert(self.originalData is not None)
         # self.data = self.data.fillna('')
@@ -27,6 +48,52 @@ class baseInterpreter():
     def getContentData(self):
         return self.data
 
+    def stream(self, path, name, termsToIgnore, relevantKeysPerContentType):
+        '''
+        Streaming version of load -> preProcess -> transform -> mergeSameContent. Records are parsed one at a time and
+        passed down as a generator, so the raw files are never fully loaded into memory.
+        :return: generator of (merged) content datapoints
+        '''
+        records = self.loadStream(path, name)
+        records = (self.preProcessRecord(r) for r in records)
+        dataPoints = (self.transformRecord(r, termsToIgnore) for r in records if r is not None)
+        dataPoints = (d for d in dataPoints if d is not None)
+        return self.mergeSameContentStream(dataPoints, relevantKeysPerContentType)
+
+    def mergeSameContentStream(self, dataPoints, relevantKeysPerContentType):
+        '''
+        Generator version of mergeSameContent. Unmergable content is yielded right away, mergable content can only be
+        yielded once the whole stream has been seen - so only one instance per unique content key is kept in memory.
+        '''
+        uniqueContent, minDate, maxDate, dropped = {}, None, None, 0
+
+        for dataPoint in dataPoints:
+            minDate = dataPoint['timestamp'] if minDate is None or minDate > dataPoint['timestamp'] else minDate
+            maxDate = dataPoint['timestamp'] if maxDate is None or maxDate < dataPoint['timestamp'] else maxDate
+            dataPoint['timestamp'] = [dataPoint['timestamp']]
+
+            contentType = dataPoint['type']
+            assert(contentType in relevantKeysPerContentType.keys())
+
+            if relevantKeysPerContentType[contentType] is None:
+                # Unmergable type
+                yield dataPoint
+                continue
+
+            contentKey = tuple([dataPoint[k] for k in relevantKeysPerContentType[contentType]])
+
+            if contentKey in uniqueContent.keys():
+                uniqueContent[contentKey]['timestamp'] += dataPoint['timestamp']
+                dropped += 1
+            else:
+                uniqueContent[contentKey] = dataPoint
+
+        self.streamedMinMaxTime = (minDate, maxDate)
+        logging.info(f'Dropped a total of {dropped} datapoints by merging')
+
+        for dataPoint in uniqueContent.values():
+            yield dataPoint
+
     def mergeSameContent(self, relevantKeysPerContentType):
         uniqueContent = {}
         try:
@@ -73,6 +140,9 @@ class baseInterpreter():
         logging.info(f'Dropped a total of {origLen-len(self.data)} datapoints by merging')
 
     def getMinMaxTime(self):
+        if self.streamedMinMaxTime is not None:
+            return self.streamedMinMaxTime
+
         minDate, maxDate = None, None
         for d in self.data:
             if minDate is None and maxDate is None:
@@ -88,13 +158,22 @@ class baseInterpreter():
             datapoint['_id'] = id
 
     def extractLocations(self, sourceKeysPerContentType, sourcesToIgnore, labelByLocationKey, sourceRelationship, platform=None):
+        self.addLocations(self.data, sourceKeysPerContentType, sourcesToIgnore, labelByLocationKey, sourceRelationship,
+                          platform=platform)
+        return self.getLocationData()
+
+    def addLocations(self, contentData, sourceKeysPerContentType, sourcesToIgnore, labelByLocationKey, sourceRelationship, platform=None):
+        '''
+        Locations are accumulated across calls, so this may be called once per batch of (already saved) content.
+        :param contentData: iterable of content datapoints, each with its _id
+        '''
 
         assert(platform is not None)
 
-        output = {}
+        output = self.locationIndex
         err = []
 
-        for content in self.data:
+        for content in contentData:
             try:
 
                 sourceKeys = sourceKeysPerContentType[content['type']]
@@ -150,6 +229,7 @@ class baseInterpreter():
         if len(err) > 0:
             logging.warning(f'Found {len(err)} documents without source')
 
-        self.locationData = [dict(dt, label=k) for k, dt in output.items()]
+    def getLocationData(self):
+        self.locationData = [dict(dt, label=k) for k, dt in self.locationIndex.items()]
         return self.locationData
 
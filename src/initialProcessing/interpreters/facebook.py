@@ -1,4 +1,5 @@
 import traceback
+import logging
 from os.path import join
 import json
 from datetime import datetime as dt
@@ -14,9 +15,16 @@ from interpreters.base import baseInterpreter
 class FacebookInterpreter(baseInterpreter):
 
     def __init__(self, debug=False):
-        self.originalData = None
-        self.data = None
-        self.debug = debug
+        super().__init__(debug=debug)
+
+        # File -> (key holding the list of rows, per row pre-processing, per row transformation)
+        # Reactions are pre-processed in batch mode but never added as content, so they aren't streamed at all
+        self.streamedFiles = {
+            'comments/comments': ('comments', self._processComment, self._transformComment),
+            'posts/your_posts': ('status_updates', self._processPost, self._transformPost),
+            'posts/other_people\'s_posts_to_your_timeline': ('wall_posts_sent_to_you', self._processPostFromOtherPeople, self._transformPost),
+            'search_history/your_search_history': ('searches', self._processSearch, self._transformSearch),
+        }
 
     def load(self, path, files):
         assert (isinstance(files, list))
@@ -35,6 +43,27 @@ class FacebookInterpreter(baseInterpreter):
             dfName = fileName.split('Facebook/')[1].split('.json')[0]
             self.originalData[dfName] = data
 
+    def loadStream(self, path, files):
+        '''
+        :return: generator of (file name, row) records
+        '''
+        assert (isinstance(files, list))
+
+        for fileName in files:
+            dfName = fileName.split('Facebook/')[1].split('.json')[0]
+            if dfName not in self.streamedFiles.keys():
+                continue
+
+            rowsKey = self.streamedFiles[dfName][0]
+            records = (ut.parseObj(row) for row in ut.loadJSONStream(join(path, fileName), prefix=f'{rowsKey}.item'))
+
+            if self.debug:
+                print('Dropping 90% DF')
+                records = ut.dropByPercentageStream(records, 0.9)
+
+            for row in records:
+                yield dfName, row
+
     def preProcess(self):
         assert(self.originalData is not None)
         assert('comments/comments' in self.originalData.keys())
@@ -52,6 +81,11 @@ class FacebookInterpreter(baseInterpreter):
         self.originalData['search_history/your_search_history'] = self._processSearches()
         # self.originalData['your_event_responses'] = self._processEvents()
 
+    def preProcessRecord(self, record):
+        dfName, row = record
+        row = self.streamedFiles[dfName][1](row)
+        return None if row is None else (dfName, row)
+
     def transform(self, termsToIgnore):
         self.data = []
 
@@ -61,214 +95,236 @@ class FacebookInterpreter(baseInterpreter):
         # self._addEvents()
         # self._addCommentsPostsInGroups()
 
+    def transformRecord(self, record, termsToIgnore):
+        dfName, row = record
+        return self.streamedFiles[dfName][2](row)
+
+    @staticmethod
+    def _processRows(rows, processRow):
+        processed = [processRow(row) for row in rows]
+        return [row for row in processed if row is not None]
+
+    def _addRows(self, rows, transformRow):
+        for row in rows:
+            newDataPoint = transformRow(row)
+            if newDataPoint is not None:
+                self.data.append(newDataPoint)
+
     # ----
     def _processComments(self):
-        data = []
-        for row in self.originalData['comments/comments']['comments']:
-            try:
-                # Extract relevant data from array form
-                dataPoint = row['data'][0]['comment']
+        return self._processRows(self.originalData['comments/comments']['comments'], self._processComment)
 
-                if dataPoint['timestamp'] == 0:
-                    # Ignore faulty timestamps - nothing we can do here
-                    continue
+    def _processComment(self, row):
+        try:
+            # Extract relevant data from array form
+            dataPoint = row['data'][0]['comment']
 
-                if dt.fromtimestamp(dataPoint['timestamp']).year > 2020 or dt.fromtimestamp(dataPoint['timestamp']).year < 2010:
-                    breakpoint()
+            if dataPoint['timestamp'] == 0:
+                # Ignore faulty timestamps - nothing we can do here
+                return None
 
-                dataPoint['timestamp'] = dt.fromtimestamp(dataPoint['timestamp'])
+            if dt.fromtimestamp(dataPoint['timestamp']).year > 2020 or dt.fromtimestamp(dataPoint['timestamp']).year < 2010:
+                # Runs in a worker process (no stdin) - skip the comment instead of stopping
+                logging.warning(f'Skipping comment with unexpected timestamp {dt.fromtimestamp(dataPoint["timestamp"])}')
+                return None
 
-                dataPoint['comment'] = '' if 'comment' not in dataPoint.keys() else dataPoint['comment']    # Some comments without any text (just attachments)
+            dataPoint['timestamp'] = dt.fromtimestamp(dataPoint['timestamp'])
 
-                dataPoint['attachments'] = [attach['data'] for attach in row['attachments']] if 'attachments' in row.keys() else []
+            dataPoint['comment'] = '' if 'comment' not in dataPoint.keys() else dataPoint['comment']    # Some comments without any text (just attachments)
 
-                if 'group' in dataPoint.keys():
-                    dataPoint['targetContentFbLocation'] = dataPoint['group']
+            dataPoint['attachments'] = [attach['data'] for attach in row['attachments']] if 'attachments' in row.keys() else []
 
-               # Process text to extract comment's context
-                type, action, author = ut.extractContextFromFBComment(row['title'])
+            if 'group' in dataPoint.keys():
+                dataPoint['targetContentFbLocation'] = dataPoint['group']
 
-                dataPoint['userAction'] = action    # It's always the same here, but usefull to add for standardization
-                dataPoint['targetContentType'] = type
-                dataPoint['targetContentAuthor'] = author
+           # Process text to extract comment's context
+            type, action, author = ut.extractContextFromFBComment(row['title'])
 
-                data.append(dataPoint)
-            except Exception as ex:
-                print(traceback.format_exc())
+            dataPoint['userAction'] = action    # It's always the same here, but usefull to add for standardization
+            dataPoint['targetContentType'] = type
+            dataPoint['targetContentAuthor'] = author
 
-        return data
+            return dataPoint
+        except Exception as ex:
+            print(traceback.format_exc())
 
     def _addComments(self):
-        for row in self.originalData['comments/comments']:
-            try:
-                newDataPoint = {
-                    'platform': 'Facebook',
-                    'timestamp': row['timestamp'],
-                    'type': 'Comment',
-                    'body': row['comment'],
-                    'attachments': row['attachments'],
+        self._addRows(self.originalData['comments/comments'], self._transformComment)
 
-                    'userAction': row['userAction'],
-                    'targetContentType': row['targetContentType'],
-                    'targetContentAuthor': row['targetContentAuthor'],
-                }
+    def _transformComment(self, row):
+        try:
+            newDataPoint = {
+                'platform': 'Facebook',
+                'timestamp': row['timestamp'],
+                'type': 'Comment',
+                'body': row['comment'],
+                'attachments': row['attachments'],
 
-                if 'targetContentFbLocation' in row.keys():
-                    newDataPoint['targetContentFbLocation'] = row['targetContentFbLocation']
+                'userAction': row['userAction'],
+                'targetContentType': row['targetContentType'],
+                'targetContentAuthor': row['targetContentAuthor'],
+            }
 
-                self.data.append(newDataPoint)
-            except Exception as ex:
-                print(traceback.format_exc())
+            if 'targetContentFbLocation' in row.keys():
+                newDataPoint['targetContentFbLocation'] = row['targetContentFbLocation']
+
+            return newDataPoint
+        except Exception as ex:
+            print(traceback.format_exc())
 
     # ----
     def _processPosts(self):
-        data = []
-        for row in self.originalData['posts/your_posts']['status_updates']:
-            try:
-                # Extract relevant data from array form
-                if 'data' in row.keys():
-                    row['post'] = row['data'][0]['post'] if 'post' in row['data'][0].keys() else ''
-                    # Only position 0 matters, the others are just regarding updates (edits)
-                    del row['data']
-                else:
-                    continue
-
-                if row['timestamp'] == 0:
-                    # Ignore faulty timestamps - nothing we can do here
-                    continue
-
-                row['timestamp'] = dt.fromtimestamp(row['timestamp'])
-
-                row['attachments'] = [attach['data'] for attach in row['attachments']] if 'attachments' in row.keys() else []
-
-                row['mentions'] = row['tags'] if 'tags' in row.keys() else []
-
-                if 'title' in row.keys():
-                    actionPerformedByUser, targetContentType, targetContentFbLocation, extraMentions = ut.extractContextFromFbSelfPosts(row['title'])
-                    row['mentions'] += extraMentions   # Currently the only use for this is to add another user's name when we post smtg on their timeline
-                else:
-                    # Assuming the following from what I inspected
-                    actionPerformedByUser, targetContentType, targetContentFbLocation = 'Posted', 'Post', 'Self Timeline'
-
-                row['userAction'] = actionPerformedByUser
-                row['targetContentType'] = targetContentType
-                row['targetContentAuthor'] = 'Self'
-                row['targetContentFbLocation'] = targetContentFbLocation
-                data.append(row)
-
-            except NothingToDo:
-                data.append(row)
-            except Ignore:
-                pass
-            except Exception as ex:
-                print(traceback.format_exc())
-        return data
+        return self._processRows(self.originalData['posts/your_posts']['status_updates'], self._processPost)
+
+    def _processPost(self, row):
+        try:
+            # Extract relevant data from array form
+            if 'data' in row.keys():
+                row['post'] = row['data'][0]['post'] if 'post' in row['data'][0].keys() else ''
+                # Only position 0 matters, the others are just regarding updates (edits)
+                del row['data']
+            else:
+                return None
+
+            if row['timestamp'] == 0:
+                # Ignore faulty timestamps - nothing we can do here
+                return None
+
+            row['timestamp'] = dt.fromtimestamp(row['timestamp'])
+
+            row['attachments'] = [attach['data'] for attach in row['attachments']] if 'attachments' in row.keys() else []
+
+            row['mentions'] = row['tags'] if 'tags' in row.keys() else []
+
+            if 'title' in row.keys():
+                actionPerformedByUser, targetContentType, targetContentFbLocation, extraMentions = ut.extractContextFromFbSelfPosts(row['title'])
+                row['mentions'] += extraMentions   # Currently the only use for this is to add another user's name when we post smtg on their timeline
+            else:
+                # Assuming the following from what I inspected
+                actionPerformedByUser, targetContentType, targetContentFbLocation = 'Posted', 'Post', 'Self Timeline'
+
+            row['userAction'] = actionPerformedByUser
+            row['targetContentType'] = targetContentType
+            row['targetContentAuthor'] = 'Self'
+            row['targetContentFbLocation'] = targetContentFbLocation
+            return row
+
+        except NothingToDo:
+            return row
+        except Ignore:
+            pass
+        except Exception as ex:
+            print(traceback.format_exc())
 
     def _processPostsFromOtherPeople(self):
-        data = []
-        for row in self.originalData['posts/other_people\'s_posts_to_your_timeline']['wall_posts_sent_to_you']:
-            try:
-                # Extract relevant data from array form
-                if 'data' in row.keys():
-                    row['post'] = row['data'][0]['post'] if 'post' in row['data'][0].keys() else ''
-                    # Only position 0 matters, the others are just regarding updates (edits)
-                    del row['data']
-                else:
-                    continue
-
-                if row['timestamp'] == 0:
-                    # Ignore faulty timestamps - nothing we can do here
-                    continue
-
-                row['timestamp'] = dt.fromtimestamp(row['timestamp'])
-
-                row['attachments'] = [attach['data'] for attach in row['attachments']] if 'attachments' in row.keys() else []
-
-                row['mentions'] = row['tags'] if 'tags' in row.keys() else []
-
-                if 'title' in row.keys():
-                    actionByFriend, targetContentType, targetContentFbLocation, targetContentAuthor = \
-                        ut.extractContextFromFbOthersPosts(row['title'])
-                else:
-                    raise UnexpectedFBPost
-
-                row['actionByFriend'] = actionByFriend
-                row['targetContentType'] = targetContentType
-                row['targetContentAuthor'] = targetContentAuthor
-                row['targetContentFbLocation'] = targetContentFbLocation
-                data.append(row)
-
-            except Ignore:
-                pass
-            except Exception as ex:
-                print(traceback.format_exc())
-        return data
+        return self._processRows(self.originalData['posts/other_people\'s_posts_to_your_timeline']['wall_posts_sent_to_you'],
+                                 self._processPostFromOtherPeople)
+
+    def _processPostFromOtherPeople(self, row):
+        try:
+            # Extract relevant data from array form
+            if 'data' in row.keys():
+                row['post'] = row['data'][0]['post'] if 'post' in row['data'][0].keys() else ''
+                # Only position 0 matters, the others are just regarding updates (edits)
+                del row['data']
+            else:
+                return None
+
+            if row['timestamp'] == 0:
+                # Ignore faulty timestamps - nothing we can do here
+                return None
+
+            row['timestamp'] = dt.fromtimestamp(row['timestamp'])
+
+            row['attachments'] = [attach['data'] for attach in row['attachments']] if 'attachments' in row.keys() else []
+
+            row['mentions'] = row['tags'] if 'tags' in row.keys() else []
+
+            if 'title' in row.keys():
+                actionByFriend, targetContentType, targetContentFbLocation, targetContentAuthor = \
+                    ut.extractContextFromFbOthersPosts(row['title'])
+            else:
+                raise UnexpectedFBPost
+
+            row['actionByFriend'] = actionByFriend
+            row['targetContentType'] = targetContentType
+            row['targetContentAuthor'] = targetContentAuthor
+            row['targetContentFbLocation'] = targetContentFbLocation
+            return row
+
+        except Ignore:
+            pass
+        except Exception as ex:
+            print(traceback.format_exc())
 
     def _addPosts(self):
-        for row in self.originalData['posts/your_posts'] + self.originalData['posts/other_people\'s_posts_to_your_timeline']:
-            try:
-                if len(row['attachments']) == 0 and len(row['mentions']) == 0 and row['post'] == '':
-                    continue
+        self._addRows(self.originalData['posts/your_posts'] + self.originalData['posts/other_people\'s_posts_to_your_timeline'],
+                      self._transformPost)
 
-                newDataPoint = {
-                    'platform': 'Facebook',
-                    'timestamp': row['timestamp'],
-                    'type': 'Post',
-                    'body': row['post'],
-                    'attachments': row['attachments'],
-                    'mentions': row['mentions'],
+    def _transformPost(self, row):
+        try:
+            if len(row['attachments']) == 0 and len(row['mentions']) == 0 and row['post'] == '':
+                return None
 
-                    'targetContentType': row['targetContentType'],
-                    'targetContentAuthor': row['targetContentAuthor'],
-                    'targetContentFbLocation': row['targetContentFbLocation']
-                }
+            newDataPoint = {
+                'platform': 'Facebook',
+                'timestamp': row['timestamp'],
+                'type': 'Post',
+                'body': row['post'],
+                'attachments': row['attachments'],
+                'mentions': row['mentions'],
 
-                if 'actionByFriend' in row.keys():
-                    row['actionByFriend'] = row['actionByFriend']
+                'targetContentType': row['targetContentType'],
+                'targetContentAuthor': row['targetContentAuthor'],
+                'targetContentFbLocation': row['targetContentFbLocation']
+            }
 
-                if 'userAction' in row.keys():
-                    row['userAction'] = row['userAction']
+            if 'actionByFriend' in row.keys():
+                row['actionByFriend'] = row['actionByFriend']
 
-                self.data.append(newDataPoint)
-            except Exception as ex:
-                print(traceback.format_exc())
+            if 'userAction' in row.keys():
+                row['userAction'] = row['userAction']
+
+            return newDataPoint
+        except Exception as ex:
+            print(traceback.format_exc())
 
     # ----
     def _processReactions(self):
-        data = []
-        for row in self.originalData['likes_and_reactions/posts_and_comments']['reactions']:
-            try:
-                # Extract relevant data from array form
-                if 'data' in row.keys() and 'reaction' in row['data'][0].keys():
-                    row['post'] = row['data'][0]['reaction']
-                    # Only position 0 matters, the others are just regarding updates (edits)
-                    del row['data']
-                else:
-                    continue
+        return self._processRows(self.originalData['likes_and_reactions/posts_and_comments']['reactions'], self._processReaction)
 
-                if row['timestamp'] == 0:
-                    # Ignore faulty timestamps - nothing we can do here
-                    continue
+    def _processReaction(self, row):
+        try:
+            # Extract relevant data from array form
+            if 'data' in row.keys() and 'reaction' in row['data'][0].keys():
+                row['post'] = row['data'][0]['reaction']
+                # Only position 0 matters, the others are just regarding updates (edits)
+                del row['data']
+            else:
+                return None
 
-                row['timestamp'] = dt.fromtimestamp(row['timestamp'])
+            if row['timestamp'] == 0:
+                # Ignore faulty timestamps - nothing we can do here
+                return None
 
-                if 'title' in row.keys():
-                    targetContentType, targetContentAuthor, targetContentLocation = ut.extractContextFromReactions(row['title'])
-                else:
-                    raise UnexpectedFBReaction
+            row['timestamp'] = dt.fromtimestamp(row['timestamp'])
 
-                row['targetContentType'] = targetContentType
-                row['targetContentAuthor'] = targetContentAuthor
+            if 'title' in row.keys():
+                targetContentType, targetContentAuthor, targetContentLocation = ut.extractContextFromReactions(row['title'])
+            else:
+                raise UnexpectedFBReaction
 
-                if targetContentLocation is not None:
-                    row['targetContentFbLocation'] = targetContentLocation
+            row['targetContentType'] = targetContentType
+            row['targetContentAuthor'] = targetContentAuthor
 
-                data.append(row)
-            except Ignore:
-                pass
-            except Exception as ex:
-                print(traceback.format_exc())
-        return data
+            if targetContentLocation is not None:
+                row['targetContentFbLocation'] = targetContentLocation
+
+            return row
+        except Ignore:
+            pass
+        except Exception as ex:
+            print(traceback.format_exc())
 
     def _AddReactions(self):
         for row in self.originalData['likes_and_reactions/posts_and_comments']:
@@ -295,42 +351,44 @@ class FacebookInterpreter(baseInterpreter):
 
     # ----
     def _processSearches(self):
-        data = []
-        for row in self.originalData['search_history/your_search_history']['searches']:
-            try:
-                if 'data' not in row.keys():
-                    if 'title' not in row.keys():
-                        continue
-                    else:
-                        payload = row['title'].replace('You searched for ', '')
+        return self._processRows(self.originalData['search_history/your_search_history']['searches'], self._processSearch)
+
+    def _processSearch(self, row):
+        try:
+            if 'data' not in row.keys():
+                if 'title' not in row.keys():
+                    return None
                 else:
-                     payload = row['data'][0]['text']
+                    payload = row['title'].replace('You searched for ', '')
+            else:
+                 payload = row['data'][0]['text']
 
-                row['data'] = payload
+            row['data'] = payload
 
-                if row['timestamp'] == 0:
-                    # Ignore faulty timestamps - nothing we can do here
-                    continue
+            if row['timestamp'] == 0:
+                # Ignore faulty timestamps - nothing we can do here
+                return None
 
-                row['timestamp'] = dt.fromtimestamp(row['timestamp'])
-                r=1
+            row['timestamp'] = dt.fromtimestamp(row['timestamp'])
+            return row
 
-            except Exception as ex:
-                print(traceback.format_exc())
-        return data
+        except Exception as ex:
+            print(traceback.format_exc())
 
     def _addSearches(self):
-        for row in self.originalData['search_history/your_search_history']:
-            try:
-                newDataPoint = {
-                    'platform': 'Facebook',
-                    'timestamp': row['timestamp'],
-                    'type': 'Query',
-                    'query': row['data'],
-                }
-                self.data.append(newDataPoint)
-            except Exception as ex:
-                print(traceback.format_exc())
+        self._addRows(self.originalData['search_history/your_search_history'], self._transformSearch)
+
+    def _transformSearch(self, row):
+        try:
+            newDataPoint = {
+                'platform': 'Facebook',
+                'timestamp': row['timestamp'],
+                'type': 'Query',
+                'query': row['data'],
+            }
+            return newDataPoint
+        except Exception as ex:
+            print(traceback.format_exc())
 
     """
     # ----
@@ -339,7 +397,8 @@ class FacebookInterpreter(baseInterpreter):
         for row in self.originalData['your_event_responses']:
             try:
                 if dt.fromtimestamp(row['start_timestamp']).year > 2020 or dt.fromtimestamp(row['start_timestamp']).year < 2010:
-                    breakpoint()
+                    logging.warning(f'Skipping event with unexpected start {dt.fromtimestamp(row["start_timestamp"])}')
+                    continue
                 row['timestamp'] = dt.fromtimestamp(row['timestamp'])
 
                 row['start_timestamp'] = dt.fromtimestamp(row['start_timestamp'])
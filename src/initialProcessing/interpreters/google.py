@@ -6,15 +6,14 @@ import pandas as pd
 from pymongo import MongoClient
 
 from interpreters.base import baseInterpreter
-from libs.utilsInitialProcessing import dropByPercentageJSON, detectAndExtractSubstrings, cleanUrl
+from libs.utilsInitialProcessing import dropByPercentageJSON, dropByPercentageStream, loadJSONStream, \
+    detectAndExtractSubstrings, cleanUrl
 from libs.customExceptions import NoMatch
 
 class GoogleInterpreter(baseInterpreter):
 
     def __init__(self, debug=False):
-        self.originalData = None
-        self.data = None
-        self.debug = debug
+        super().__init__(debug=debug)
 
         self.actionToContentType = {
             'Searched for': 'Query',
@@ -33,57 +32,76 @@ class GoogleInterpreter(baseInterpreter):
 
         self.originalData = data
 
+    def loadStream(self, path, name):
+        assert(isinstance(name, str))
+        records = loadJSONStream(join(path, name))
+
+        if self.debug:
+            print('Dropping 90% DF')
+            records = dropByPercentageStream(records, 0.9)
+
+        return records
+
     def preProcess(self):
         assert(self.originalData is not None)
 
         for row in self.originalData:
-            row['time'] = pd.to_datetime(row['time'])
+            self.preProcessRecord(row)
+
+    def preProcessRecord(self, row):
+        row['time'] = pd.to_datetime(row['time'])
+        return row
 
     def transform(self, termsToIgnore):
 
         self.data = []
         for row in self.originalData:
-            try:
-                # Check if item is valid
-                if len([term for term in termsToIgnore if term in row['title']]) > 0:
-                    continue
-
-                # Extract action from payload
-                action, textualFeature = detectAndExtractSubstrings(['Searched for', 'Visited'], row['title'])
-
-                # Define variables accordingly
-                contentType = self.actionToContentType[action]
-
-                if contentType == 'Query':
-                    # Create datapoint
-                    newDataPoint = {
-                        'platform': 'Google Search',
-                        'timestamp': row['time'],
-                        'type': contentType,
-                        'query': textualFeature,
-                    }
-                elif contentType == 'Webpage':
-                    # Remove useless part of URL inherent to the dataset
-                    url = row['titleUrl'].replace('https://www.google.com/url?q=', '')
-                    url = cleanUrl(url)
-
-                    # Create datapoint
-                    newDataPoint = {
-                            'platform': 'Google Search',
-                        'timestamp': row['time'],
-                        'type': contentType,
-                        'title': textualFeature,
-                        'url': url,
-                    }
-                else:
-                    raise Exception(f'Unknown content type: {contentType}')
-
+            newDataPoint = self.transformRecord(row, termsToIgnore)
+            if newDataPoint is not None:
                 self.data.append(newDataPoint)
 
-            except NoMatch:
-                continue
-            except Exception as ex:
-                print(traceback.format_exc())
+    def transformRecord(self, row, termsToIgnore):
+        try:
+            # Check if item is valid
+            if len([term for term in termsToIgnore if term in row['title']]) > 0:
+                return None
+
+            # Extract action from payload
+            action, textualFeature = detectAndExtractSubstrings(['Searched for', 'Visited'], row['title'])
+
+            # Define variables accordingly
+            contentType = self.actionToContentType[action]
+
+            if contentType == 'Query':
+                # Create datapoint
+                newDataPoint = {
+                    'platform': 'Google Search',
+                    'timestamp': row['time'],
+                    'type': contentType,
+                    'query': textualFeature,
+                }
+            elif contentType == 'Webpage':
+                # Remove useless part of URL inherent to the dataset
+                url = row['titleUrl'].replace('https://www.google.com/url?q=', '')
+                url = cleanUrl(url)
+
+                # Create datapoint
+                newDataPoint = {
+                        'platform': 'Google Search',
+                    'timestamp': row['time'],
+                    'type': contentType,
+                    'title': textualFeature,
+                    'url': url,
+                }
+            else:
+                raise Exception(f'Unknown content type: {contentType}')
+
+            return newDataPoint
+
+        except NoMatch:
+            return None
+        except Exception as ex:
+            print(traceback.format_exc())
 
 
 
@@ -5,14 +5,13 @@ import pandas as pd
 from pymongo import MongoClient
 
 from interpreters.base import baseInterpreter
-from libs.utilsInitialProcessing import dropByPercentageDF
+from libs.utilsInitialProcessing import dropByPercentageDF, dropByPercentageStream
 
 class RedditInterpreter(baseInterpreter):
 
     def __init__(self, debug=False):
-        self.originalData = None
-        self.data = None
-        self.debug = debug
+        super().__init__(debug=debug)
+        self.csvChunkSize = 10000
 
     def load(self, path, files):
         assert (isinstance(files, list))
@@ -29,35 +28,71 @@ class RedditInterpreter(baseInterpreter):
             dfName = fileName.split('Reddit/')[1].split('.csv')[0]
             self.originalData[dfName] = df
 
+    def loadStream(self, path, files):
+        '''
+        :return: generator of (file name, row) records - the CSVs are read in chunks of csvChunkSize rows
+        '''
+        assert (isinstance(files, list))
+
+        for fileName in files:
+            dfName = fileName.split('Reddit/')[1].split('.csv')[0]
+            chunks = pd.read_csv(join(path, fileName), parse_dates=['date'], chunksize=self.csvChunkSize)
+            records = (row for chunk in chunks for row in chunk.to_dict('records'))
+
+            if self.debug:
+                print('Dropping 90% DF')
+                records = dropByPercentageStream(records, 0.9)
+
+            for row in records:
+                yield dfName, row
+
     def transform(self, termsToIgnore):
         assert('comments' in self.originalData.keys() and 'posts' in self.originalData.keys())
         self.data = []
         for index, row in self.originalData['comments'].iterrows():
-            try:
-                newDataPoint = {
-                    'platform': 'Reddit',
-                    'timestamp': row['date'],
-                    'type': 'Comment',
-                    'body': row['body'],
-                    'subreddit': row['subreddit'],
-                    'url': row['permalink'],
-                }
+            newDataPoint = self._transformComment(row)
+            if newDataPoint is not None:
                 self.data.append(newDataPoint)
-            except Exception as ex:
-                print(traceback.format_exc())
 
         for index, row in self.originalData['posts'].iterrows():
-            try:
-                newDataPoint = {
-                    'platform': 'Reddit',
-                    'timestamp': row['date'],
-                    'type': 'Post',
-                    'title': row['title'],
-                    'body': row['body'],
-                    'subreddit': row['subreddit'],
-                    'url': row['permalink'],
-                }
+            newDataPoint = self._transformPost(row)
+            if newDataPoint is not None:
                 self.data.append(newDataPoint)
-            except Exception as ex:
-                print(traceback.format_exc())
+
+    def transformRecord(self, record, termsToIgnore):
+        dfName, row = record
+        if dfName == 'comments':
+            return self._transformComment(row)
+        elif dfName == 'posts':
+            return self._transformPost(row)
+        return None
+
+    def _transformComment(self, row):
+        try:
+            newDataPoint = {
+                'platform': 'Reddit',
+                'timestamp': row['date'],
+                'type': 'Comment',
+                'body': row['body'],
+                'subreddit': row['subreddit'],
+                'url': row['permalink'],
+            }
+            return newDataPoint
+        except Exception as ex:
+            print(traceback.format_exc())
+
+    def _transformPost(self, row):
+        try:
+            newDataPoint = {
+                'platform': 'Reddit',
+                'timestamp': row['date'],
+                'type': 'Post',
+                'title': row['title'],
+                'body': row['body'],
+                'subreddit': row['subreddit'],
+                'url': row['permalink'],
+            }
+            return newDataPoint
+        except Exception as ex:
+            print(traceback.format_exc())
 
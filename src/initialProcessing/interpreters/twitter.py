@@ -6,15 +6,13 @@ import pandas as pd
 from pymongo import MongoClient
 
 from interpreters.base import baseInterpreter
-from libs.utilsInitialProcessing import dropByPercentageJSON
+from libs.utilsInitialProcessing import dropByPercentageJSON, dropByPercentageStream, loadJSONStream
 
 
 class TwitterInterpreter(baseInterpreter):
 
     def __init__(self, debug=False):
-        self.originalData = None
-        self.data = None
-        self.debug = debug
+        super().__init__(debug=debug)
 
     def load(self, path, files):
         assert (isinstance(files, list))
@@ -32,68 +30,102 @@ class TwitterInterpreter(baseInterpreter):
             dfName = fileName.split('Twitter/')[1].split('.json')[0]
             self.originalData[dfName] = data
 
-    def preProcess(self):
-        assert(self.originalData is not None)
-        assert('tweet' in self.originalData.keys())
-
-        tweetsData = []
-        for row in self.originalData['tweet']:
-            try:
-                dataPoint = row['tweet']
-
-                dataPoint['created_at'] = pd.to_datetime(dataPoint['created_at'])
+    def loadStream(self, path, files):
+        '''
+        :return: generator of (file name, row) records
+        '''
+        assert (isinstance(files, list))
 
-                # Drop useless stuff
-                del dataPoint['retweeted']
-                del dataPoint['favorited']
-                del dataPoint['source']
-                del dataPoint['truncated']
-                del dataPoint['id_str']
-                del dataPoint['id']
-                del dataPoint['display_text_range']
+        for fileName in files:
+            records = loadJSONStream(join(path, fileName))
 
-                if 'possibly_sensitive' in dataPoint.keys():
-                    del dataPoint['possibly_sensitive']
-                if 'in_reply_to_status_id_str' in dataPoint.keys():
-                    del dataPoint['in_reply_to_status_id_str']
-                if 'in_reply_to_user_id_str' in dataPoint.keys():
-                    del dataPoint['in_reply_to_user_id_str']
+            if self.debug:
+                print('Dropping 90% DF')
+                records = dropByPercentageStream(records, 0.9)
 
-                # Change to proper data types
-                dataPoint['retweet_count'] = int(dataPoint['retweet_count'])
-                dataPoint['favorite_count'] = int(dataPoint['favorite_count'])
+            dfName = fileName.split('Twitter/')[1].split('.json')[0]
+            for row in records:
+                yield dfName, row
 
-                # Simplify entitites
-                dataPoint['mentions'] = [u['screen_name'] for u in dataPoint['entities']['user_mentions']]
-                dataPoint['hashtags'] = [h['text'] for h in dataPoint['entities']['hashtags']]
-                dataPoint['urls'] = [u['expanded_url'] for u in dataPoint['entities']['urls']]
+    def preProcess(self):
+        assert(self.originalData is not None)
+        assert('tweet' in self.originalData.keys())
 
-                tweetsData.append(dataPoint)
+        tweetsData = [self._processTweet(row) for row in self.originalData['tweet']]
+        self.originalData['tweet'] = [dataPoint for dataPoint in tweetsData if dataPoint is not None]
 
-            except Exception as ex:
-                print(traceback.format_exc())
+    def preProcessRecord(self, record):
+        dfName, row = record
+        if dfName != 'tweet':
+            return None
 
-        self.originalData['tweet'] = tweetsData
+        dataPoint = self._processTweet(row)
+        return None if dataPoint is None else (dfName, dataPoint)
 
     def transform(self, termsToIgnore):
         assert('tweet' in self.originalData.keys())
 
         self.data = []
         for row in self.originalData['tweet']:
-            try:
-                newDataPoint = {
-                    'platform': 'Twitter',
-                    'timestamp': row['created_at'],
-                    'type': 'Post',
-                    'body': row['full_text'],
-                    'likes': row['favorite_count'],
-                    'retweets': row['retweet_count'],
-                    'language': row['lang'],
-                    'hashtags': row['hashtags'],
-                    'userMentions': row['mentions'],
-                    'mentionedUrls': row['urls'],
-                    'symbols': row['entities']['symbols'],
-                }
+            newDataPoint = self._transformTweet(row)
+            if newDataPoint is not None:
                 self.data.append(newDataPoint)
-            except Exception as ex:
-                print(traceback.format_exc())
+
+    def transformRecord(self, record, termsToIgnore):
+        dfName, row = record
+        return self._transformTweet(row)
+
+    def _processTweet(self, row):
+        try:
+            dataPoint = row['tweet']
+
+            dataPoint['created_at'] = pd.to_datetime(dataPoint['created_at'])
+
+            # Drop useless stuff
+            del dataPoint['retweeted']
+            del dataPoint['favorited']
+            del dataPoint['source']
+            del dataPoint['truncated']
+            del dataPoint['id_str']
+            del dataPoint['id']
+            del dataPoint['display_text_range']
+
+            if 'possibly_sensitive' in dataPoint.keys():
+                del dataPoint['possibly_sensitive']
+            if 'in_reply_to_status_id_str' in dataPoint.keys():
+                del dataPoint['in_reply_to_status_id_str']
+            if 'in_reply_to_user_id_str' in dataPoint.keys():
+                del dataPoint['in_reply_to_user_id_str']
+
+            # Change to proper data types
+            dataPoint['retweet_count'] = int(dataPoint['retweet_count'])
+            dataPoint['favorite_count'] = int(dataPoint['favorite_count'])
+
+            # Simplify entitites
+            dataPoint['mentions'] = [u['screen_name'] for u in dataPoint['entities']['user_mentions']]
+            dataPoint['hashtags'] = [h['text'] for h in dataPoint['entities']['hashtags']]
+            dataPoint['urls'] = [u['expanded_url'] for u in dataPoint['entities']['urls']]
+
+            return dataPoint
+
+        except Exception as ex:
+            print(traceback.format_exc())
+
+    def _transformTweet(self, row):
+        try:
+            newDataPoint = {
+                'platform': 'Twitter',
+                'timestamp': row['created_at'],
+                'type': 'Post',
+                'body': row['full_text'],
+                'likes': row['favorite_count'],
+                'retweets': row['retweet_count'],
+                'language': row['lang'],
+                'hashtags': row['hashtags'],
+                'userMentions': row['mentions'],
+                'mentionedUrls': row['urls'],
+                'symbols': row['entities']['symbols'],
+            }
+            return newDataPoint
+        except Exception as ex:
+            print(traceback.format_exc())
@@ -7,15 +7,14 @@ from pymongo import MongoClient
 import json
 
 from interpreters.base import baseInterpreter
-from libs.utilsInitialProcessing import dropByPercentageJSON, detectAndExtractSubstrings, fromDictToDf
+from libs.utilsInitialProcessing import dropByPercentageJSON, dropByPercentageStream, loadJSONStream, \
+    detectAndExtractSubstrings, fromDictToDf
 from libs.customExceptions import NoYtChannel
 
 class YoutubeInterpreter(baseInterpreter):
 
     def __init__(self, debug=False):
-        self.originalData = None
-        self.data = None
-        self.debug = debug
+        super().__init__(debug=debug)
         self.actionToContentType = {
             'Searched for': 'Query',
             'Watched': 'Video',
@@ -33,56 +32,75 @@ class YoutubeInterpreter(baseInterpreter):
 
         self.originalData = data
 
+    def loadStream(self, path, name):
+        assert(isinstance(name, str))
+        records = loadJSONStream(join(path, name))
+
+        if self.debug:
+            logging.warning('Dropping 90% DF')
+            records = dropByPercentageStream(records, 0.9)
+
+        return records
+
     def preProcess(self):
         assert(self.originalData is not None)
         for row in self.originalData:
-            row['time'] = pd.to_datetime(row['time'])
+            self.preProcessRecord(row)
+
+    def preProcessRecord(self, row):
+        row['time'] = pd.to_datetime(row['time'])
+        return row
 
     def transform(self, termsToIgnore):
         self.data = []
         for row in self.originalData:
-            try:
-                # Check if item is valid
-                if len([term for term in termsToIgnore if term in row['title']]) > 0:
-                    continue
-
-                # Extract action from payload
-                action, textualFeature = detectAndExtractSubstrings(["Searched for", "Watched"], row['title'])
-
-                # Define variables accordingly
-                contentType = self.actionToContentType[action]
-
-                if contentType == 'Video':
-                    # Extract youtube channel
-                    if 'subtitles' in row.keys() and isinstance(row['subtitles'], (list, tuple)):
-                        channel = row['subtitles'][0]['name']
-                    else:
-                        raise NoYtChannel
-
-                    # Create datapoint
-                    newDataPoint = {
-                        'platform': 'YouTube',
-                        'timestamp': row['time'],
-                        'type': contentType,
-                        'title': textualFeature,
-                        'url': row['titleUrl'],
-                        'channel': channel,
-                    }
-                elif contentType == 'Query':
-                    newDataPoint = {
-                        'platform': 'YouTube',
-                        'timestamp': row['time'],
-                        'type': contentType,
-                        'query': textualFeature,
-                        'url': row['titleUrl'],
-                    }
-                else:
-                    raise Exception(f'Unknown content type: {contentType}')
-
+            newDataPoint = self.transformRecord(row, termsToIgnore)
+            if newDataPoint is not None:
                 self.data.append(newDataPoint)
 
-            except NoYtChannel:
-                continue
+    def transformRecord(self, row, termsToIgnore):
+        try:
+            # Check if item is valid
+            if len([term for term in termsToIgnore if term in row['title']]) > 0:
+                return None
 
-            except Exception as ex:
-                logging.error(traceback.format_exc())
\ No newline at end of file
+            # Extract action from payload
+            action, textualFeature = detectAndExtractSubstrings(["Searched for", "Watched"], row['title'])
+
+            # Define variables accordingly
+            contentType = self.actionToContentType[action]
+
+            if contentType == 'Video':
+                # Extract youtube channel
+                if 'subtitles' in row.keys() and isinstance(row['subtitles'], (list, tuple)):
+                    channel = row['subtitles'][0]['name']
+                else:
+                    raise NoYtChannel
+
+                # Create datapoint
+                newDataPoint = {
+                    'platform': 'YouTube',
+                    'timestamp': row['time'],
+                    'type': contentType,
+                    'title': textualFeature,
+                    'url': row['titleUrl'],
+                    'channel': channel,
+                }
+            elif contentType == 'Query':
+                newDataPoint = {
+                    'platform': 'YouTube',
+                    'timestamp': row['time'],
+                    'type': contentType,
+                    'query': textualFeature,
+                    'url': row['titleUrl'],
+                }
+            else:
+                raise Exception(f'Unknown content type: {contentType}')
+
+            return newDataPoint
+
+        except NoYtChannel:
+            return None
+
+        except Exception as ex:
+            logging.error(traceback.format_exc())
\ No newline at end of file
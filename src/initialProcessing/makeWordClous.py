@@ -14,44 +14,10 @@ from bson.objectid import ObjectId
 
 import libs.networkAnalysis as na
 import libs.pandasLib as pl
-from libs.mongoLib import getContentDocsPerPlatform, getAllDocs, getMinMaxDay
+from libs.dataContext import getDataContext
 import libs.visualization as vz
 
 
-def getGraphRequirments(collectionEnt, collectionLoc, collectionCont, platforms, timeLimits=None):
-    # Convert to list due to multiple use
-    contentList = list(getContentDocsPerPlatform(collectionCont, platforms))
-    entitiesList = list(getAllDocs(collectionEnt))
-    locationsList = list(getAllDocs(collectionLoc))
-
-    minDay, maxDay = getMinMaxDay(collectionCont)
-    temporalPeriod = [minDay + timedelta(days=x) for x in range((maxDay - minDay).days + 1)]
-
-    if timeLimits is not None:
-        logging.info(f'Limiting time from {timeLimits[0]} to {timeLimits[1]}')
-        temporalPeriod = [d for d in temporalPeriod if d.year >= timeLimits[0] and d.year <= timeLimits[1]]
-
-        droppedTimestamps, contentToDrop = 0, []
-        for it, c in enumerate(contentList):
-            timestampsToKeep = [t for t in c['timestamp'] if t.year >= timeLimits[0] and t.year <= timeLimits[1]]
-            droppedTimestamps = len(c['timestamp']) - len(timestampsToKeep)
-            if len(timestampsToKeep) == 0:
-                contentToDrop.append(it)
-            else:
-                c['timestamp'] = timestampsToKeep
-
-        contentList = [c for it, c in enumerate(contentList) if it not in contentToDrop]
-        logging.info(f'Dropped {droppedTimestamps} content timestamps (outside of temporal range) - '
-                     f'resulting in deleting {len(contentToDrop)} pieces of content entirely.')
-
-    return {
-        'contentList': contentList,
-        'entitiesList': entitiesList,
-        'locationsList': locationsList,
-        'temporalPeriod': temporalPeriod,
-    }
-
-
 def createGraphNodes(G, nodesPerClass):
     for clss, listOfNodes in nodesPerClass.items():
         G.add_nodes_from(listOfNodes, nodeClass=clss)
@@ -159,20 +125,18 @@ if __name__ == '__main__':
         collectionLoc = db['locations']
 
         logging.info(f'Querying Data')
-        data = getGraphRequirments(collectionEnt, collectionLoc, collectionCont, platforms, timeLimits=(minYear, maxYear))
+        # Frames shared with the other scripts - only read from the DB when it changed
+        data = getDataContext(db, join(baseDir, 'dataContext'), platforms, timeLimits=(minYear, maxYear)).getData()
         nodesPerClass = {
             'time': data['temporalPeriod'],
-            'content': [x['_id'] for x in data['contentList']],
-            'tag': [x['_id'] for x in data['entitiesList']],
-            'spatial': [x['_id'] for x in data['locationsList']],
+            'content': data['contentDf'].index.tolist(),
+            'tag': data['entityDf'].index.tolist(),
+            'spatial': data['locationDf'].index.tolist(),
         }
         logging.info(f'Data acquired, creating graph (temporal period: {data["temporalPeriod"][0]} -> {data["temporalPeriod"][-1]})')
 
-        # Transform lists to dataframe for faster operations
-        data['contentDf'] = pd.DataFrame(data['contentList']).set_index('_id')
         data['contentDf'].timestamp = data['contentDf'].timestamp.apply(lambda x: [d.date() for d in x])
-        data['locationDf'] = pd.DataFrame(data['locationsList']).set_index('_id')
-        data['tagDf'] = pd.DataFrame(data['entitiesList']).set_index('_id')
+        data['tagDf'] = data['entityDf']
         
         # Creat the graph
         G = nx.Graph()
@@ -4,12 +4,13 @@ sys.path.append(os.path.join(os.getcwd(), '..'))   # Add src/ dir to import path
 import traceback
 import logging
 from os.path import join
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from pymongo import MongoClient
 
 from libs.osLib import loadYaml
-from libs.mongoLib import saveMany, updateContentDocs
-from libs.utilsInitialProcessing import invertCollectionPriority
+from libs.mongoLib import saveMany, updateContentDocs, createIndexes
+from libs.utilsInitialProcessing import invertCollectionPriority, batchIterator
 from interpreters.google import GoogleInterpreter
 from interpreters.youtube import YoutubeInterpreter
 from interpreters.twitter import TwitterInterpreter
@@ -19,53 +20,122 @@ from interpreters.facebook import FacebookInterpreter
 interpreters = {
     'Facebook': FacebookInterpreter,
     'YouTube': YoutubeInterpreter,
-    'GoogleSearch': GoogleInterpreter,
+    'Google Search': GoogleInterpreter,
     'Reddit': RedditInterpreter,
     'Twitter': TwitterInterpreter,
 
 }
 
-if __name__ == '__main__':
 
-    # Set up logger
-    root = logging.getLogger()
-    root.setLevel(logging.DEBUG)
+def processPlatform(platform, info, dataDir, streamInput, batchSize):
+    '''
+    Runs a platform's interpreter and saves its content and locations to the DB. The DB client is opened here, so it can
+    be executed in its own process.
+    :return: (minDate, maxDate)
+    '''
+    client = MongoClient()
+    db = client['digitalMe']
+    collectionCont = db['content']
+    collectionLoc = db['locations']
+
+    interpreter = interpreters[platform](debug=False)
+
+    if streamInput is True:
+        # Content processing - saved in batches as it comes out of the stream
+        contentData = interpreter.stream(dataDir, info['file'], info['termsToIgnore'], info['keysForMerge'])
+        for contentBatch in batchIterator(contentData, batchSize):
+            saveMany(collectionCont, contentBatch)     # insert_many sets the _id of each document
+
+            # Locations processing
+            interpreter.addLocations(contentBatch, info['sourceKeys'], info['sourcesToIgnore'],
+                                     info['sourceTypePerKey'], info['sourceRelationship'], platform=platform)
+        locationData = interpreter.getLocationData()
+    else:
+        # Content processing
+        interpreter.load(dataDir, info['file'])
+        interpreter.preProcess()
+        interpreter.transform(info['termsToIgnore'])
+        interpreter.mergeSameContent(info['keysForMerge'])
+        contentData = interpreter.getContentData()
+        contentDocsIds = saveMany(collectionCont, contentData)
+
+        # Locations processing
+        interpreter.addIds(contentDocsIds)
+        locationData = interpreter.extractLocations(info['sourceKeys'], info['sourcesToIgnore'],
+                                                    info['sourceTypePerKey'], info['sourceRelationship'],
+                                                    platform=platform)
+
+    # Save locations and link them to their content
+    saveLocations(collectionCont, collectionLoc, locationData)
+    client.close()
+
+    return interpreter.getMinMaxTime()
+
+
+def saveLocations(collectionCont, collectionLoc, locationData):
+    locationDocsIds = saveMany(collectionLoc, locationData)
+    contentDocsPayload = invertCollectionPriority(locationData, locationDocsIds)  # Fix this name, it's stupid
+    updateContentDocs(collectionCont, 'locations', contentDocsPayload)
+
 
+def main():
+    '''
+    Loads every platform's export into the DB. Raises if any platform failed, after processing the others.
+    '''
     # Load config
     configDir = '../../configs/'
     config = loadYaml(join(configDir, 'main.yaml'))
 
+    # Parse files one record at a time (constant memory) instead of loading them whole
+    streamInput, batchSize = True, 10000
+    # Run each platform in its own process - each one writes to the DB as it goes
+    numWorkers = config.get('ingestionWorkers', 1)
+
     # Set up DB
     client = MongoClient()
-    db = client['digitalMe']
-    collectionCont = db['content']
-    collectionLoc = db['locations']
+    createIndexes(client['digitalMe'])
+    client.close()
 
-    for platform, configFile in config['platforms'].items():
-        try:
-            # Load config file
-            print(f'=== {platform} ===')
-            info = loadYaml(join(configDir, configFile))
-
-            # Content processing
-            interpreter = interpreters[platform](debug=False)
-            interpreter.load(config['dataDir'], info['file'])
-            interpreter.preProcess()
-            interpreter.transform(info['termsToIgnore'])
-            interpreter.mergeSameContent(info['keysForMerge'])
-            contentData = interpreter.getContentData()
-            contentDocsIds = saveMany(collectionCont, contentData)
-            minDate, maxDate = interpreter.getMinMaxTime()
-            print(f'History from {minDate} to {maxDate}')
+    platformInfo = {platform: loadYaml(join(configDir, configFile)) for platform, configFile in config['platforms'].items()}
 
-            # Locations processing
-            interpreter.addIds(contentDocsIds)
-            locationData = interpreter.extractLocations(info['sourceKeys'], info['sourcesToIgnore'],
-                                                        info['sourceTypePerKey'], info['sourceRelationship'],
-                                                        platform=platform)
-            locationDocsIds = saveMany(collectionLoc, locationData)
-            contentDocsPayload = invertCollectionPriority(locationData, locationDocsIds)  # Fix this name, it's stupid
-            updateContentDocs(collectionCont, 'locations', contentDocsPayload)
-
-        except Exception as ex:
-            print(traceback.format_exc())
+    failed = []
+    if numWorkers > 1:
+        with ProcessPoolExecutor(max_workers=numWorkers) as pool:
+            futures = {pool.submit(processPlatform, platform, info, config['dataDir'], streamInput, batchSize): platform
+                       for platform, info in platformInfo.items()}
+
+            for future in as_completed(futures):
+                platform = futures[future]
+                try:
+                    minDate, maxDate = future.result()
+                    print(f'=== {platform} ===')
+                    print(f'History from {minDate} to {maxDate}')
+
+                except Exception as ex:
+                    print(traceback.format_exc())
+                    failed.append(platform)
+    else:
+        for platform, info in platformInfo.items():
+            try:
+                print(f'=== {platform} ===')
+                minDate, maxDate = processPlatform(platform, info, config['dataDir'], streamInput, batchSize)
+                print(f'History from {minDate} to {maxDate}')
+
+            except Exception as ex:
+                print(traceback.format_exc())
+                failed.append(platform)
+
+    if failed:
+        raise Exception(f'Could not process {failed}')
+
+
+if __name__ == '__main__':
+
+    # Set up logger
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG)
+
+    try:
+        main()
+    except Exception as ex:
+        print(traceback.format_exc())
@@ -11,9 +11,9 @@ from pandas.io.json import json_normalize
 import numpy as np
 from bson.objectid import ObjectId
 
-from libs.utilsInitialProcessing import invertCollectionPriority
+from libs.utilsInitialProcessing import invertCollectionPriority, batchIterator
 from entityExtraction import idGenerator
-from libs.mongoLib import updateContentDocs, getContentDocsWithEntities, getContentDocsWithInherentTags
+from libs.mongoLib import saveMany, updateContentDocs, getContentDocsWithEntities, getContentDocsWithInherentTags
 from libs.osLib import loadYaml
 
 
@@ -26,67 +26,126 @@ def mergeEntitiesAndInherent(entityDf, inherentTagDf, idSize):
 
 
 def standardizeIds(df):
+    '''
+    Ensures every mention of the same normalized tag has the same ID, resolved per normalized form:
+        - If there's exactly one QID among the conflicting ones, that one substitutes the remaining.
+        - If there are conflicting QIDs, choose the first one by default but keep the other ones (droppedQIDs) for
+          possible ambiguity settlement.
+        - If there's no QIDs among the conflicting ones, the first forged ID is used.
+    '''
+    df['droppedQIDs'] = None
 
-    linkedDf = df[df.entityId.str.startswith('Q')]
-    uniqueQIDs = linkedDf.entityId.unique()
-    normalizedTags = df.normalized.unique()
+    # Unique IDs of each normalized form, in order of appearance
+    idsPerTag = df[['normalized', 'entityId']].dropna(subset=['normalized']).drop_duplicates()
+    isQID = idsPerTag.entityId.str.startswith('Q').fillna(False).astype(bool)
 
-    df['droppedQIDs'] = None
+    QIDs = idsPerTag[isQID]
 
-    for tag in normalizedTags:
-        specificDf = df.loc[df.normalized == tag]
-        conflictingIds = specificDf.entityId.unique()
-
-        # If there's only one ID associated with that tag, it's all good.
-        if len(conflictingIds) == 1:
-            continue
-        else:
-            QIDs = [id for id in conflictingIds if id in uniqueQIDs]
-
-            if len(QIDs) == 0:
-                # If there's no QIDs among the conflicting ones, choose any of the forged IDs and standardize that one.
-                df.loc[df.normalized == tag, 'entityId'] = conflictingIds[0]
-
-            elif len(QIDs) == 1:
-                # If there's exactly one QID among the conflicting ones, that one substitutes the remaining.
-                df.loc[df.normalized == tag, 'entityId'] = QIDs[0]
-
-            else:
-                # If there are conflicting QIDs, choose the first one by default but keep the other ones for possible ambiguity settlement.
-                df.loc[df.normalized == tag, 'entityId'] = QIDs[0]
-                for index, row in df.loc[df.normalized == tag].iterrows():
-                    df.at[index, 'droppedQIDs'] = QIDs
-    return df
+    # QID first, otherwise the first forged ID
+    winningIds = idsPerTag.groupby('normalized', sort=False).entityId.first()
+    winningIds.update(QIDs.groupby('normalized', sort=False).entityId.first())
+    df['entityId'] = df.normalized.map(winningIds).fillna(df.entityId)
 
+    # Keep every QID of the normalized forms that had more than one
+    QIDsPerTag = QIDs.normalized.value_counts()
+    QIDs = QIDs[QIDs.normalized.isin(QIDsPerTag[QIDsPerTag > 1].index)]
+    conflictingQIDs = {}
+    for tag, qid in zip(QIDs.normalized, QIDs.entityId):
+        conflictingQIDs.setdefault(tag, []).append(qid)
+
+    hasConflicts = df.normalized.isin(conflictingQIDs.keys())
+    df.loc[hasConflicts, 'droppedQIDs'] = pd.Series(df.loc[hasConflicts, 'normalized'].map(conflictingQIDs).tolist(),
+                                                    index=df.index[hasConflicts], dtype=object)
+    return df
 
-def prepareEntityCollection(df):
-    output = []
-    uniqueIds = df.index.unique()
-    for qid in uniqueIds:
-        specificDf = df.loc[qid].to_frame().transpose() if isinstance(df.loc[qid], pd.Series) else df.loc[qid]
 
-        types = specificDf.type.unique().tolist()
-        mentionForms = specificDf.mention.unique().tolist()
-        normalizedForms = specificDf.normalized.unique().tolist()
+def groupedLists(codes, numGroups, values):
+    '''
+    :param codes: group of each value, from 0 to numGroups - 1
+    :param values: np.array
+    :return: list with the values of each group as a list, keeping their original order
+    '''
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=numGroups))[:-1]
+    return [v.tolist() for v in np.split(values[order], bounds)]
 
-        x = specificDf[['_id', 'relationshipType']].reset_index(drop=True).rename(columns={'_id': 'id'}).T
-        x = x.to_dict()
-        x = x.values()
-        associatedContent = list(x)
 
+def prepareEntityCollection(df):
+    '''
+    Groups the mentions by entity in a single pass (one sort), instead of selecting each entity's rows separately.
+    :param df: pd.DataFrame indexed by entityId
+    :return: generator of entity documents, in order of first appearance
+    '''
+    codes, uniqueIds = pd.factorize(df.index)
+    numEntities = len(uniqueIds)
+
+    uniqueValues = {}
+    for col in ['type', 'mention', 'normalized']:
+        pairs = pd.DataFrame({'code': codes, 'value': df[col].to_numpy()}).drop_duplicates()
+        uniqueValues[col] = groupedLists(pairs['code'].to_numpy(), numEntities, pairs['value'].to_numpy())
+
+    ids = groupedLists(codes, numEntities, df['_id'].to_numpy())
+    relationshipTypes = groupedLists(codes, numEntities, df['relationshipType'].to_numpy())
+
+    # First non null droppedQIDs of each entity
+    withDropped = np.flatnonzero(df['droppedQIDs'].notna().to_numpy())
+    entitiesWithDropped, firstPos = np.unique(codes[withDropped], return_index=True)
+    droppedQIDs = dict(zip(entitiesWithDropped.tolist(), df['droppedQIDs'].to_numpy()[withDropped[firstPos]]))
+
+    for it, qid in enumerate(uniqueIds):
         newDataPoint = {
             'id': qid,
-            'types': types,
-            'mentionForms': mentionForms,
-            'normalizedForms': normalizedForms,
-            'associatedContent': associatedContent,
+            'types': uniqueValues['type'][it],
+            'mentionForms': uniqueValues['mention'][it],
+            'normalizedForms': uniqueValues['normalized'][it],
+            'associatedContent': [{'id': id, 'relationshipType': r} for id, r in zip(ids[it], relationshipTypes[it])],
         }
 
-        if specificDf['droppedQIDs'].notna().any():
-            newDataPoint['droppedQIDs'] = specificDf['droppedQIDs'][0]
+        if it in droppedQIDs:
+            newDataPoint['droppedQIDs'] = droppedQIDs[it]
 
-        output.append(newDataPoint)
-    return output
+        yield newDataPoint
+
+
+def main():
+    '''
+    Builds the tags collection from the extracted entities and the tags inherent to each platform.
+    '''
+    idSize = 6
+    batchSize = 10000
+
+    # Load config
+    configDir = '../../configs/'
+    config = loadYaml(join(configDir, 'main.yaml'))
+    inherentTags = {p: loadYaml(join(configDir, configFile))['inherentTags'] for p, configFile in
+                            config['platforms'].items()}
+    # Set up DB
+    client = MongoClient()
+    db = client['digitalMe']
+    collectionCont = db['content']
+    collectionEnt = db['entities']
+
+    # Query DB for content with extracted entities
+    entityDf = getContentDocsWithEntities(collectionCont)
+    entityDf['relationshipType'] = 'ImpliedMention'
+
+    # Query DB for tags inherent to data (not extracted entities)
+    inherentTagDf = getContentDocsWithInherentTags(collectionCont, inherentTags)
+
+    # Ensure entities with equal names have the same QID
+    entityDf = mergeEntitiesAndInherent(entityDf, inherentTagDf, idSize)
+    entityDf = standardizeIds(entityDf)
+
+    # Prepare data for DB and save it in batches, as it's generated
+    entityDf.set_index('entityId', inplace=True)
+    contentDocsPayload = {}
+    for entityBatch in batchIterator(prepareEntityCollection(entityDf), batchSize):
+        insertedIds = saveMany(collectionEnt, entityBatch)
+        for contentId, tags in invertCollectionPriority(entityBatch, insertedIds).items():
+            contentDocsPayload.setdefault(contentId, []).extend(tags)
+
+    # Update content docs with tags
+    updateContentDocs(collectionCont, 'tags', contentDocsPayload)
 
 
 if __name__ == '__main__':
@@ -95,42 +154,7 @@ if __name__ == '__main__':
     root = logging.getLogger()
     root.setLevel(logging.DEBUG)
 
-    idSize = 6
-
     try:
-        # Load config
-        configDir = '../../configs/'
-        config = loadYaml(join(configDir, 'main.yaml'))
-        inherentTags = {p: loadYaml(join(configDir, configFile))['inherentTags'] for p, configFile in
-                                config['platforms'].items()}
-        # Set up DB
-        client = MongoClient()
-        db = client['digitalMe']
-        collectionCont = db['content']
-        collectionEnt = db['entities']
-
-        # Query DB for content with extracted entities
-        entityDf = getContentDocsWithEntities(collectionCont)
-        entityDf['relationshipType'] = 'ImpliedMention'
-
-        # Query DB for tags inherent to data (not extracted entities)
-        inherentTagDf = getContentDocsWithInherentTags(collectionCont, inherentTags)
-
-        # Ensure entities with equal names have the same QID
-        entityDf = mergeEntitiesAndInherent(entityDf, inherentTagDf, idSize)
-        entityDf = standardizeIds(entityDf)
-
-        # Prepare data for DB
-        entityDf.set_index('entityId', inplace=True)
-        entityCollectionData = prepareEntityCollection(entityDf)
-
-        # Save it to DB
-        insertedDocs = collectionEnt.insert_many(entityCollectionData)
-        insertedIds = insertedDocs.inserted_ids
-
-        # Update content docs with tags
-        contentDocsPayload = invertCollectionPriority(entityCollectionData, insertedIds)
-        updateContentDocs(collectionCont, 'tags', contentDocsPayload)
-
+        main()
     except Exception as ex:
         print(traceback.format_exc())
@@ -0,0 +1,208 @@
+import os
+import logging
+import time
+import json
+import pickle
+import hashlib
+from os.path import join, exists, isdir
+
+import numpy as np
+from scipy import sparse
+
+import libs.osLib as ol
+
+# Bump whenever the way artifacts are keyed or stored changes - every artifact is computed again
+artifactCacheVersion = 1
+
+extensions = {'sparse': '.npz', 'numpy': '.npy', 'pickle': '.pickle'}
+
+
+class ArtifactCache():
+    '''
+    Reuses the outputs of expensive steps (adjacency and similarity matrices, SClump results, centrality...) across runs.
+    Artifacts are keyed by their name, parameters and the content hashes of their inputs (e.g. fileHash of the graph), so
+    they are computed again whenever any of them changes and there are no stale files to keep track of.
+    Next to each artifact, {name}-{key}.json keeps its lineage - parameters, inputs, content hash, creation and last use.
+    When maxBytes is set, the least recently used artifacts are evicted to keep the cache under it. Files in cacheDir that
+    were not written by the cache are left alone.
+    '''
+
+    def __init__(self, cacheDir, maxBytes=None, compressed=True):
+        '''
+        :param cacheDir: directory where the artifacts are stored - several caches can share it, and its size limit
+        :param maxBytes: maximum size of the artifacts in cacheDir, None for unbounded
+        :param compressed: compress sparse matrices - smaller files, but several times slower to write and read
+        '''
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.compressed = compressed
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def key(self, name, params=None, inputs=()):
+        description = json.dumps({'version': artifactCacheVersion, 'name': name, 'params': params, 'inputs': list(inputs)},
+                                 sort_keys=True, default=str)
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    def metaPath(self, name, key):
+        return join(self.cacheDir, f'{name}-{key[:16]}.json')
+
+    def lookup(self, name, params=None, inputs=()):
+        '''
+        :return: lineage metadata of the artifact, None if it's not in the cache
+        '''
+        key = self.key(name, params, inputs)
+        path = self.metaPath(name, key)
+        if not exists(path):
+            return None
+        with open(path) as f:
+            meta = json.load(f)
+        if meta['key'] != key or not exists(join(self.cacheDir, meta['file'])):
+            return None
+        return meta
+
+    def fetch(self, name, params=None, inputs=()):
+        '''
+        :return: the artifact, None if it's not in the cache (or can't be loaded)
+        '''
+        meta = self.lookup(name, params, inputs)
+        if meta is None:
+            return None
+
+        try:
+            value = load(join(self.cacheDir, meta['file']), meta['kind'])
+        except Exception as ex:
+            logging.warning(f'Could not load {meta["file"]} ({ex})')
+            return None
+        meta['lastUsed'] = time.time()
+        writeMeta(self.metaPath(name, meta['key']), meta)
+        logging.info(f'Reusing {meta["file"]} - computed {time.ctime(meta["created"])}')
+        return value
+
+    def get(self, name, compute, params=None, inputs=()):
+        '''
+        :param name: name of the artifact, used in the file names
+        :param compute: callable without arguments computing the artifact on a miss
+        :param params: JSON serializable parameters the artifact depends on
+        :param inputs: list of content hashes of whatever the artifact is computed from
+        :return: the artifact - sparse matrix, numpy array or anything picklable (but not None)
+        '''
+        value = self.fetch(name, params, inputs)
+        if value is not None:
+            return value
+
+        logging.info(f'Computing {name} {params if params is not None else ""}')
+        value = compute()
+        self.put(name, value, params, inputs)
+        return value
+
+    def put(self, name, value, params=None, inputs=()):
+        key = self.key(name, params, inputs)
+        kind = 'sparse' if sparse.issparse(value) else 'numpy' if isinstance(value, np.ndarray) else 'pickle'
+        fileName = f'{name}-{key[:16]}{extensions[kind]}'
+
+        # Written next to its final name and moved into place, so a crash never leaves a half written artifact
+        tmpPath = join(self.cacheDir, f'tmp-{fileName}')
+        save(value, tmpPath, kind, self.compressed)
+        os.replace(tmpPath, join(self.cacheDir, fileName))
+
+        now = time.time()
+        meta = {
+            'version': artifactCacheVersion,
+            'name': name,
+            'key': key,
+            'params': params,
+            'inputs': list(inputs),
+            'file': fileName,
+            'kind': kind,
+            'contentHash': fileHash(join(self.cacheDir, fileName)),
+            'size': os.path.getsize(join(self.cacheDir, fileName)),
+            'created': now,
+            'lastUsed': now,
+        }
+        writeMeta(self.metaPath(name, key), meta)
+        self.evict(keep=fileName)
+        return meta
+
+    def artifacts(self):
+        '''
+        :return: list of the lineage metadata of every artifact in the cache
+        '''
+        metas = []
+        for fileName in os.listdir(self.cacheDir):
+            if not fileName.endswith('.json'):
+                continue
+            try:
+                with open(join(self.cacheDir, fileName)) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if isinstance(meta, dict) and meta.get('version') == artifactCacheVersion and 'file' in meta:
+                metas.append(meta)
+        return metas
+
+    def evict(self, keep=None):
+        '''
+        Removes the least recently used artifacts until the cache is under maxBytes
+        :param keep: file name of an artifact that is never evicted (e.g. the one just written)
+        '''
+        if self.maxBytes is None:
+            return
+
+        metas = sorted(self.artifacts(), key=lambda m: m['lastUsed'])
+        total = sum(m['size'] for m in metas)
+        for meta in metas:
+            if total <= self.maxBytes:
+                break
+            if meta['file'] == keep:
+                continue
+            logging.info(f'Evicting {meta["file"]} - last used {time.ctime(meta["lastUsed"])}')
+            for path in [join(self.cacheDir, meta['file']), self.metaPath(meta['name'], meta['key'])]:
+                if exists(path):
+                    os.remove(path)
+            total -= meta['size']
+
+
+def writeMeta(path, meta):
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(meta, f, indent=2, default=str)
+    os.replace(f'{path}.tmp', path)
+
+
+def save(value, path, kind, compressed=True):
+    # numpy/scipy add their extension to the name if it's missing - open the file so they write exactly to path
+    with open(path, 'wb') as f:
+        if kind == 'sparse':
+            sparse.save_npz(f, value, compressed=compressed)
+        elif kind == 'numpy':
+            np.save(f, value)
+        else:
+            pickle.dump(value, f)
+
+
+def load(path, kind):
+    if kind == 'sparse':
+        return ol.loadSparce(path)
+    if kind == 'numpy':
+        return ol.loadNumpy(path)
+    return ol.loadPickle(path)
+
+
+def fileHash(path, chunkSize=2 ** 20):
+    '''
+    :param path: file or directory (e.g. a saved graph) - directories hash the relative path and content of every file
+    :return: sha1 hex digest of the content
+    '''
+    h = hashlib.sha1()
+    files = [('', path)]
+    if isdir(path):
+        files = []
+        for root, dirs, fileNames in os.walk(path):
+            dirs.sort()
+            files += [(os.path.relpath(join(root, f), path), join(root, f)) for f in sorted(fileNames)]
+
+    for relPath, filePath in files:
+        h.update(relPath.encode('utf-8'))
+        with open(filePath, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunkSize), b''):
+                h.update(chunk)
+    return h.hexdigest()
@@ -0,0 +1,580 @@
+import logging
+import os
+import json
+import shutil
+from os.path import join
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import networkx as nx
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from bson.objectid import ObjectId
+
+from libs.customExceptions import UnsupportedGraphFormat
+
+# Bump whenever the on-disk layout written by saveGraph changes
+graphFormatVersion = 1
+
+
+# Edge class of each pair of connected node classes
+edgeClassPerNodeClasses = {
+    ('time', 'time'): 'temporal',
+    ('content', 'time'): 'action',
+    ('content', 'spatial'): 'source',
+    ('content', 'tag'): 'tag',
+}
+
+
+class CompactGraph():
+    '''
+    Memory efficient version of the knowledge graph:
+        - Nodes are integers 0..N-1, grouped by class, and nodeIds[i] holds the original ID (ObjectId/date) of node i
+        - One symmetric CSR adjacency matrix per edge class - int8 ones, or int32 weights for weighted classes
+        - Categorical node attributes, stored as one integer code per node (-1 when missing) plus their categories
+    '''
+
+    def __init__(self, nodeIds, adjacencies, attributes, nodeTable=None):
+        '''
+        :param nodeIds: np.array (object) with the original ID of each node - can be None if nodeTable is given
+        :param adjacencies: Dictionary, edge class: sparse.csr_matrix (N x N, symmetric)
+        :param attributes: Dictionary, attribute name: (np.array of codes, list of categories)
+        :param nodeTable: (kinds, keys) as written by saveGraph, only decoded into nodeIds when first needed
+        '''
+        self._nodeIds = nodeIds
+        self.nodeTable = nodeTable
+        self.adjacencies = adjacencies
+        self.attributes = attributes
+        self.idIndex = None
+        self.combinedAdjacency = None
+
+    @property
+    def nodeIds(self):
+        if self._nodeIds is None:
+            self._nodeIds = decodeNodeIds(*self.nodeTable)
+        return self._nodeIds
+
+    @classmethod
+    def fromEdges(cls, nodesPerClass, edgesPerClass):
+        '''
+        :param nodesPerClass: Dictionary, node class: list of node IDs
+        :param edgesPerClass: Dictionary, edge class: list of (node ID, node ID) or (node ID, node ID, weight) - a class with
+                              weights sums them per edge, the others are 0/1
+        :return: CompactGraph
+        '''
+        nodeIds = objectArray([n for nodes in nodesPerClass.values() for n in nodes])
+        classCodes = np.repeat(np.arange(len(nodesPerClass), dtype=np.int8), [len(n) for n in nodesPerClass.values()])
+
+        G = cls(nodeIds, {}, {'nodeClass': (classCodes, list(nodesPerClass.keys()))})
+        assert(G.getIdIndex().is_unique)
+
+        for edgeClass, edges in edgesPerClass.items():
+            heads = G.indicesOf([e[0] for e in edges])
+            tails = G.indicesOf([e[1] for e in edges])
+            weights = None
+            if any(len(e) > 2 for e in edges):
+                weights = np.array([e[2] if len(e) > 2 else 1 for e in edges], dtype=np.int32)
+            G.adjacencies[edgeClass] = symmetricAdjacency(heads, tails, len(nodeIds), weights=weights)
+        return G
+
+    @classmethod
+    def fromNetworkx(cls, G):
+        '''
+        Converts a graph created by createGraph.py - edge classes are deduced from the classes of their endpoints.
+        :param G: nx.Graph with a nodeClass attribute in every node
+        :return: CompactGraph
+        '''
+        classPerId = nx.get_node_attributes(G, 'nodeClass')
+        nodesPerClass = {}
+        for n, clss in classPerId.items():
+            nodesPerClass.setdefault(clss, []).append(n)
+
+        edgesPerClass = {}
+        for a, b, weight in G.edges(data='weight'):
+            edgeClass = edgeClassPerNodeClasses.get(tuple(sorted((classPerId[a], classPerId[b]))), 'other')
+            edgesPerClass.setdefault(edgeClass, []).append((a, b) if weight is None else (a, b, weight))
+
+        compactG = cls.fromEdges(nodesPerClass, edgesPerClass)
+        for name in ['platform', 'contentType', 'locationType', 'dbPediaType']:
+            values = nx.get_node_attributes(G, name)
+            if len(values) > 0:
+                compactG.setNodeAttributes(values, name)
+        return compactG
+
+    def nodeIdsOf(self, nodes):
+        '''
+        :param nodes: np.array of node indexes
+        :return: np.array with their original IDs - without decoding the whole ID table
+        '''
+        if self._nodeIds is None:
+            kinds, keys = self.nodeTable
+            return decodeNodeIds(kinds[nodes], keys[nodes])
+        return self._nodeIds[nodes]
+
+    def getIdIndex(self):
+        if self.idIndex is None:
+            self.idIndex = pd.Index(self.nodeIds)
+        return self.idIndex
+
+    def indicesOf(self, ids):
+        '''
+        :param ids: list of original node IDs
+        :return: np.array with their integer index
+        '''
+        indices = self.getIdIndex().get_indexer(pd.Index(objectArray(ids)))
+        if (indices < 0).any():
+            raise KeyError(f'{(indices < 0).sum()} IDs are not nodes in the graph')
+        return indices
+
+    def numberOfNodes(self):
+        return len(self.attributes['nodeClass'][0])
+
+    def numberOfEdges(self, edgeClass=None):
+        edgeClasses = self.adjacencies.keys() if edgeClass is None else [edgeClass]
+        return sum(self.adjacencies[c].nnz for c in edgeClasses) // 2
+
+    def adjacency(self):
+        '''
+        :return: sparse.csr_matrix with the edges of every class
+        '''
+        if self.combinedAdjacency is None:
+            combined = sparse.csr_matrix((self.numberOfNodes(), self.numberOfNodes()), dtype=np.int8)
+            for A in self.adjacencies.values():
+                combined = combined + A
+            combined.data[:] = 1
+            self.combinedAdjacency = combined.astype(np.int8)
+        return self.combinedAdjacency
+
+    def neighbors(self, node):
+        A = self.adjacency()
+        return A.indices[A.indptr[node]:A.indptr[node + 1]]
+
+    def degree(self):
+        return np.diff(self.adjacency().indptr)
+
+    def isWeighted(self, edgeClass):
+        return self.adjacencies[edgeClass].dtype != np.int8
+
+    def nodesOfClass(self, nodeClass):
+        codes, categories = self.attributes['nodeClass']
+        return np.flatnonzero(codes == categories.index(nodeClass))
+
+    def setNodeAttributes(self, values, name):
+        '''
+        Same semantics as nx.set_node_attributes - nodes missing from values are left without the attribute
+        :param values: Dictionary, node ID: attribute value
+        '''
+        codes = np.full(self.numberOfNodes(), -1, dtype=np.int32)
+        isNode = self.getIdIndex().get_indexer(pd.Index(objectArray(list(values.keys()))))
+        valueCodes, categories = pd.factorize(pd.Series(objectArray(list(values.values()))))
+        codes[isNode[isNode >= 0]] = valueCodes[isNode >= 0]
+        self.attributes[name] = (codes, categories.tolist())
+
+    def getNodeAttribute(self, name):
+        '''
+        :return: np.array (object) with the attribute value of each node - None when missing
+        '''
+        codes, categories = self.attributes[name]
+        values = np.empty(len(categories) + 1, dtype=object)
+        values[:-1] = categories
+        return values[codes]    # Code -1 points to the trailing None
+
+    def adjacencyBetweenClasses(self, classA, classB):
+        '''
+        :return: sparse.csr_matrix, rows follow nodesOfClass(classA) and columns nodesOfClass(classB)
+        '''
+        return self.adjacency()[self.nodesOfClass(classA)][:, self.nodesOfClass(classB)].astype(np.float64)
+
+    def subgraph(self, nodes):
+        '''
+        :param nodes: np.array with the integer index of the nodes to keep (in order)
+        :return: CompactGraph
+        '''
+        adjacencies = {c: A[nodes][:, nodes].tocsr() for c, A in self.adjacencies.items()}
+        attributes = {name: (codes[nodes], categories) for name, (codes, categories) in self.attributes.items()}
+        return CompactGraph(self.nodeIds[nodes], adjacencies, attributes)
+
+    def largestComponent(self, prints=True):
+        numComponents, labels = connected_components(self.adjacency(), directed=False)
+        giantComponentNodes = np.flatnonzero(labels == np.bincount(labels).argmax())
+        giantComponent = self.subgraph(giantComponentNodes)
+
+        if prints:
+            nOriginal, eOriginal = self.numberOfNodes(), self.numberOfEdges()
+            nKept, eKept = giantComponent.numberOfNodes(), giantComponent.numberOfEdges()
+            print(f'\t - The network has {numComponents} connected components (N: {nOriginal}\t E: {eOriginal})\n '
+                  f'\t - Returning only the biggest (N:{nKept}\t E: {eKept})\n'
+                  f'\t - Dropped a total of {nOriginal - nKept} nodes and {eOriginal - eKept} edges\n')
+
+        return giantComponent
+
+    def memoryUsage(self):
+        '''
+        :return: bytes used by the arrays (original IDs excluded)
+        '''
+        total = sum(A.indptr.nbytes + A.indices.nbytes + A.data.nbytes for A in self.adjacencies.values())
+        total += sum(codes.nbytes for codes, _ in self.attributes.values())
+        return total
+
+    def toNetworkx(self):
+        G = nx.Graph()
+        for name, values in [(name, self.getNodeAttribute(name)) for name in self.attributes.keys()]:
+            for i, v in enumerate(values):
+                if v is not None:
+                    G.add_node(self.nodeIds[i], **{name: v})
+        for edgeClass, A in self.adjacencies.items():
+            upper = sparse.triu(A).tocoo()
+            heads, tails = self.nodeIds[upper.row], self.nodeIds[upper.col]
+            if self.isWeighted(edgeClass):
+                G.add_weighted_edges_from(zip(heads, tails, upper.data.tolist()), edgeClass=edgeClass)
+            else:
+                G.add_edges_from(zip(heads, tails), edgeClass=edgeClass)
+        return G
+
+
+class NetworkxView():
+    '''
+    Thin, read only adapter so scripts written against nx.Graph can run on a CompactGraph, using the original node IDs:
+        G.nodes[n]['platform'], G.nodes(data=True), G.neighbors(n), G.degree(), G.edges(data=True)...
+    '''
+
+    def __init__(self, compactGraph):
+        self.compact = compactGraph
+        self.nodes = NodeView(self)
+        self.attributeValues = {name: compactGraph.getNodeAttribute(name) for name in compactGraph.attributes.keys()}
+
+    def index(self, n):
+        return self.compact.getIdIndex().get_loc(n)
+
+    def nodeData(self, i):
+        return {name: values[i] for name, values in self.attributeValues.items() if values[i] is not None}
+
+    def neighbors(self, n):
+        return iter(self.compact.nodeIds[self.compact.neighbors(self.index(n))])
+
+    def degree(self):
+        return zip(self.compact.nodeIds, self.compact.degree().tolist())
+
+    def edges(self, data=False):
+        for edgeClass, A in self.compact.adjacencies.items():
+            upper = sparse.triu(A).tocoo()
+            weighted = self.compact.isWeighted(edgeClass)
+            for a, b, w in zip(self.compact.nodeIds[upper.row], self.compact.nodeIds[upper.col], upper.data.tolist()):
+                if not data:
+                    yield (a, b)
+                else:
+                    yield (a, b, {'edgeClass': edgeClass, 'weight': w} if weighted else {'edgeClass': edgeClass})
+
+    def number_of_nodes(self):
+        return self.compact.numberOfNodes()
+
+    def number_of_edges(self):
+        return self.compact.numberOfEdges()
+
+    def __len__(self):
+        return self.compact.numberOfNodes()
+
+    def __iter__(self):
+        return iter(self.compact.nodeIds)
+
+
+class NodeView():
+
+    def __init__(self, view):
+        self.view = view
+
+    def __getitem__(self, n):
+        return self.view.nodeData(self.view.index(n))
+
+    def __call__(self, data=False):
+        if data:
+            return ((n, self.view.nodeData(i)) for i, n in enumerate(self.view.compact.nodeIds))
+        return iter(self.view.compact.nodeIds)
+
+    def __iter__(self):
+        return self()
+
+    def __len__(self):
+        return len(self.view)
+
+
+def getNodeAttributes(G, name):
+    '''
+    Same as nx.get_node_attributes, for nx.Graph, CompactGraph or NetworkxView
+    :return: Dictionary, node ID: value
+    '''
+    if isinstance(G, NetworkxView):
+        G = G.compact
+    if isinstance(G, CompactGraph):
+        values = G.getNodeAttribute(name)
+        hasValue = np.flatnonzero(values != None)    # noqa: E711 - elementwise comparison
+        return dict(zip(G.nodeIds[hasValue], values[hasValue]))
+    return nx.get_node_attributes(G, name)
+
+
+def graphPath(dataDir, period='day'):
+    return join(dataDir, 'graph' if period == 'day' else f'graph-{period}')
+
+
+def saveGraph(G, path, highWaterMark=None):
+    '''
+    Versioned on-disk format - a directory with:
+        - meta.json: format version, number of nodes, edge classes, the categories of each attribute and the high-water
+          mark of the data in the graph
+        - nodeIdKinds.npy/nodeIdKeys.npy: type and string key of the original ID of each node
+        - edges-{edgeClass}-{indptr|indices|data}.npy: CSR adjacency of each edge class (data holds the weights, if any)
+        - attribute-{name}.npy: attribute codes of each node
+        - segment-XXXX/: nodes and edges appended later by appendToGraph
+    It's written next to path and then moved into place, so readers never see a half written graph.
+    :param G: CompactGraph or nx.Graph (converted)
+    :param path: directory
+    :param highWaterMark: Dictionary, whatever identifies the last data included (e.g. last content _id)
+    '''
+    if not isinstance(G, CompactGraph):
+        G = CompactGraph.fromNetworkx(G)
+
+    tmpPath = f'{path}.tmp'
+    shutil.rmtree(tmpPath, ignore_errors=True)
+    os.makedirs(tmpPath)
+
+    kinds, keys = encodeNodeIds(G.nodeIds)
+    np.save(join(tmpPath, 'nodeIdKinds.npy'), kinds)
+    np.save(join(tmpPath, 'nodeIdKeys.npy'), keys)
+    for edgeClass, A in G.adjacencies.items():
+        for part in ['indptr', 'indices', 'data']:
+            np.save(join(tmpPath, f'edges-{edgeClass}-{part}.npy'), getattr(A, part))
+    for name, (codes, _) in G.attributes.items():
+        np.save(join(tmpPath, f'attribute-{name}.npy'), codes)
+
+    meta = {
+        'formatVersion': graphFormatVersion,
+        'numNodes': G.numberOfNodes(),
+        'edgeClasses': list(G.adjacencies.keys()),
+        'attributes': {name: categories for name, (_, categories) in G.attributes.items()},
+        'segments': [],
+        'highWaterMark': highWaterMark,
+    }
+    writeGraphMeta(tmpPath, meta)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmpPath, path)
+
+
+def readGraphMeta(path):
+    with open(join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('formatVersion') != graphFormatVersion:
+        raise UnsupportedGraphFormat(f'{path} has format version {meta.get("formatVersion")}, '
+                                     f'expected {graphFormatVersion} - recreate it with createGraph.py')
+    return meta
+
+
+def writeGraphMeta(path, meta):
+    with open(join(path, 'meta.json.tmp'), 'w') as f:
+        json.dump(meta, f)
+    os.replace(join(path, 'meta.json.tmp'), join(path, 'meta.json'))
+
+
+def loadGraph(path, mmap=True):
+    '''
+    :param path: directory written by saveGraph
+    :param mmap: memory map the arrays instead of reading them - pages are loaded on access and shared across processes
+    :return: CompactGraph
+    '''
+    meta = readGraphMeta(path)
+
+    def load(name, directory=path):
+        return np.load(join(directory, f'{name}.npy'), mmap_mode='r' if mmap else None)
+
+    numNodes, indptrs = meta['numNodes'], {}
+    kinds, keys = [load('nodeIdKinds')], [load('nodeIdKeys')]
+    numBaseNodes = len(kinds[0])
+
+    # Base CSR arrays, padded with empty rows for the nodes appended by the segments
+    adjacencies = {}
+    for c in meta['edgeClasses']:
+        if not os.path.exists(join(path, f'edges-{c}-indptr.npy')):
+            adjacencies[c] = sparse.csr_matrix((numNodes, numNodes), dtype=np.int8)
+            continue
+        indptr = load(f'edges-{c}-indptr')
+        if numNodes > numBaseNodes:
+            indptr = np.concatenate([indptr, np.full(numNodes - numBaseNodes, indptr[-1], dtype=indptr.dtype)])
+        adjacencies[c] = sparse.csr_matrix((load(f'edges-{c}-data'), load(f'edges-{c}-indices'), indptr),
+                                           shape=(numNodes, numNodes), copy=False)
+
+    attributes = {}
+    for name, categories in meta['attributes'].items():
+        codes = load(f'attribute-{name}') if os.path.exists(join(path, f'attribute-{name}.npy')) else \
+            np.full(numBaseNodes, -1, dtype=np.int32)
+        attributes[name] = [[codes], categories]
+
+    # Nodes and edges appended after the base was written
+    for segment in meta['segments']:
+        segmentPath = join(path, segment)
+        kinds.append(load('nodeIdKinds', segmentPath))
+        keys.append(load('nodeIdKeys', segmentPath))
+        for name, (codes, _) in attributes.items():
+            exists = os.path.exists(join(segmentPath, f'attribute-{name}.npy'))
+            codes.append(load(f'attribute-{name}', segmentPath) if exists else np.full(len(kinds[-1]), -1, dtype=np.int32))
+        for c in meta['edgeClasses']:
+            if os.path.exists(join(segmentPath, f'edges-{c}-heads.npy')):
+                # Weighted classes count every appended edge once, the others stay 0/1
+                heads, tails = load(f'edges-{c}-heads', segmentPath), load(f'edges-{c}-tails', segmentPath)
+                weighted = adjacencies[c].dtype != np.int8
+                newEdges = symmetricAdjacency(heads, tails, numNodes,
+                                              weights=np.ones(len(heads), dtype=np.int32) if weighted else None)
+                merged = (adjacencies[c] + newEdges).tocsr()
+                if not weighted:
+                    merged.data[:] = 1
+                adjacencies[c] = merged
+
+    attributes = {name: (np.concatenate(codes) if len(codes) > 1 else codes[0], categories)
+                  for name, (codes, categories) in attributes.items()}
+    nodeTable = (np.concatenate(kinds), np.concatenate(keys)) if len(kinds) > 1 else (kinds[0], keys[0])
+    return CompactGraph(None, adjacencies, attributes, nodeTable=nodeTable)
+
+
+def appendToGraph(path, newNodesPerClass, edgesPerClass, attributes, highWaterMark=None):
+    '''
+    Adds nodes and edges to a graph written by saveGraph as a new segment - the existing files are never rewritten.
+    A full rebuild (or saveGraph(loadGraph(path), path)) folds the segments back into the base arrays.
+    :param newNodesPerClass: Dictionary, node class: list of node IDs - the ones already in the graph are ignored
+    :param edgesPerClass: Dictionary, edge class: list of (node ID, node ID) - between new and/or existing nodes
+    :param attributes: Dictionary, attribute name: Dictionary, node ID: value - only used for the new nodes
+    :param highWaterMark: Dictionary, replaces the one in meta.json
+    :return: number of nodes and edges appended
+    '''
+    meta = readGraphMeta(path)
+    kinds, keys = [np.load(join(path, 'nodeIdKinds.npy'), mmap_mode='r')], [np.load(join(path, 'nodeIdKeys.npy'), mmap_mode='r')]
+    for segment in meta['segments']:
+        kinds.append(np.load(join(path, segment, 'nodeIdKinds.npy'), mmap_mode='r'))
+        keys.append(np.load(join(path, segment, 'nodeIdKeys.npy'), mmap_mode='r'))
+    # Node lookups are done on the encoded keys, so the existing IDs never have to be decoded
+    existingKeys = pd.Index(np.concatenate(keys))
+    assert(len(existingKeys) == meta['numNodes'])
+
+    # New nodes go after the existing ones
+    newClasses, newIds = [], []
+    for clss, nodes in newNodesPerClass.items():
+        nodes = list(dict.fromkeys(nodes))
+        _, nodeKeys = encodeNodeIds(nodes)
+        isNew = existingKeys.get_indexer(nodeKeys) < 0
+        newIds += [n for n, new in zip(nodes, isNew) if new]
+        newClasses += [clss] * int(isNew.sum())
+    newKinds, newKeys = encodeNodeIds(newIds)
+    allKeys = existingKeys.append(pd.Index(newKeys))
+    assert(allKeys.is_unique)
+
+    segment = f'segment-{len(meta["segments"]) + 1:04d}'
+    segmentPath = join(path, segment)
+    shutil.rmtree(segmentPath, ignore_errors=True)
+    os.makedirs(segmentPath)
+    np.save(join(segmentPath, 'nodeIdKinds.npy'), newKinds)
+    np.save(join(segmentPath, 'nodeIdKeys.npy'), newKeys)
+
+    # Attribute codes of the new nodes, extending the categories when needed
+    attributes = dict(attributes, nodeClass=dict(zip(newIds, newClasses)))
+    newIndex = pd.Index(newKeys)
+    for name, values in attributes.items():
+        categories = meta['attributes'].setdefault(name, [])
+        codePerCategory = {c: i for i, c in enumerate(categories)}
+        codes = np.full(len(newIds), -1, dtype=np.int32)
+        _, valueKeys = encodeNodeIds(list(values.keys()))
+        positions = newIndex.get_indexer(valueKeys)
+        for pos, value in zip(positions, values.values()):
+            if pos < 0 or pd.isnull(value):
+                continue
+            if value not in codePerCategory:
+                codePerCategory[value] = len(categories)
+                categories.append(value)
+            codes[pos] = codePerCategory[value]
+        np.save(join(segmentPath, f'attribute-{name}.npy'), codes)
+
+    numEdges = 0
+    for edgeClass, edges in edgesPerClass.items():
+        if len(edges) == 0:
+            continue
+        _, headKeys = encodeNodeIds([e[0] for e in edges])
+        _, tailKeys = encodeNodeIds([e[1] for e in edges])
+        heads, tails = allKeys.get_indexer(headKeys), allKeys.get_indexer(tailKeys)
+        if (heads < 0).any() or (tails < 0).any():
+            shutil.rmtree(segmentPath)
+            raise KeyError(f'{((heads < 0) | (tails < 0)).sum()} {edgeClass} edges point to nodes not in the graph')
+        np.save(join(segmentPath, f'edges-{edgeClass}-heads.npy'), heads)
+        np.save(join(segmentPath, f'edges-{edgeClass}-tails.npy'), tails)
+        if edgeClass not in meta['edgeClasses']:
+            meta['edgeClasses'].append(edgeClass)
+        numEdges += len(edges)
+
+    meta['numNodes'] += len(newIds)
+    meta['segments'].append(segment)
+    if highWaterMark is not None:
+        meta['highWaterMark'] = highWaterMark
+    writeGraphMeta(path, meta)
+
+    return len(newIds), numEdges
+
+
+# Types of node IDs, in the order of their codes in nodeIdKinds.npy
+nodeIdTypes = [ObjectId, date, datetime, str, int]
+
+
+def encodeNodeIds(nodeIds):
+    '''
+    :param nodeIds: np.array (object)
+    :return: (np.array with the type code of each ID, np.array (bytes) with its string form)
+    '''
+    kinds = np.array([nodeIdTypes.index(type(n)) if type(n) in nodeIdTypes else nodeIdTypes.index(str)
+                      for n in nodeIds], dtype=np.int8)
+    keys = np.array([(n.isoformat() if isinstance(n, date) else str(n)).encode() for n in nodeIds], dtype=bytes)
+    return kinds, keys
+
+
+def decodeNodeIds(kinds, keys):
+    decoders = [
+        lambda k: ObjectId(k.decode()),
+        lambda k: date.fromisoformat(k.decode()),
+        lambda k: datetime.fromisoformat(k.decode()),
+        lambda k: k.decode(),
+        lambda k: int(k),
+    ]
+    return objectArray([decoders[kind](key) for kind, key in zip(kinds.tolist(), keys.tolist())])
+
+
+def objectArray(values):
+    '''
+    np.array (object) with the given values as they are - much faster than np.array/pd.Index(values, dtype=object),
+    which check whether each value is itself a sequence
+    :param values: list
+    '''
+    return np.fromiter(values, dtype=object, count=len(values))
+
+
+def setNodeAttributes(G, values, name):
+    '''
+    Same as nx.set_node_attributes, for nx.Graph or CompactGraph
+    :param values: Dictionary, node ID: value
+    '''
+    if isinstance(G, CompactGraph):
+        G.setNodeAttributes(values, name)
+    else:
+        nx.set_node_attributes(G, values, name)
+
+
+def symmetricAdjacency(heads, tails, numNodes, weights=None):
+    '''
+    :param heads: np.array of node indexes
+    :param tails: np.array of node indexes
+    :param weights: np.array with the weight of each edge - duplicates are summed
+    :return: sparse.csr_matrix with a 1 (int8, duplicates merged) or the weight (int32) in both (head, tail) and (tail, head)
+    '''
+    rows = np.concatenate([heads, tails])
+    cols = np.concatenate([tails, heads])
+    data = np.ones(len(rows), dtype=np.int8) if weights is None else np.concatenate([weights, weights]).astype(np.int32)
+    A = sparse.csr_matrix((data, (rows, cols)), shape=(numNodes, numNodes))
+    A.sum_duplicates()
+    if weights is None:
+        A.data[:] = 1
+    logging.debug(f'Adjacency with {A.nnz // 2} edges')
+    return A
@@ -26,4 +26,13 @@ class ContentWithMultipleLocations(Exception):
     pass
 
 class ContentWithoutSource(Exception):
+    pass
+
+class ExtractionQuotaExceeded(Exception):
+    pass
+
+class UnsupportedGraphFormat(Exception):
+    pass
+
+class NotAppendOnly(Exception):
     pass
\ No newline at end of file
@@ -0,0 +1,355 @@
+import logging
+import os
+import json
+import shutil
+import hashlib
+from os.path import join
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from bson import json_util
+from bson.objectid import ObjectId
+
+from libs.mongoLib import getContentDocsPerPlatform, getContentDocsPerPlatformInRange, getAllDocs, getMinMaxDay, \
+    getChangeMarker
+
+# Bump whenever the snapshot layout (or what goes into the frames) changes
+dataContextVersion = 1
+collectionNames = ['content', 'entities', 'locations']
+frameNames = ['contentDf', 'locationDf', 'entityDf']
+
+# Python types stored as they are by Arrow - a column must hold a single one of these
+nativeTypes = [{str}, {bool}, {int}, {float}, {datetime}, {date}]
+
+# DataContext per (database, cache directory, platforms, time limits) - see getDataContext
+contexts = {}
+
+
+def getGraphRequirments(collectionEnt, collectionLoc, collectionCont, platforms, timeLimits=None):
+    minDay, maxDay = getMinMaxDay(collectionCont)
+    temporalPeriod = [minDay + timedelta(days=x) for x in range((maxDay - minDay).days + 1)]
+
+    if timeLimits is not None:
+        logging.info(f'Limiting time from {timeLimits[0]} to {timeLimits[1]}')
+        temporalPeriod = [d for d in temporalPeriod if d.year >= timeLimits[0] and d.year <= timeLimits[1]]
+
+        # Timestamps outside of the temporal range (and content left without any) are dropped by the DB
+        contentList = list(getContentDocsPerPlatformInRange(collectionCont, platforms, datetime(timeLimits[0], 1, 1),
+                                                            datetime(timeLimits[1] + 1, 1, 1)))
+        logging.info(f'Acquired {len(contentList)} pieces of content within the temporal range')
+    else:
+        contentList = list(getContentDocsPerPlatform(collectionCont, platforms))
+
+    # Convert to list due to multiple use
+    entitiesList = list(getAllDocs(collectionEnt))
+    locationsList = list(getAllDocs(collectionLoc))
+
+    return {
+        'contentList': contentList,
+        'entitiesList': entitiesList,
+        'locationsList': locationsList,
+        'temporalPeriod': temporalPeriod,
+    }
+
+
+class DataContext():
+    '''
+    The content, location and entity frames (plus the temporal period) every script builds from the DB, loaded once:
+        - Within a process, getDataContext hands out the same context, so the frames are only built once
+        - Across processes, the frames are kept as Parquet/Feather snapshots (when pyarrow is installed) keyed by a change
+          marker of the collections (see mongoLib.getChangeMarker) - the DB is only read again when its data changed
+    Frames come back with the same types as if they were built from the DB documents (ObjectIds, lists of dicts...),
+    and as copies, so scripts can modify them freely.
+    '''
+
+    def __init__(self, db, cacheDir, platforms, timeLimits=None, fileFormat='feather'):
+        '''
+        :param db: database client
+        :param cacheDir: directory for the snapshots
+        :param platforms: list of platforms whose content is loaded
+        :param timeLimits: (first year, last year) - see getGraphRequirments
+        :param fileFormat: 'feather' or 'parquet'
+        '''
+        self.db = db
+        self.cacheDir = cacheDir
+        self.platforms = platforms
+        self.timeLimits = timeLimits
+        self.fileFormat = fileFormat
+        self.frames, self.temporalPeriod, self.marker = None, None, None
+
+    def snapshotPath(self, marker):
+        key = json.dumps([dataContextVersion, marker, self.platforms, self.timeLimits, self.fileFormat], default=str)
+        return join(self.cacheDir, hashlib.sha1(key.encode()).hexdigest()[:16])
+
+    def load(self):
+        if self.frames is not None:
+            return self
+
+        marker = getChangeMarker(self.db, collectionNames)
+        path = self.snapshotPath(marker)
+        useSnapshots = snapshotsAvailable()
+        if useSnapshots and os.path.exists(join(path, 'meta.json')):
+            logging.info(f'Loading data from snapshot {path}')
+            self.frames, self.temporalPeriod = readSnapshot(path)
+        else:
+            logging.info(f'Loading data from DB')
+            data = getGraphRequirments(self.db['entities'], self.db['locations'], self.db['content'], self.platforms,
+                                       timeLimits=self.timeLimits)
+            self.frames = {
+                'contentDf': pd.DataFrame(data['contentList']).set_index('_id'),
+                'locationDf': pd.DataFrame(data['locationsList']).set_index('_id'),
+                'entityDf': pd.DataFrame(data['entitiesList']).set_index('_id'),
+            }
+            self.temporalPeriod = data['temporalPeriod']
+            if useSnapshots:
+                writeSnapshot(path, self.frames, self.temporalPeriod, marker, self.fileFormat)
+                removeStaleSnapshots(self.cacheDir, marker)
+        self.marker = marker
+        return self
+
+    def refresh(self):
+        '''
+        Checks the DB for changes made since the frames were loaded (by this or another process)
+        '''
+        self.frames = None
+        return self.load()
+
+    def getData(self):
+        '''
+        :return: Dictionary with contentDf, locationDf, entityDf (indexed by _id) and temporalPeriod (list of days)
+        '''
+        self.load()
+        data = {name: df.copy() for name, df in self.frames.items()}
+        data['temporalPeriod'] = list(self.temporalPeriod)
+        return data
+
+
+def getDataContext(db, cacheDir, platforms, timeLimits=None, fileFormat='feather'):
+    '''
+    Same as DataContext(...), but the same arguments get the same context within a process
+    '''
+    key = (db.name, cacheDir, tuple(platforms), tuple(timeLimits) if timeLimits is not None else None, fileFormat)
+    if key not in contexts:
+        contexts[key] = DataContext(db, cacheDir, platforms, timeLimits=timeLimits, fileFormat=fileFormat)
+    return contexts[key]
+
+
+def snapshotsAvailable():
+    '''
+    Snapshots are written with pyarrow - without it, every process builds the frames from the DB
+    '''
+    try:
+        import pyarrow
+        return True
+    except ImportError:
+        logging.warning('pyarrow not installed - data snapshots are disabled')
+        return False
+
+
+def writeSnapshot(path, frames, temporalPeriod, marker, fileFormat='feather'):
+    '''
+    Directory with one {frame}.{feather|parquet} file per frame, plus a meta.json holding the change marker, the temporal
+    period and how each column was encoded. Written next to path and then moved into place.
+    '''
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    tmpPath = f'{path}.tmp'
+    shutil.rmtree(tmpPath, ignore_errors=True)
+    os.makedirs(tmpPath)
+
+    meta = {
+        'version': dataContextVersion,
+        'marker': marker,
+        'fileFormat': fileFormat,
+        'temporalPeriod': [str(temporalPeriod[0]), str(temporalPeriod[-1])] if len(temporalPeriod) > 0 else [],
+        'frames': {},
+    }
+    for name, df in frames.items():
+        table, meta['frames'][name] = encodeFrame(df)
+        if fileFormat == 'parquet':
+            pq.write_table(table, join(tmpPath, f'{name}.parquet'))
+        else:
+            feather.write_feather(table, join(tmpPath, f'{name}.feather'))
+
+    with open(join(tmpPath, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmpPath, path)
+
+
+def readSnapshot(path):
+    '''
+    :return: (Dictionary, frame name: pd.DataFrame, temporal period)
+    '''
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    with open(join(path, 'meta.json')) as f:
+        meta = json.load(f)
+
+    frames = {}
+    for name, frameMeta in meta['frames'].items():
+        if meta['fileFormat'] == 'parquet':
+            table = pq.read_table(join(path, f'{name}.parquet'))
+        else:
+            table = feather.read_table(join(path, f'{name}.feather'))
+        frames[name] = decodeFrame(table, frameMeta)
+
+    temporalPeriod = []
+    if len(meta['temporalPeriod']) > 0:
+        minDay, maxDay = (date.fromisoformat(d) for d in meta['temporalPeriod'])
+        temporalPeriod = [minDay + timedelta(days=x) for x in range((maxDay - minDay).days + 1)]
+    return frames, temporalPeriod
+
+
+def removeStaleSnapshots(cacheDir, marker):
+    '''
+    Deletes the snapshots taken before the data last changed
+    '''
+    for name in os.listdir(cacheDir):
+        try:
+            with open(join(cacheDir, name, 'meta.json')) as f:
+                isStale = json.load(f)['marker'] != marker
+        except Exception as ex:
+            isStale = name.endswith('.tmp')
+        if isStale:
+            logging.info(f'Removing stale snapshot {name}')
+            shutil.rmtree(join(cacheDir, name), ignore_errors=True)
+
+
+def encodeFrame(df):
+    '''
+    :param df: pd.DataFrame
+    :return: (pa.Table, Dictionary describing the index and columns - used by decodeFrame)
+    '''
+    import pyarrow as pa
+
+    df = df.reset_index()
+    arrays, names, columns = [], [], {}
+    for c in df.columns:
+        if df[c].dtype != object:
+            arrays.append(pa.Array.from_pandas(df[c]))
+            names.append(c)
+            columns[c] = {'kind': 'pandas'}
+            continue
+
+        # Documents without the attribute are NaN, the ones holding null are None - both become Arrow nulls
+        values = df[c].tolist()
+        isNaN = [isinstance(v, float) and v != v for v in values]
+        array, columns[c] = encodeValues([None if nan else v for v, nan in zip(values, isNaN)])
+        arrays.append(array)
+        names.append(c)
+        if any(isNaN):
+            columns[c]['missing'] = 'nan' if all(nan or v is not None for v, nan in zip(values, isNaN)) else 'mask'
+            if columns[c]['missing'] == 'mask':
+                arrays.append(pa.array(isNaN))
+                names.append(f'{c}#missing')
+
+    table = pa.Table.from_arrays(arrays, names=[str(c) for c in names])
+    return table, {'index': df.columns[0], 'columns': columns}
+
+
+def decodeFrame(table, frameMeta):
+    data = {}
+    for c, kind in frameMeta['columns'].items():
+        if kind['kind'] == 'pandas':
+            data[c] = table.column(c).to_pandas()
+        else:
+            values = np.fromiter(decodeValues(table.column(c), kind), dtype=object, count=table.num_rows)
+            if kind.get('missing') == 'nan':
+                values[values == None] = np.nan     # noqa: E711 - elementwise comparison
+            elif kind.get('missing') == 'mask':
+                values[table.column(f'{c}#missing').to_numpy()] = np.nan
+            data[c] = values
+    return pd.DataFrame(data, columns=list(frameMeta['columns'].keys())).set_index(frameMeta['index'])
+
+
+def encodeValues(values):
+    '''
+    Turns a list of python objects into an Arrow array: ObjectIds as 12 bytes, lists and dicts as Arrow lists and structs
+    (recursively) and single typed scalars as they are. Anything else is stored as extended JSON.
+    :param values: list, None where missing
+    :return: (pa.Array, Dictionary describing the encoding - used by decodeValues)
+    '''
+    import pyarrow as pa
+
+    types = {type(v) for v in values if v is not None}
+    isNull = pa.array([v is None for v in values], type=pa.bool_())
+    try:
+        if types <= {ObjectId}:
+            return pa.array([v.binary if v is not None else None for v in values], type=pa.binary(12)), {'kind': 'objectId'}
+
+        if types == {list}:
+            offsets = np.zeros(len(values) + 1, dtype=np.int32)
+            offsets[1:] = np.cumsum([len(v) if v is not None else 0 for v in values])
+            items, itemsKind = encodeValues([x for v in values if v is not None for x in v])
+            return pa.ListArray.from_arrays(pa.array(offsets), items, mask=isNull), {'kind': 'list', 'items': itemsKind}
+
+        if types == {dict} and any(len(v) > 0 for v in values if v is not None):
+            # Keys missing from a dict are nulls in its field
+            keys = list(dict.fromkeys(k for v in values if v is not None for k in v.keys()))
+            fields = [encodeValues([v.get(k) if v is not None else None for v in values]) for k in keys]
+            array = pa.StructArray.from_arrays([a for a, _ in fields], names=keys, mask=isNull)
+            return array, {'kind': 'struct', 'fields': {k: fieldKind for k, (_, fieldKind) in zip(keys, fields)}}
+
+        if types in nativeTypes:
+            return pa.array(values), {'kind': 'native'}
+    except (pa.ArrowException, OverflowError, TypeError, ValueError):
+        pass
+
+    return pa.array([json_util.dumps(v) if v is not None else None for v in values], type=pa.string()), {'kind': 'json'}
+
+
+def decodeValues(array, kind):
+    '''
+    :param array: pa.Array or pa.ChunkedArray written by encodeValues
+    :param kind: Dictionary returned by encodeValues
+    :return: list of python objects, None where missing - dicts don't include their null fields
+    '''
+    import pyarrow as pa
+
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+
+    if kind['kind'] == 'objectId':
+        return [ObjectId(v) if v is not None else None for v in toList(array)]
+
+    if kind['kind'] == 'native':
+        return toList(array)
+
+    if kind['kind'] == 'json':
+        return [json_util.loads(v) if v is not None else None for v in toList(array)]
+
+    isNull = array.is_null().to_numpy(zero_copy_only=False).tolist()
+    if kind['kind'] == 'list':
+        items = decodeValues(array.values, kind['items'])
+        offsets = array.offsets.to_numpy()
+        return [items[s:e] if not n else None for n, s, e in zip(isNull, offsets[:-1].tolist(), offsets[1:].tolist())]
+
+    if kind['kind'] == 'struct':
+        keys = list(kind['fields'].keys())
+        fields = [decodeValues(array.field(k), kind['fields'][k]) for k in keys]
+        return [{k: v for k, v in zip(keys, row) if v is not None} if not n else None
+                for n, row in zip(isNull, zip(*fields))]
+
+    raise ValueError(f'Unknown encoding {kind["kind"]}')
+
+
+def toList(array):
+    '''
+    Same as array.to_pylist(), going through numpy - several times faster
+    '''
+    import pyarrow as pa
+
+    if array.null_count == 0 or pa.types.is_string(array.type) or pa.types.is_binary(array.type) or \
+            pa.types.is_fixed_size_binary(array.type):
+        return array.to_numpy(zero_copy_only=False).tolist()
+
+    # Numbers/timestamps with nulls would come out as NaN/NaT
+    values = [None] * len(array)
+    isValid = np.flatnonzero(array.is_valid().to_numpy(zero_copy_only=False))
+    for i, v in zip(isValid.tolist(), array.drop_null().to_numpy(zero_copy_only=False).tolist()):
+        values[i] = v
+    return values
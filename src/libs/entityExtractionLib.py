@@ -0,0 +1,208 @@
+import traceback
+import logging
+import time
+import random
+import re
+import threading
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from libs.customExceptions import ExtractionQuotaExceeded
+from libs.mongoLib import bulkUpdate
+
+
+class TokenBucket():
+    '''
+    Thread safe token bucket - acquire() blocks until a token is available.
+    '''
+
+    def __init__(self, rate, capacity=None):
+        '''
+        :param rate: tokens added per second
+        :param capacity: maximum burst size, defaults to one second worth of tokens
+        '''
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, rate)
+        self.tokens = self.capacity
+        self.lastRefill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.lastRefill) * self.rate)
+                self.lastRefill = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RosetteBackend():
+    name, version = 'rosette', '1'
+
+    def __init__(self, key, genre='social-media'):
+        from rosette.api import API
+        self.client = API(user_key=key)
+        self.genre = genre
+
+    def settings(self):
+        return {'backend': self.name, 'version': self.version, 'genre': self.genre}
+
+    def extract(self, doc):
+        from rosette.api import DocumentParameters, RosetteException
+
+        params = DocumentParameters()
+        params['content'] = doc
+        params['genre'] = self.genre  # Text genre
+
+        try:
+            results = self.client.entities(params)
+        except RosetteException as ex:
+            if ex.status == 'overPlanLimit':
+                raise ExtractionQuotaExceeded
+            raise
+
+        entities = results['entities']
+        if type(entities) is pd.Series:
+            entities = entities.iloc[0]
+        assert(type(entities) is list)
+        return entities
+
+
+class RegexBackend():
+    '''
+    Offline stand-in for the Rosette API, used to run and benchmark the pipeline without API calls.
+    Sequences of capitalized words (plus any gazetteer terms) become entities, returned in Rosette's format.
+    '''
+    name, version = 'regex', '1'
+    pattern = re.compile(r"\b[A-Z][\w'-]*(?:\s+[A-Z][\w'-]*)*")
+
+    def __init__(self, gazetteer=None, latency=0):
+        '''
+        :param gazetteer: Dictionary, mention: (entity type, entity ID)
+        :param latency: seconds slept per call, to simulate a remote API
+        '''
+        self.gazetteer = gazetteer if gazetteer is not None else {}
+        self.latency = latency
+
+    def settings(self):
+        return {'backend': self.name, 'version': self.version, 'gazetteer': sorted(self.gazetteer.items())}
+
+    def extract(self, doc):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        mentions = {}
+        for match in self.pattern.finditer(doc):
+            mentions.setdefault(match.group(0), []).append(match.span())
+        for term in self.gazetteer.keys():
+            for match in re.finditer(re.escape(term), doc):
+                if match.span() not in mentions.get(term, []):
+                    mentions.setdefault(term, []).append(match.span())
+
+        entities = []
+        for it, (mention, spans) in enumerate(mentions.items()):
+            entityType, entityId = self.gazetteer.get(mention, ('UNKNOWN', f'T{it}'))
+            entities.append({
+                'type': entityType,
+                'mention': mention,
+                'normalized': mention,
+                'count': len(spans),
+                'mentionOffsets': [{'startOffset': start, 'endOffset': end} for start, end in spans],
+                'entityId': entityId,
+            })
+        return entities
+
+
+class ExtractionEngine():
+    '''
+    Runs a backend over many documents concurrently, limited to callsPerSecond, retrying failed calls with
+    exponential backoff. Results are handed back in the same order as the documents - None for the documents whose
+    extraction still failed after maxRetries, so they are neither cached nor stored and are extracted again next run.
+    '''
+
+    def __init__(self, backend, maxWorkers=4, callsPerSecond=None, maxRetries=3, backoff=1):
+        self.backend = backend
+        self.maxWorkers = maxWorkers
+        self.bucket = TokenBucket(callsPerSecond) if callsPerSecond is not None else None
+        self.maxRetries = maxRetries
+        self.backoff = backoff
+
+    def extract(self, doc):
+        for attempt in range(self.maxRetries + 1):
+            if self.bucket is not None:
+                self.bucket.acquire()
+
+            try:
+                return self.backend.extract(doc)
+            except ExtractionQuotaExceeded:
+                raise
+            except Exception as ex:
+                if attempt == self.maxRetries:
+                    logging.error(f'> [Error] Extraction failed after {attempt + 1} attempts')
+                    logging.error(traceback.format_exc())
+                    return None
+
+                wait = self.backoff * 2 ** attempt * (1 + random.random())
+                logging.warning(f'Extraction failed ({ex}) - retrying in {wait:.1f}s')
+                time.sleep(wait)
+
+    def extractMany(self, docs):
+        '''
+        :param docs: list of documents
+        :return: generator of entity lists (None if the extraction failed), in the same order as docs
+        '''
+        pool = ThreadPoolExecutor(max_workers=self.maxWorkers)
+        try:
+            for entities in pool.map(self.extract, docs):
+                yield entities
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+class EntityCache():
+    '''
+    Content-addressed cache of the entities extracted from each payload, stored in a Mongo collection.
+    Keys hash the payload text together with the backend settings, so a different backend/genre never reuses results.
+    '''
+
+    def __init__(self, collection, backend, batchSize=10000):
+        self.collection = collection
+        self.settings = json.dumps(backend.settings(), sort_keys=True)
+        self.batchSize = batchSize
+
+    def key(self, payload):
+        return hashlib.sha1(f'{self.settings}\x00{payload}'.encode('utf-8')).hexdigest()
+
+    def split(self, df):
+        '''
+        :param df: pd.DataFrame with columns payload, id
+        :return: (cached payloads - with their entities column, payloads still to extract)
+        '''
+        keys = pd.Series([self.key(p) if not pd.isnull(p) else None for p in df['payload']], index=df.index)
+        uniqueKeys = keys.dropna().unique().tolist()
+
+        cached = {}
+        for i in range(0, len(uniqueKeys), self.batchSize):
+            for r in self.collection.find({'_id': {'$in': uniqueKeys[i:i + self.batchSize]}}):
+                cached[r['_id']] = r['entities']
+
+        isCached = keys.isin(cached.keys())
+        hits = df[isCached].reset_index(drop=True)
+        hits['entities'] = [cached[k] for k in keys[isCached]]
+        misses = df[~isCached].reset_index(drop=True)
+        return hits, misses
+
+    def save(self, docDf):
+        '''
+        :param docDf: pd.DataFrame with columns payload, entities
+        '''
+        updates = ((self.key(p), {'entities': e}) for p, e in zip(docDf['payload'], docDf['entities']) if not pd.isnull(p))
+        bulkUpdate(self.collection, updates, upsert=True)
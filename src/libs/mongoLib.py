@@ -1,7 +1,9 @@
 import traceback
 import logging
+from itertools import islice
 
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
 import pandas as pd
 from pandas.io.json import json_normalize
 
@@ -9,40 +11,99 @@ import libs.pandasLib as pl
 from bson.objectid import ObjectId
 
 
-def getPayloadsDfFromDB(collection, entityExtractionKeys):
+def getPayloadsDfFromDB(collection, entityExtractionKeys, skipExtracted=False):
     '''
     :param collection: collection client
     :param entityExtractionKeys: Dictionary, platform names: array(attributes to access)
-    :return:
+    :param skipExtracted: leave out documents that already have their extractedEntities
+    :return: pd.DataFrame with columns payload, id
     '''
+    dfs = list(iterPayloadsDfFromDB(collection, entityExtractionKeys, skipExtracted=skipExtracted))
+    if len(dfs) == 0:
+        return pd.DataFrame(columns=['payload', 'id'])
+    return pd.concat(dfs, ignore_index=True)
 
-    df = pd.DataFrame(columns=['payload', 'id'])
 
+def iterPayloadsDfFromDB(collection, entityExtractionKeys, skipExtracted=False):
+    '''
+    Yields one payload frame per platform/content type cursor, so consumers can start before the whole scan is done.
+    Only the payload attributes (and _id) are requested from the DB.
+    :param collection: collection client
+    :param entityExtractionKeys: Dictionary, platform names: array(attributes to access)
+    :param skipExtracted: leave out documents that already have their extractedEntities
+    :return: generator of pd.DataFrame with columns payload, id
+    '''
     for platform, dt in entityExtractionKeys.items():
         for contentType, payloadAttrs in dt.items():
             if payloadAttrs is None:
                 continue
 
-            results = collection.find({'$and': [{'platform': platform}, {'type': contentType}]})
+            projection = {att: True for att in payloadAttrs}
+            query = {'platform': platform, 'type': contentType}
+            if skipExtracted is True:
+                query['extractedEntities'] = {'$exists': False}
+            results = collection.find(query, projection)
 
-            # Too slow - probably should creat df from dics and then change as I see fit
+            # Accumulate columns and build the frame in one go
+            ids, payloads = [], []
             for r in results:
                 for att in payloadAttrs:
-                    newDataPoint = {
-                        'id': r['_id'],
-                        'payload': r[att],
-                    }
-                    df = df.append(newDataPoint, ignore_index=True)
-    return df
+                    ids.append(r['_id'])
+                    payloads.append(r.get(att))
+
+            if len(ids) > 0:
+                yield pd.DataFrame({'payload': payloads, 'id': ids}, columns=['payload', 'id'])
 
 
-def getContentDocsPerPlatform(collection, platforms):
+def getContentDocsPerPlatform(collection, platforms, afterId=None):
     '''
     :param collection: collection client
     :param platforms: list of platforms from which content documents are desired
+    :param afterId: if given, only documents with a greater _id (i.e. inserted afterwards) are returned
     :return: generator - if necessary to convert to a list just list(content). Generator better for large results
     '''
-    content = collection.find({'platform': {'$in': platforms}})
+    query = {'platform': {'$in': platforms}}
+    if afterId is not None:
+        query['_id'] = {'$gt': afterId}
+    content = collection.find(query)
+    return content
+
+
+def getContentDocsPerPlatformInRange(collection, platforms, start, end, afterId=None):
+    '''
+    The time window is applied by the DB: only documents with a timestamp in [start, end[ are read (through the
+    platform/timestamp index - see createIndexes), and their timestamp arrays come back holding only the timestamps
+    inside the window.
+    :param collection: collection client
+    :param platforms: list of platforms from which content documents are desired
+    :param start: datetime
+    :param end: datetime (exclusive)
+    :param afterId: if given, only documents with a greater _id (i.e. inserted afterwards) are returned
+    :return: generator
+    '''
+    query = {
+        'platform': {'$in': platforms},
+        'timestamp': {'$elemMatch': {'$gte': start, '$lt': end}},
+    }
+    if afterId is not None:
+        query['_id'] = {'$gt': afterId}
+
+    content = collection.aggregate([
+        {
+            '$match': query
+        },
+        {
+            '$addFields': {
+                'timestamp': {
+                    '$filter': {
+                        'input': '$timestamp',
+                        'as': 't',
+                        'cond': {'$and': [{'$gte': ['$$t', start]}, {'$lt': ['$$t', end]}]},
+                    }
+                }
+            }
+        },
+    ], allowDiskUse=True)
     return content
 
 
@@ -108,30 +169,101 @@ def getMinMaxDay(collection):
     return results['minDate'].date(), results['maxDate'].date()
 
 
-def updateContentDocsWithRawEntities(collection, docDf):
+def getChangeMarker(db, collectionNames):
+    '''
+    Marker of the documents in some collections - the estimated number of documents (collection metadata), the last _id
+    and the last updatedAt, which bulkUpdate sets on every document it writes. Inserts, deletes and updates going
+    through bulkUpdate change it - writes done outside this module don't.
+    Only reads a single document per query - cheap as long as updatedAt is indexed (see createIndexes).
+    :param db: database client
+    :param collectionNames: list of collection names
+    :return: Dictionary, collection name: marker
+    '''
+    markers = {}
+    for name in collectionNames:
+        collection = db[name]
+        last = collection.find_one({}, {'_id': True}, sort=[('_id', -1)])
+        markers[name] = '-'.join(str(it) for it in [collection.estimated_document_count(),
+                                                    last['_id'] if last is not None else None,
+                                                    getLastUpdate(collection)])
+    return markers
+
+
+def getLastUpdate(collection, query=None):
+    '''
+    :param collection: collection client
+    :param query: only look at the documents matching it
+    :return: latest updatedAt in the collection (see bulkUpdate), None if none of its documents was ever updated
+    '''
+    last = collection.find_one(query or {}, {'updatedAt': True}, sort=[('updatedAt', -1)])
+    return last.get('updatedAt') if last is not None else None
+
+
+def createIndexes(db):
+    '''
+    Indexes used by the queries in this module - created once, before the collections are filled (processContent).
+    :param db: database client
+    '''
+    db['content'].create_index([('platform', 1), ('timestamp', 1)])
+    for name in ['content', 'entities', 'locations']:
+        db[name].create_index([('updatedAt', -1)])
+
+
+def bulkUpdate(collection, updates, batchSize=1000, upsert=False):
+    '''
+    Sends unordered UpdateOne operations through bulk_write, batchSize operations at a time.
+    A failing batch is logged and skipped - the remaining batches are still written.
+    Every updated document gets the time of the update in updatedAt (see getChangeMarker).
+    :param collection: collection client
+    :param updates: iterable of (document _id, dictionary of attributes to $set)
+    :param batchSize: number of operations per bulk_write
+    :param upsert: create documents whose _id doesn't exist yet
+    :return: (number of modified documents, number of failed operations)
+    '''
+    operations = (UpdateOne({"_id": k}, {"$set": v, "$currentDate": {"updatedAt": True}}, upsert=upsert) for k, v in updates)
+    modified, failed, batchIt = 0, 0, 0
+
+    while True:
+        batch = list(islice(operations, batchSize))
+        if len(batch) == 0:
+            break
+
+        try:
+            results = collection.bulk_write(batch, ordered=False)
+            modified += results.modified_count
+        except BulkWriteError as ex:
+            errors = ex.details['writeErrors']
+            modified += ex.details['nModified']
+            failed += len(errors)
+            logging.error(f'Batch {batchIt}: {len(errors)} of {len(batch)} updates failed - first error: {errors[0]["errmsg"]}')
+        except Exception as ex:
+            failed += len(batch)
+            logging.error(f'Batch {batchIt}: all {len(batch)} updates failed')
+            logging.error(traceback.format_exc())
+        batchIt += 1
+
+    if failed > 0:
+        logging.warning(f'{failed} updates failed in {collection.name}')
+    return modified, failed
+
+
+def updateContentDocsWithRawEntities(collection, docDf, batchSize=1000):
     '''
     :param collection: collection client
     :param docDf: pd.DataFrame
     '''
-    for index, row in docDf.iterrows():
-        instanceId = row['id']
-        collection.update_one(
-            {"_id": instanceId},
-            {"$set": {"extractedEntities": row['entities']}}
-        )
+    updates = ((instanceId, {"extractedEntities": entities}) for instanceId, entities in zip(docDf['id'], docDf['entities']))
+    return bulkUpdate(collection, updates, batchSize=batchSize)
 
 
-def updateContentDocs(collection, key, contentDocsPayload):
+def updateContentDocs(collection, key, contentDocsPayload, batchSize=1000):
     '''
     :param collection: collection client
-    :param entityInfo: list
-    :param entityIds: list
-    '''
-    for k, v in contentDocsPayload.items():
-        collection.update_one(
-            {"_id": k},
-            {"$set": {key: v}}
-        )
+    :param key: attribute to set in each document
+    :param contentDocsPayload: dictionary, document _id: value
+    '''
+    updates = ((k, {key: v}) for k, v in contentDocsPayload.items())
+    return bulkUpdate(collection, updates, batchSize=batchSize)
 
 
 def saveMany(collection, data):
@@ -11,6 +11,8 @@ from scipy.sparse import csr_matrix
 from multiprocessing import Pool
 import itertools
 
+from libs.compactGraph import CompactGraph
+
 
 def calculateCentrality(G, nodeDf, measurements, saveAsWeGo=True, saveDir=None):
 
@@ -56,13 +58,19 @@ def getOnlyConnectedGraph(g, prints=True):
 def adjacencyBetweenTypes(G,  nodesPerClass, classA, classB):
     '''
 
-    :param G:
+    :param G: nx.Graph or CompactGraph
     :param nodesPerClass:
     :param classA:
     :param classB:
     :return: scipy_sparse_matrix
     '''
     nodesClassA, nodesClassB = nodesPerClass[classA], nodesPerClass[classB]
+    if isinstance(G, CompactGraph):
+        # Sliced straight from the CSR adjacency
+        adjacencyM = G.adjacency()[G.indicesOf(nodesClassA)][:, G.indicesOf(nodesClassB)].astype(np.float64)
+        assert(adjacencyM.shape == (len(nodesClassA), len(nodesClassB)))
+        return adjacencyM
+
     validNodes = nodesClassA + nodesClassB
     adjacencyM = nx.to_scipy_sparse_matrix(G, nodelist=validNodes)
     adjacencyM = adjacencyM[:len(nodesClassA), len(nodesClassA):]
@@ -1,36 +1,36 @@
 import pandas as pd
+import numpy as np
 
 
 def unrollListAttr(df, targetColumn, otherColumns=[], newAttrName='value', indexName='index'):
     '''
-    Transform column containing list values
+    Transform column containing list values - one row per (non null) list element, in the order of df and of each list
     :param df:
     :param targetColumn:
     :param otherColumns:
     :return:
     '''
 
-    # One row per entity extracted, keeping the document id in each
-    auxdf = df[targetColumn].apply(pd.Series, dtype='object').reset_index()
-    auxdf = auxdf.melt(id_vars=indexName)
-    auxdf = auxdf.dropna()[[indexName, 'value']]
-    auxdf = auxdf.set_index(indexName)
+    # One row per list element, indexed by the position of its row in df
+    values = df[targetColumn].reset_index(drop=True).explode()
+    values = values[values.notna()]
+    rows = values.index.to_numpy()
 
     if len(otherColumns) > 0:
-        df = pd.merge(auxdf, df[otherColumns], left_index=True, right_index=True)
-        df.reset_index(inplace=True, drop=True)
+        output = df[otherColumns].iloc[rows].reset_index(drop=True)
+        output.insert(0, newAttrName, values.to_numpy())
     else:
-        df = auxdf
-    df.rename({'value': newAttrName}, axis=1, inplace=True)
+        output = pd.DataFrame({newAttrName: values.to_numpy()}, index=df.index[rows].rename(indexName))
 
-    return df
+    return output
 
 
 def unrollListOfDictsAttr(df, targetColumn, otherColumns=[], newAttrName='value', indexName='index'):
     df = unrollListAttr(df, targetColumn, otherColumns=otherColumns, newAttrName=newAttrName, indexName=indexName)
 
-    # Unpack dictionary
-    k = pd.json_normalize(df[newAttrName].tolist())
-    df = df.join(k)
-    df.drop(newAttrName, axis=1, inplace=True)
-    return df
\ No newline at end of file
+    # Unpack dictionary - one column per key, missing keys left as NaN
+    records = df.pop(newAttrName).tolist()
+    keys = dict.fromkeys(k for r in records for k in r.keys())
+    for k in keys:
+        df[k] = [r.get(k, np.nan) for r in records]
+    return df
@@ -0,0 +1,256 @@
+import os
+import traceback
+import logging
+import time
+import hashlib
+import inspect
+import json
+import threading
+from os.path import exists, isdir, join, dirname
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class Step():
+    '''
+    A pipeline step - function is called with the artifacts named in inputs as keyword arguments, and whatever it returns
+    is stored under outputs (a tuple is expected when there is more than one output).
+    '''
+
+    def __init__(self, name, function, inputs=(), outputs=(), after=(), sources=(), targets=(), resources=()):
+        '''
+        :param name: unique name of the step
+        :param function: callable doing the work
+        :param inputs: list of in-memory artifacts needed by the step
+        :param outputs: list of in-memory artifacts produced by the step
+        :param after: list of steps that have to finish first, without sharing artifacts in memory (e.g. they go through the DB)
+        :param sources: list of files, directories or callables returning a string - the step reruns when any of them changes
+        :param targets: list of files written by the step - the step reruns when any of them is missing
+        :param resources: list of names of shared resources (e.g. pyplot) - steps holding the same one never run together
+        '''
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = list(after)
+        self.sources = list(sources)
+        self.targets = list(targets)
+        self.resources = sorted(resources)
+
+
+class Pipeline():
+    '''
+    Runs a DAG of steps in this process. Artifacts are handed from step to step in memory and steps whose dependencies
+    are done run concurrently in a thread pool.
+    A step is skipped when its key - its code, sources and the keys of the steps it depends on - matches the one saved
+    in statePath by its last successful run. Skipped steps only run if a step that has to run needs their outputs.
+    A run is successful when the function returns without raising and every target exists - functions have to raise
+    on failure instead of just logging it, otherwise the failed step is skipped next time.
+    '''
+
+    def __init__(self, steps, statePath=None, maxWorkers=4):
+        self.steps = {}
+        for step in steps:
+            if step.name in self.steps:
+                raise Exception(f'Duplicated step {step.name}')
+            self.steps[step.name] = step
+
+        self.producers = {o: step.name for step in steps for o in step.outputs}
+        for step in steps:
+            for i in step.inputs:
+                if i not in self.producers:
+                    raise Exception(f'No step produces {i}, needed by {step.name}')
+            for d in step.after:
+                if d not in self.steps:
+                    raise Exception(f'Unknown step {d}, needed by {step.name}')
+        self.checkAcyclic()
+
+        self.statePath = statePath
+        self.maxWorkers = maxWorkers
+        self.locks = {r: threading.Lock() for step in steps for r in step.resources}
+
+    def dependencies(self, step):
+        return sorted(set([self.producers[i] for i in step.inputs] + step.after))
+
+    def checkAcyclic(self):
+        remaining = {name: set(self.dependencies(step)) for name, step in self.steps.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps & remaining.keys()]
+            if not ready:
+                raise Exception(f'Pipeline has a cycle between {sorted(remaining.keys())}')
+            for name in ready:
+                del remaining[name]
+
+    def select(self, names):
+        '''
+        :param names: list of step names
+        :return: Pipeline with only those steps and the ones they depend on
+        '''
+        selected, toVisit = set(), list(names)
+        while toVisit:
+            name = toVisit.pop()
+            if name not in selected:
+                selected.add(name)
+                toVisit.extend(self.dependencies(self.steps[name]))
+
+        # Ordering constraints with steps left out are dropped
+        steps = []
+        for name, step in self.steps.items():
+            if name in selected:
+                subset = Step(step.name, step.function, step.inputs, step.outputs, [d for d in step.after if d in selected],
+                              step.sources, step.targets, step.resources)
+                steps.append(subset)
+
+        return Pipeline(steps, self.statePath, self.maxWorkers)
+
+    def key(self, step, keys):
+        h = hashlib.sha1(codeFingerprint(step.function).encode('utf-8'))
+        for source in step.sources:
+            h.update(fingerprint(source).encode('utf-8'))
+        for d in self.dependencies(step):
+            h.update(f'{d}:{keys[d]}'.encode('utf-8'))
+        return h.hexdigest()
+
+    def loadState(self):
+        if self.statePath is None or not exists(self.statePath):
+            return {}
+        with open(self.statePath, 'r') as f:
+            return json.load(f)
+
+    def saveState(self, state):
+        if self.statePath is None:
+            return
+        os.makedirs(dirname(self.statePath) or '.', exist_ok=True)
+        with open(self.statePath + '.tmp', 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(self.statePath + '.tmp', self.statePath)
+
+    def runStep(self, step, artifacts):
+        locks = [self.locks[r] for r in step.resources]
+        for lock in locks:
+            lock.acquire()
+        try:
+            logging.info(f'>>>>>>>>>>>>>>>>>> CURRENTLY RUNNING {step.name} <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
+            start = time.time()
+            result = step.function(**{i: artifacts[i] for i in step.inputs})
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+        # Steps only count as done when they wrote everything they are expected to
+        missing = [t for t in step.targets if not exists(t)]
+        if missing:
+            raise Exception(f'{step.name} did not write {missing}')
+
+        if len(step.outputs) == 1:
+            artifacts[step.outputs[0]] = result
+        elif len(step.outputs) > 1:
+            artifacts.update(zip(step.outputs, result))
+        logging.info(f'{step.name} finished in {time.time() - start:.1f}s')
+
+    def schedule(self, status, keys, previous, force):
+        '''
+        Goes once over the steps still waiting, deciding which ones are skipped and which ones can start.
+        :return: (list of steps to start, True if any status changed)
+        '''
+        toStart, changed = [], False
+        for name, step in self.steps.items():
+            if status[name] not in ('waiting', 'forced'):
+                continue
+
+            deps = self.dependencies(step)
+            if any(status[d] in ('failed', 'cancelled') for d in deps):
+                logging.warning(f'Not running {name} - a step it depends on failed')
+                status[name], changed = 'cancelled', True
+                continue
+            if any(status[d] in ('waiting', 'forced', 'running') for d in deps):
+                continue
+
+            if status[name] == 'waiting':
+                keys[name] = self.key(step, keys)
+                if not force and previous.get(name) == keys[name] and all(exists(t) for t in step.targets):
+                    logging.info(f'Skipping {name} - inputs unchanged')
+                    status[name], changed = 'skipped', True
+                    continue
+
+            # Skipped steps did not put their outputs in memory, so they have to run after all
+            stale = sorted({self.producers[i] for i in step.inputs if status[self.producers[i]] == 'skipped'})
+            if stale:
+                for d in stale:
+                    status[d] = 'forced'
+                changed = True
+                continue
+
+            status[name], changed = 'running', True
+            toStart.append(step)
+
+        return toStart, changed
+
+    def run(self, artifacts=None, force=False):
+        '''
+        :param artifacts: dictionary of artifacts available from the start
+        :param force: run every step, even if its inputs are unchanged
+        :return: dictionary with every artifact produced
+        '''
+        artifacts = dict(artifacts) if artifacts is not None else {}
+        previous = self.loadState()
+        status = {name: 'waiting' for name in self.steps.keys()}
+        keys, running = {}, {}
+
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as pool:
+            while True:
+                changed = True
+                while changed:
+                    toStart, changed = self.schedule(status, keys, previous, force)
+                    for step in toStart:
+                        running[pool.submit(self.runStep, step, artifacts)] = step.name
+
+                if not running:
+                    break
+
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                        status[name] = 'done'
+                        previous[name] = keys[name]
+                        self.saveState(previous)
+                    except Exception as ex:
+                        print(traceback.format_exc())
+                        status[name] = 'failed'
+
+        for s in ('done', 'skipped', 'failed', 'cancelled'):
+            names = [name for name, st in status.items() if st == s]
+            if names:
+                logging.info(f'{s.capitalize()}: {names}')
+
+        return artifacts
+
+
+def codeFingerprint(function):
+    try:
+        return inspect.getsource(function)
+    except (OSError, TypeError):
+        return getattr(function, '__qualname__', type(function).__name__)
+
+
+def fingerprint(source):
+    '''
+    :param source: file or directory path (size and modification time of each file), or callable returning a string
+    '''
+    if callable(source):
+        return str(source())
+    if not exists(source):
+        return f'{source}:missing'
+    if not isdir(source):
+        stat = os.stat(source)
+        return f'{source}:{stat.st_size}:{stat.st_mtime_ns}'
+
+    files = []
+    for root, dirs, fileNames in os.walk(source):
+        dirs.sort()
+        for fileName in sorted(fileNames):
+            path = join(root, fileName)
+            stat = os.stat(path)
+            files.append(f'{path}:{stat.st_size}:{stat.st_mtime_ns}')
+    return '\n'.join(files)
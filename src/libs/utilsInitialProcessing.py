@@ -1,7 +1,9 @@
 import logging
+from itertools import islice
 
 import pandas as pd
 import tldextract
+import ijson
 
 from libs.customExceptions import NoMatch, UnexpectedFBComment, Ignore, UnexpectedFBPost, NothingToDo
 
@@ -14,6 +16,28 @@ def dropByPercentageJSON(data, percentage):
     return data, droppedData
 
 
+def dropByPercentageStream(records, percentage):
+    # Length is unknown beforehand, so keep an evenly spread (1-percentage) of the records instead of the first ones
+    assert(percentage>=0 and percentage<=1)
+    kept = 0
+    for it, record in enumerate(records):
+        if kept < (1-percentage)*(it+1):
+            kept += 1
+            yield record
+
+
+def loadJSONStream(path, prefix='item'):
+    '''
+    Incrementally parse a JSON file, yielding one object at a time.
+    :param path: JSON file path
+    :param prefix: ijson prefix of the objects to yield - 'item' for a top level list, '<key>.item' for a list under <key>
+    :return: generator
+    '''
+    with open(path, 'rb') as f:
+        for record in ijson.items(f, prefix, use_float=True):
+            yield record
+
+
 def dropByPercentageDF(df, percentage):
     stopIndex = int(df.shape[0] * (1-percentage))
     droppedDf = df.iloc[stopIndex:, :]
@@ -29,6 +53,15 @@ def loop(data):
         yield iterator, currentItem
 
 
+def batchIterator(iterable, batchSize):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batchSize))
+        if len(batch) == 0:
+            return
+        yield batch
+
+
 def fromDictToDf(data):
     dataIterator = loop(data)
     df = None
@@ -126,7 +159,6 @@ def extractContextFromFbSelfPosts(text):
                 return 'Posted', 'Post', text3.strip(), [friend.title().strip()]
 
             elif action == 'created a poll':
-                breakpoint()
                 return action.capitalize().strip(), 'Poll', text3.strip(), []
 
             elif action == 'updated' or action == 'was with':